@@ -0,0 +1,365 @@
+"""
+Benchmark suite of the calculation hot paths.
+
+Times
+    - materials.delta_beta (the look up is replaced by a local delta/beta
+      table, i.e. without nist_lookup and network access; uncached and
+      cached)
+    - geometry.Geometry construction for 'conv', 'sym' and 'inv' with
+      parallel and cone beam (invalid combinations are reported as skipped)
+    - interferometer.detector.Detector.detect on [x, y, energies] cubes
+    - check_input._get_spectrum on every file in data/spectra (parsing and
+      cached)
+    - debug logging of a spectrum sized array with DEBUG disabled, eager
+      str.format compared to utilities.get_logger (lazy formatting)
+
+Results are written as JSON and can be compared to a baseline (a previous
+results file), to detect regressions.
+
+Usage
+=====
+
+From gisimulation folder:
+
+python benchmarks/hot_paths.py [-r REPEATS] [-k PATTERN] [-o OUTPUT]
+                               [-b BASELINE] [--tolerance TOLERANCE]
+
+With -b, the script exits with 1 if any benchmark is slower than the baseline
+by more than TOLERANCE (relative, default 0.2 = 20%).
+
+Format
+======
+
+{"info": {"python": ..., "numpy": ..., "platform": ..., "time": ...},
+ "benchmarks": {name: {"median_ms": ..., "min_ms": ..., "repeats": ...} or
+                      {"skipped": reason}}}
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import re
+import sys
+import json
+import time
+import timeit
+import logging
+import platform
+import argparse
+GISIMULATION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GISIMULATION_DIR)
+import numpy as np
+import simulation.parser_def as parser_def
+import simulation.check_input as check_input
+import simulation.geometry as geometry
+import simulation.materials as materials
+import simulation.file_cache as file_cache
+import simulation.utilities as utilities
+import interferometer.detector as detector
+
+SPECTRA_DIR = os.path.join(GISIMULATION_DIR, 'data', 'spectra')
+# Local table, replaces the look up: [delta, beta] at 30 keV, rho [g/cm3]
+DELTA_BETA_30KEV = {'Au': [3.54e-6, 1.71e-7, 19.3],
+                    'Si': [5.38e-7, 1.14e-9, 2.33],
+                    'Ni': [1.87e-6, 2.70e-8, 8.9],
+                    'CsI': [1.02e-6, 9.29e-9, 4.51]}
+ENERGIES = np.arange(10, 101, dtype=float)  # [keV]
+GEOMETRY_ARGUMENTS = ['-e', '35', '-t', '1', '-fov', '200', '200',
+                      '-pxs', '50', '-fg', 'g1', '-p1', '2', '-dc1', '0.5',
+                      '-g1', 'phase', '-g2', 'abs', '-g2d', '100']
+PARALLEL_ARGUMENTS = ['-sg1', '1000']
+CONE_ARGUMENTS = {'conv': ['-sg1', '1000', '-g1g2', '100', '-fd',
+                           'distance_source_g1'],
+                  'sym': ['-g0', 'abs', '-g0g2', '1000', '-fd',
+                          'distance_g0_g2'],
+                  'inv': ['-g0', 'abs', '-g0g2', '1000', '-fd',
+                          'distance_g0_g2']}
+DETECTOR_CUBES = [[100, 100, 20], [200, 200, 50]]
+LOGGED_ARRAY_SIZE = 10000
+LOGGED_MESSAGES = 100
+
+# %% Functions
+
+
+def measure(function, repeats, setup=None):
+    """
+    Time function.
+
+    Parameters
+    ==========
+
+    function:           function()
+    repeats [int]
+    setup:              function(), called before every repetition (not
+                        timed), default is None
+
+    Returns
+    =======
+
+    timing [dict]:      'median_ms', 'min_ms', 'repeats'
+
+    """
+    durations = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        function()
+        durations.append((timeit.default_timer() - start) * 1e3)
+    durations.sort()
+    return dict(median_ms=durations[len(durations)//2], min_ms=durations[0],
+                repeats=repeats)
+
+
+def selected(name, pattern):
+    """
+    True if benchmark name matches regex pattern (all if pattern is None).
+    """
+    return pattern is None or re.search(pattern, name) is not None
+
+
+def delta_beta_table(material, energy, rho=0, photo_only=False):
+    """
+    Replaces materials.delta_beta_nist: DELTA_BETA_30KEV scaled with energy
+    (delta ~ E^-2, beta ~ E^-4, i.e. away from absorption edges).
+    """
+    [delta, beta, table_rho] = DELTA_BETA_30KEV[material]
+    energy = np.array(energy)
+    return delta*(30/energy)**2, beta*(30/energy)**4, rho or table_rho
+
+
+def benchmark_materials(repeats, pattern=None):
+    """
+    delta_beta (cache layer) for all energies, per material, with a local
+    table as look up (see delta_beta_table).
+    """
+    delta_beta_nist = materials.delta_beta_nist
+    materials.delta_beta_nist = delta_beta_table
+    benchmarks = dict()
+    try:
+        for material in sorted(DELTA_BETA_30KEV):
+            name = 'delta_beta_{0}'.format(material)
+            if selected(name, pattern):
+                benchmarks[name] = \
+                    measure(lambda: materials.delta_beta(material, ENERGIES),
+                            repeats, setup=materials._DELTA_BETA.clear)
+            if selected(name + '_cached', pattern):
+                materials.delta_beta(material, ENERGIES)
+                benchmarks[name + '_cached'] = \
+                    measure(lambda: materials.delta_beta(material, ENERGIES),
+                            repeats)
+    finally:
+        materials.delta_beta_nist = delta_beta_nist
+        materials._DELTA_BETA.clear()
+    return benchmarks
+
+
+def geometry_parameters(gi_geometry, beam_geometry):
+    """
+    Parsed and checked parameters of a representative setup.
+    """
+    parser = parser_def.input_parser(float)
+    parser_info = parser_def.get_arguments_info(parser)
+    arguments = GEOMETRY_ARGUMENTS + ['-gi', gi_geometry,
+                                      '-bg', beam_geometry]
+    if beam_geometry == 'cone':
+        arguments += CONE_ARGUMENTS[gi_geometry]
+    else:
+        arguments += PARALLEL_ARGUMENTS
+    parameters = vars(parser.parse_args(arguments))
+    check_input.geometry_input(parameters, parser_info)
+    return parameters
+
+
+def benchmark_geometry(repeats, pattern=None):
+    """
+    Geometry construction for all GI and beam geometries.
+    """
+    benchmarks = dict()
+    for gi_geometry in ['conv', 'sym', 'inv']:
+        for beam_geometry in ['parallel', 'cone']:
+            name = 'geometry_{0}_{1}'.format(gi_geometry, beam_geometry)
+            if not selected(name, pattern):
+                continue
+            try:
+                parameters = geometry_parameters(gi_geometry, beam_geometry)
+                geometry.Geometry(parameters)
+            except (check_input.InputError, geometry.GeometryError) as e:
+                benchmarks[name] = dict(skipped=str(e))
+                continue
+            benchmarks[name] = \
+                measure(lambda: geometry.Geometry(parameters), repeats)
+    return benchmarks
+
+
+def benchmark_detector(repeats, pattern=None):
+    """
+    Detector.detect on [x, y, energies] cubes, photon counting and
+    conventional (PSF) detector.
+    """
+    benchmarks = dict()
+    random_state = np.random.RandomState(0)
+    for shape in DETECTOR_CUBES:
+        image = random_state.rand(*shape)
+        energies = np.linspace(20, 60, shape[2])
+        for detector_type in ['photon', 'conv']:
+            name = 'detect_{0}_{1}'.format(detector_type,
+                                           'x'.join(str(size)
+                                                    for size in shape))
+            if not selected(name, pattern):
+                continue
+            detector_ = detector.Detector(detector_type, 250., 50.,
+                                          np.array(shape[:2]), None, None,
+                                          None, energies, 'nist', False, 1.)
+            # Representative efficiency, instead of material look up
+            detector_.efficiency = np.linspace(0.9, 0.5, shape[2])
+            benchmarks[name] = measure(lambda: detector_.detect(image),
+                                       repeats)
+    return benchmarks
+
+
+def benchmark_spectra(repeats, pattern=None):
+    """
+    _get_spectrum of all spectrum files, parsing (cache removed) and cached.
+    """
+    benchmarks = dict()
+    for file_name in sorted(os.listdir(SPECTRA_DIR)):
+        if not file_name.endswith('.csv'):
+            continue
+        file_path = os.path.join(SPECTRA_DIR, file_name)
+        name = 'spectrum_{0}'.format(os.path.splitext(file_name)[0])
+
+        def remove_cache():
+            # Next to the file, or in the user cache if data is read-only
+            for path in (file_cache.cache_paths(file_path) +
+                         file_cache.cache_paths(file_path, local=False)):
+                if os.path.isfile(path):
+                    os.remove(path)
+        if selected(name, pattern):
+            benchmarks[name] = \
+                measure(lambda: check_input._get_spectrum(file_path, None, 1,
+                                                          35),
+                        repeats, setup=remove_cache)
+        if selected(name + '_cached', pattern):
+            check_input._get_spectrum(file_path, None, 1, 35)
+            benchmarks[name + '_cached'] = \
+                measure(lambda: check_input._get_spectrum(file_path, None, 1,
+                                                          35),
+                        repeats)
+    return benchmarks
+
+
+def benchmark_logging(repeats, pattern=None):
+    """
+    LOGGED_MESSAGES debug messages of an array, with DEBUG disabled.
+    """
+    logger = logging.getLogger('benchmarks.hot_paths')
+    lazy_logger = utilities.get_logger('benchmarks.hot_paths')
+    spectrum = np.linspace(0, 1, LOGGED_ARRAY_SIZE)
+
+    def log_eager():
+        for _ in range(LOGGED_MESSAGES):
+            logger.debug("Spectrum is:\n{0}".format(spectrum))
+
+    def log_lazy():
+        for _ in range(LOGGED_MESSAGES):
+            lazy_logger.debug("Spectrum is:\n{0}", spectrum)
+    benchmarks = dict()
+    if selected('debug_log_eager', pattern):
+        benchmarks['debug_log_eager'] = measure(log_eager, repeats)
+    if selected('debug_log_lazy', pattern):
+        benchmarks['debug_log_lazy'] = measure(log_lazy, repeats)
+    return benchmarks
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare median times to baseline.
+
+    Parameters
+    ==========
+
+    results [dict]:         results['benchmarks']
+    baseline [dict]:        baseline['benchmarks']
+    tolerance [float]:      relative
+
+    Returns
+    =======
+
+    regressions [list]:     names of benchmarks slower than tolerance
+
+    """
+    regressions = []
+    for name in sorted(results):
+        if 'median_ms' not in results[name] or \
+                'median_ms' not in baseline.get(name, {}):
+            continue
+        ratio = results[name]['median_ms'] / baseline[name]['median_ms']
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print("{0:<40} {1:>10.3f} ms  (baseline {2:>10.3f} ms, x{3:.2f}){4}"
+              .format(name, results[name]['median_ms'],
+                      baseline[name]['median_ms'], ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of calculation "
+                                     "hot paths.")
+    parser.add_argument('-r', dest='repeats', type=int, default=10,
+                        help="Number of repetitions per benchmark.")
+    parser.add_argument('-k', dest='pattern',
+                        help="Only run benchmarks matching regex.")
+    parser.add_argument('-o', dest='output',
+                        help="Write results to JSON file.")
+    parser.add_argument('-b', dest='baseline',
+                        help="Compare to results JSON file.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed relative slowdown compared to "
+                        "baseline.")
+    arguments = parser.parse_args(argv)
+    # Errors of invalid setups are reported as skipped
+    logging.basicConfig(level=logging.CRITICAL)
+
+    benchmarks = dict()
+    for benchmark in [benchmark_materials, benchmark_geometry,
+                      benchmark_detector, benchmark_spectra,
+                      benchmark_logging]:
+        benchmarks.update(benchmark(arguments.repeats, arguments.pattern))
+
+    for name in sorted(benchmarks):
+        if 'skipped' in benchmarks[name]:
+            print("{0:<40} skipped: {1}".format(name,
+                                                benchmarks[name]['skipped']))
+        else:
+            print("{0:<40} {1:>10.3f} ms (min {2:.3f} ms)"
+                  .format(name, benchmarks[name]['median_ms'],
+                          benchmarks[name]['min_ms']))
+
+    results = dict(info=dict(python=platform.python_version(),
+                             numpy=np.__version__,
+                             platform=platform.platform(),
+                             time=time.strftime('%Y-%m-%d %H:%M:%S')),
+                   benchmarks=benchmarks)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print("\nResults written to {0}.".format(arguments.output))
+
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as f:
+            baseline = json.load(f)
+        print("\nComparison to {0}:".format(arguments.baseline))
+        regressions = compare(benchmarks, baseline['benchmarks'],
+                              arguments.tolerance)
+        if regressions:
+            print("{0} benchmarks slower than baseline by more than "
+                  "{1:.0f}%.".format(len(regressions),
+                                     arguments.tolerance*100))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
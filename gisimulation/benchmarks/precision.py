@@ -0,0 +1,183 @@
+"""
+Validation of single precision (float32/complex64) against double precision
+(float64/complex128) on reference designs.
+
+For every design, the geometry is calculated (simulation.geometry), then a
+plane wave is propagated through sample and G1 to G2
+(interferometer.propagation) for a band of energies, G2 is stepped over one
+period, the stepping curves are detected (interferometer.detector) and
+transmission, differential phase and dark field are retrieved
+(simulation.retrieval). Both precisions are compared and the errors are
+bounded by TOLERANCES.
+
+Usage
+=====
+
+From gisimulation folder:
+
+python benchmarks/precision.py [-r REPEATS]
+
+The script exits with 1 if any error exceeds its tolerance.
+
+Errors
+======
+
+intensity:              max. |single - double| / max(double) at G2
+visibility:             max. |single - double| of the reference
+transmission:           max. |single - double|
+differential_phase:     max. |single - double| [rad]
+dark_field:             max. |single - double|
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import sys
+import timeit
+import logging
+import argparse
+GISIMULATION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GISIMULATION_DIR)
+import numpy as np
+import simulation.parser_def as parser_def
+import simulation.check_input as check_input
+import simulation.geometry as geometry
+import simulation.materials as materials
+import simulation.retrieval as retrieval
+import simulation.utilities as utilities
+import interferometer.propagation as propagation
+import interferometer.detector as detector
+
+# Conventional, parallel beam, G1 phase shift pi and pi/2, Talbot order
+DESIGNS = {'conv_pi_25kev_t1': ['-e', '25', '-s1', 'pi', '-t', '1'],
+           'conv_pi_60kev_t3': ['-e', '60', '-s1', 'pi', '-t', '3'],
+           'conv_pi2_40kev_t1': ['-e', '40', '-s1', 'pi/2', '-t', '1']}
+GEOMETRY_ARGUMENTS = ['-gi', 'conv', '-bg', 'parallel',
+                      '-fov', '200', '200', '-pxs', '50', '-fg', 'g1',
+                      '-p1', '4', '-dc1', '0.5', '-g1', 'phase',
+                      '-g2', 'abs', '-g2d', '100', '-sg1', '1000']
+SAMPLES_PER_PITCH = 256  # Sampling of G1 pitch
+NUMBER_PERIODS = 64  # G1 periods in field
+PIXEL_PERIODS = 4  # G1 periods per pixel
+NUMBER_STEPS = 8
+ENERGY_BAND = 0.2  # Relative, +/- around design energy
+NUMBER_ENERGIES = 9
+SAMPLE_PHASE = 2.0  # [rad] at design energy, amplitude of sinusoidal phase
+SAMPLE_TRANSMISSION = 0.8
+TOLERANCES = {'intensity': 1e-5, 'visibility': 1e-5, 'transmission': 1e-5,
+              'differential_phase': 1e-4, 'dark_field': 1e-5}
+
+# %% Functions
+
+
+def design_geometry(arguments):
+    """
+    Pitches, duty cycle and distances of design.
+    """
+    parser = parser_def.input_parser(float)
+    parser_info = parser_def.get_arguments_info(parser)
+    parameters = vars(parser.parse_args(GEOMETRY_ARGUMENTS + arguments))
+    check_input.geometry_input(parameters, parser_info)
+    return [parameters, geometry.Geometry(parameters).results]
+
+
+def simulate(parameters, results, precision):
+    """
+    Intensity at G2, reference and sample stepping curves, retrieved values.
+    """
+    [real_type, _] = utilities.get_dtypes(precision)
+    pitch_g1 = results['pitch_g1']
+    pitch_g2 = results['pitch_g2']
+    sampling = pitch_g1 / SAMPLES_PER_PITCH  # [um]
+    x = np.arange(NUMBER_PERIODS*SAMPLES_PER_PITCH) * sampling
+    energies = parameters['design_energy'] * \
+        np.linspace(1-ENERGY_BAND, 1+ENERGY_BAND, NUMBER_ENERGIES)
+    wavelengths = materials.energy_to_wavelength(energies)  # [um]
+    # Phase shift scales with 1/E
+    phase_shift = parameters['phase_shift_g1'] * \
+        parameters['design_energy'] / energies
+    g1 = propagation.grating_wavefield(x, pitch_g1, results['duty_cycle_g1'],
+                                       phase_shift, precision=precision)
+    sample_phase = SAMPLE_PHASE * parameters['design_energy'] / energies * \
+        np.sin(2*np.pi*x/x[-1])[:, np.newaxis]
+    sample = (np.sqrt(SAMPLE_TRANSMISSION) *
+              np.exp(-1j*sample_phase)).astype(g1.dtype)
+
+    detector_ = detector.Detector('photon', None, sampling*PIXEL_PERIODS *
+                                  SAMPLES_PER_PITCH, None, None, None, None,
+                                  energies, 'nist', False, sampling,
+                                  precision=precision)
+    g2 = np.mod(x, pitch_g2) >= results['duty_cycle_g2']*pitch_g2
+    step_samples = int(round(pitch_g2 / sampling / NUMBER_STEPS))
+    curves = dict()
+    distance = results['distance_g1_g2'] * 1e3  # [um]
+    for name, wavefield in [['reference', g1], ['sample', sample*g1]]:
+        at_g2 = propagation.propagate(wavefield, distance, wavelengths,
+                                      sampling, precision)
+        intensity = propagation.intensity(at_g2).mean(axis=1)
+        if name == 'reference':
+            intensity_g2 = intensity
+        stepped = np.array([intensity * np.roll(g2, step*step_samples)
+                            for step in range(NUMBER_STEPS)], dtype=real_type)
+        # [pixels, 1, steps]
+        pixels = stepped.reshape(NUMBER_STEPS, -1,
+                                 PIXEL_PERIODS*SAMPLES_PER_PITCH).sum(axis=2)
+        curves[name] = detector_.detect(pixels.T[:, np.newaxis, :])[:, 0, :]
+    visibility = retrieval.phase_stepping(curves['reference'], precision)[2]
+    [transmission, differential_phase, dark_field] = \
+        retrieval.retrieve(curves['sample'], curves['reference'], precision)
+    return dict(intensity=intensity_g2, visibility=visibility,
+                transmission=transmission,
+                differential_phase=differential_phase, dark_field=dark_field)
+
+
+def errors(single, double):
+    """
+    Errors of single compared to double precision results.
+    """
+    errors_ = dict()
+    for name in TOLERANCES:
+        difference = np.abs(single[name].astype(np.float64) - double[name])
+        if name == 'intensity':
+            difference /= np.abs(double[name]).max()
+        errors_[name] = float(difference.max())
+    return errors_
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validation of single "
+                                     "against double precision.")
+    parser.add_argument('-r', dest='repeats', type=int, default=3,
+                        help="Number of repetitions for timing.")
+    arguments = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    failed = []
+    for design in sorted(DESIGNS):
+        [parameters, results] = design_geometry(DESIGNS[design])
+        simulated = dict()
+        durations = dict()
+        for precision in ['double', 'single']:
+            durations[precision] = min(timeit.repeat(
+                lambda: simulated.__setitem__(precision,
+                                              simulate(parameters, results,
+                                                       precision)),
+                number=1, repeat=arguments.repeats)) * 1e3
+        print("{0}: distance G1-G2 {1:.1f} mm, double {2:.1f} ms, single "
+              "{3:.1f} ms".format(design, results['distance_g1_g2'],
+                                  durations['double'], durations['single']))
+        for name, error in sorted(errors(simulated['single'],
+                                         simulated['double']).items()):
+            flag = ''
+            if not error <= TOLERANCES[name]:
+                failed.append([design, name])
+                flag = '  EXCEEDED'
+            print("    {0:<20} {1:>10.2e} (tolerance {2:.0e}){3}"
+                  .format(name, error, TOLERANCES[name], flag))
+    if failed:
+        print("{0} errors exceed their tolerance.".format(len(failed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
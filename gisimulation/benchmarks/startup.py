@@ -0,0 +1,117 @@
+"""
+Startup benchmark of the command line interface.
+
+Measures the import time of the gisimulation modules with
+'python -X importtime' (python >= 3.7) and the wall time of 'main.py -h'.
+With a python without '-X importtime' (e.g. python 2.7), only wall times are
+measured.
+
+Usage
+=====
+
+python benchmarks/startup.py [-p PYTHON] [-r REPEATS] [-n TOP]
+                             [--max-ms MAX_MS]
+
+With --max-ms, the script exits with 1 if the median 'main.py -h' wall time
+exceeds MAX_MS, to track startup time regressions.
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+GISIMULATION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['main', 'simulation.check_input', 'simulation.materials',
+           'interferometer.detector']
+
+# %% Functions
+
+
+def import_times(python, module):
+    """
+    Import times of all modules imported by importing module.
+
+    Parameters
+    ==========
+
+    python [str]:   python executable
+    module [str]
+
+    Returns
+    =======
+
+    import_times [list]:    [[module, self_us, cumulative_us], ...], None if
+                            '-X importtime' is not supported
+
+    """
+    process = subprocess.Popen([python, '-X', 'importtime', '-c',
+                                'import ' + module],
+                               cwd=GISIMULATION_DIR,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = process.communicate()[1].decode('utf-8', 'replace')
+    times = []
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        [self_us, cumulative_us, name] = line[len('import time:'):].split('|')
+        times.append([name.strip(), int(self_us), int(cumulative_us)])
+    if not times:
+        return None
+    return times
+
+
+def wall_time(python, arguments, repeats):
+    """
+    Median wall time [ms] of running python with arguments.
+    """
+    durations = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeats):
+            start = time.time()
+            subprocess.call([python] + arguments, cwd=GISIMULATION_DIR,
+                            stdout=devnull, stderr=devnull)
+            durations.append((time.time() - start) * 1e3)
+    return sorted(durations)[len(durations)//2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup benchmark.")
+    parser.add_argument('-p', dest='python', default=sys.executable,
+                        help="Python executable to benchmark.")
+    parser.add_argument('-r', dest='repeats', type=int, default=5,
+                        help="Number of repetitions for wall time.")
+    parser.add_argument('-n', dest='top', type=int, default=10,
+                        help="Number of slowest imports to list.")
+    parser.add_argument('--max-ms', dest='max_ms', type=float,
+                        help="Fail if 'main.py -h' takes longer [ms].")
+    arguments = parser.parse_args(argv)
+
+    print("Python: {0}".format(arguments.python))
+    for module in MODULES:
+        times = import_times(arguments.python, module)
+        if times is None:
+            print("'-X importtime' not supported, skipping import times.")
+            break
+        total_ms = sum(self_us for [_, self_us, _] in times) / 1e3
+        print("\nimport {0}: {1:.1f} ms total".format(module, total_ms))
+        slowest = sorted(times, key=lambda entry: entry[1], reverse=True)
+        for [name, self_us, cumulative_us] in slowest[:arguments.top]:
+            print("    {0:>9.1f} ms self {1:>9.1f} ms cumulative  {2}"
+                  .format(self_us/1e3, cumulative_us/1e3, name))
+
+    help_ms = wall_time(arguments.python, ['main.py', '-h'],
+                        arguments.repeats)
+    print("\nmain.py -h: {0:.1f} ms (median of {1})"
+          .format(help_ms, arguments.repeats))
+    if arguments.max_ms is not None and help_ms > arguments.max_ms:
+        print("Startup time exceeds {0:.1f} ms.".format(arguments.max_ms))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,11 +4,13 @@ X-ray detector for grating interferometer simulation.
 @author: buechner_m <maria.buechner@gmail.com>
 """
 import sys
+import numpy as np
 sys.path.append('..')  # To allow importing from neighbouring folder
 import simulation.materials as materials
-from scipy.ndimage.filters import gaussian_filter
+import simulation.utilities as utilities
+import simulation.timing as timing
 import logging
-logger = logging.getLogger(__name__)
+logger = utilities.get_logger(__name__)
 
 
 class Detector():
@@ -18,10 +20,12 @@ class Detector():
                  field_of_view, detector_threshold,
                  material_detector, thickness_detector,
                  spectrum, look_up_table, photo_only,
-                 sampling_rate):
+                 sampling_rate, precision=None):
         """
         """
         self.type = detector_type
+        # Images are detected in the real dtype of precision
+        [self.dtype, _] = utilities.get_dtypes(precision)
         if self.type == 'conv':
             self.point_spread_function = point_spread_function
         self.pixel_size = pixel_size
@@ -40,9 +44,9 @@ class Detector():
                                                source=look_up_table)
         else:
             self.efficiency = 1
-        logger.debug("Detector efficiency is: {0}%"
-                     .format(self.efficiency*100))
+        logger.debug("Detector efficiency is: {0}%", self.efficiency*100)
 
+    @timing.timed('detection')
     def detect(self, image):
         """
 
@@ -51,6 +55,11 @@ class Detector():
 
         image [x, y, energies]
 
+        Returns
+        =======
+
+        image [x, y, energies]:     self.dtype
+
         Notes
         =====
 
@@ -60,7 +69,8 @@ class Detector():
 
         """
         # Account for detector efficiency
-        image = image * self.efficiency
+        image = np.asarray(image, dtype=self.dtype) * \
+            np.asarray(self.efficiency, dtype=self.dtype)
 
         # Account for PFS
         if self.type == 'conv':
@@ -69,6 +79,7 @@ class Detector():
             # w = 2*int(truncate*sigma + 0.5) + 1 )from gaussian_filter1d():
             # pixel_blurring = 2*int(4*sigma + 0.5) + 1
             sigma = (pixel_blurring-2)/8
+            from scipy.ndimage.filters import gaussian_filter
             image = gaussian_filter(image, sigma)
 
         return image
@@ -1,12 +1,41 @@
 """
+Gratings for grating interferometer simulation.
+
+Functions
+=========
+
+transmission_profile:   Complex transmission over one period for all
+                        energies (cached).
+profile_options:        Wafer and fill of a grating from input parameters.
+sample_profile:         Transmission profile at positions x.
+clear_profile_cache:    Clear cached transmission profiles.
+
+Notes
+=====
+
+Transmission profiles are cached per process by (pitch, duty cycle, height,
+materials and thicknesses, energies, sampling rate, options), at most
+MAX_CACHED_PROFILES (least recently used are dropped), so phase stepping, CT
+angles and sweeps with the same grating reuse them. Cached profiles are
+read-only, copy before modifying.
 
 @author: buechner_m <maria.buechner@gmail.com>
 """
+import collections
+import threading
+import numpy as np
 import sys
 sys.path.append('..')  # To allow importing from neighbouring folder
 import simulation.materials as materials
+import simulation.utilities as utilities
+import simulation.timing as timing
 import logging
-logger = logging.getLogger(__name__)
+logger = utilities.get_logger(__name__)
+
+# Cached transmission profiles, see transmission_profile()
+MAX_CACHED_PROFILES = 64
+_PROFILES = collections.OrderedDict()  # _PROFILES[key] = profile
+_PROFILES_LOCK = threading.Lock()
 
 
 class Grating(object):
@@ -38,6 +67,69 @@ class Grating(object):
         self.duty_cycle = duty_cycle
         self.shape = shape
 
+    @timing.timed('grating shadowing')
+    def shadowing(self, ray_angles, energies, photo_only=False,
+                  look_up_table='nist'):
+        """
+        Effective transmission of the grating lines for each ray angle and
+        energy, see shadowing_transmission().
+
+        Parameters
+        ==========
+
+        ray_angles [rad]:       [columns], e.g. from geometry.ray_angles()
+        energies [keV]:         [energies]
+        photo_only [bool]:      default=False
+        look_up_table [str]:    default='nist'
+
+        Returns
+        =======
+
+        transmission [columns, energies]
+
+        Notes
+        =====
+
+        Bent gratings (shape='circular') are assumed to match their distance
+        from the source, thus all rays are perpendicular to the grating and
+        there is no shadowing.
+
+        """
+        energies = np.atleast_1d(energies)
+        if self.shape == 'circular':
+            ray_angles = np.zeros(np.size(ray_angles))
+        beta = materials.delta_beta(self.material, energies,
+                                    photo_only=photo_only,
+                                    source=look_up_table)[1]
+        mu = materials.attenuation_coefficient(beta, energies)  # [1/um]
+        return shadowing_transmission(ray_angles, self.pitch,
+                                      self.duty_cycle, self.height, mu)
+
+    def transmission_profile(self, energies, sampling_rate, **kwargs):
+        """
+        Complex transmission over one period for all energies, see
+        transmission_profile().
+
+        Parameters
+        ==========
+
+        energies [keV]:         [energies]
+        sampling_rate [um]
+        kwargs:                 wafer_material, wafer_thickness,
+                                fill_material, fill_thickness, photo_only,
+                                look_up_table, precision (see
+                                transmission_profile())
+
+        Returns
+        =======
+
+        profile [samples, energies]
+
+        """
+        return transmission_profile(self.pitch, self.duty_cycle, self.height,
+                                    self.material, energies, sampling_rate,
+                                    **kwargs)
+
 
 class PhaseGrating(Grating):
     """
@@ -122,3 +214,304 @@ class AbsorptionGrating(Grating):
         else:
             raise Exception('Neither height of grating nor absorption are '
                             'defined.')
+
+
+# %% Functions
+
+
+def shadowing_transmission(ray_angles, pitch, duty_cycle, height,
+                           attenuation):
+    """
+    Calculate the effective (period averaged) x-ray transmission of flat
+    grating lines for inclined rays, for all ray angles and energies at once.
+
+    Parameters
+    ==========
+
+    ray_angles [rad]:       [columns], angle between ray and grating normal
+    pitch [um]
+    duty_cycle:             ]0...1[
+    height [um]:            grating line height (thickness)
+    attenuation [1/um]:     [energies], attenuation coefficient (mu) of the
+                            line material
+
+    Returns
+    =======
+
+    transmission [columns, energies]
+
+    Notes
+    =====
+
+    An inclined ray crosses the line height h over a lateral shift
+    s = h * tan(angle). Per entry position x within one period, the lateral
+    overlap o(x) of [x, x+s] with the lines is a trapezoidal function of x,
+    and the path length in the material is o(x)/s * h/cos(angle). The period
+    average of exp(-mu * path) is integrated analytically over the plateaus
+    and ramps of o(x):
+
+        T = exp(-k*n*w) * (a*exp(-k*o_max) + b*exp(-k*o_min) +
+                           2*(exp(-k*o_min) - exp(-k*o_max))/k) / p
+
+    with k = mu*h/(s*cos(angle)), w = duty_cycle*pitch, n full periods within
+    s, o_min/o_max the overlap extrema of the remaining shift and a/b the
+    plateau lengths. For s = 0, this reduces to:
+
+        T = (w*exp(-mu*h) + (p-w)) / p
+
+    Examples
+    ========
+
+    shadowing_transmission([0, 0.1], 4.0, 0.5, 50, [0.05, 0.01])
+    array([[ 0.5410425 ,  0.80326533],
+           [ 0.2908426 ,  0.77849063]])
+
+    """
+    ray_angles = np.abs(np.atleast_1d(ray_angles))[:, np.newaxis]  # [rad]
+    attenuation = np.atleast_1d(attenuation)[np.newaxis, :]  # [1/um]
+    line_width = duty_cycle * pitch  # [um]
+    gap_width = pitch - line_width  # [um]
+
+    shift = height * np.tan(ray_angles)  # [um]
+    exponent = attenuation * height / np.cos(ray_angles)  # Full slanted path
+    # Split shift into full periods and remaining shift
+    periods = np.floor(shift / pitch)
+    rest = shift - periods * pitch
+    # Overlap extrema and ramp length of remaining shift
+    min_overlap = np.maximum(0.0, rest - gap_width)
+    max_overlap = np.minimum(rest, line_width)
+    ramp = max_overlap - min_overlap
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Attenuation per lateral um
+        k = np.where(shift > 0, exponent / np.where(shift > 0, shift, 1.0),
+                     0.0)
+        # Plateau lengths (from mean overlap = rest * line_width / pitch)
+        plateau_max = np.where(ramp > 0,
+                               (rest * line_width - max_overlap**2 +
+                                min_overlap**2 -
+                                (pitch - 2.0 * ramp) * min_overlap) /
+                               np.where(ramp > 0, ramp, 1.0),
+                               pitch)
+        plateau_min = pitch - 2.0 * ramp - plateau_max
+        ramps = np.where(k > 0,
+                         2.0 * (np.exp(-k * min_overlap) -
+                                np.exp(-k * max_overlap)) /
+                         np.where(k > 0, k, 1.0),
+                         2.0 * ramp)
+        shadowed = np.exp(-k * periods * line_width) * \
+            (plateau_max * np.exp(-k * max_overlap) +
+             plateau_min * np.exp(-k * min_overlap) + ramps) / pitch
+    straight = (line_width * np.exp(-exponent) + gap_width) / pitch
+
+    return np.where(shift > 0, shadowed, straight)
+
+
+def effective_duty_cycle(ray_angles, pitch, duty_cycle, height):
+    """
+    Geometrical duty cycle of flat grating lines as seen by inclined rays,
+    for sampling binary grating profiles (wave propagation).
+
+    Parameters
+    ==========
+
+    ray_angles [rad]:       [columns]
+    pitch [um]
+    duty_cycle:             ]0...1[
+    height [um]
+
+    Returns
+    =======
+
+    duty_cycle [columns]:   duty_cycle + height*tan(angle)/pitch, max. 1
+
+    """
+    ray_angles = np.abs(np.atleast_1d(ray_angles))
+    return np.minimum(1.0, duty_cycle + height * np.tan(ray_angles) / pitch)
+
+
+def transmission_profile(pitch, duty_cycle, height, material, energies,
+                         sampling_rate, wafer_material=None,
+                         wafer_thickness=0, fill_material=None,
+                         fill_thickness=0, photo_only=False,
+                         look_up_table='nist', precision=None):
+    """
+    Complex transmission of one grating period for all energies, including
+    wafer (substrate) and fill material. Profiles are cached.
+
+    Parameters
+    ==========
+
+    pitch [um]
+    duty_cycle:             ]0...1[
+    height [um]:            grating line height
+    material [str]:         line material
+    energies [keV]:         [energies]
+    sampling_rate [um]:     pitch/sampling_rate is rounded to samples
+    wafer_material [str]:   default is None (no wafer)
+    wafer_thickness [um]:   default is 0
+    fill_material [str]:    material filling the gaps, default is None
+    fill_thickness [um]:    depth of fill, default is 0. Fill higher than
+                            the lines also covers the lines.
+    photo_only [bool]:      default is False
+    look_up_table [str]:    default is 'nist'
+    precision [str]:        'single' or 'double', default is None
+                            (see utilities.configure_precision)
+
+    Returns
+    =======
+
+    profile [samples, energies]:    complex dtype of precision, read-only,
+                                    lines start at sample 0
+
+    Notes
+    =====
+
+    Per sample and energy, with k = 2*pi/wavelength and thickness t of every
+    material m along z:
+
+        profile = exp(-1j * k * sum_m t_m * (delta_m - 1j*beta_m))
+
+    i.e. phase shift k*delta*t and amplitude exp(-k*beta*t) (intensity
+    exp(-mu*t)), as propagation.grating_wavefield. Samples are centered in
+    their interval, a sample belongs to a line if its center is.
+
+    """
+    energies = np.atleast_1d(np.asarray(energies, dtype=np.float64))
+    precision = utilities.get_precision(precision)  # Part of the cache key
+    [pitch, duty_cycle, height, wafer_thickness, fill_thickness,
+     sampling_rate] = [_to_float(value) for value in
+                       [pitch, duty_cycle, height, wafer_thickness,
+                        fill_thickness, sampling_rate]]
+    key = (pitch, duty_cycle, height, material, wafer_material,
+           wafer_thickness, fill_material, fill_thickness, energies.tobytes(),
+           sampling_rate, bool(photo_only), look_up_table.lower(), precision)
+    with _PROFILES_LOCK:
+        if key in _PROFILES:
+            logger.debug("Using cached transmission profile of {0} grating "
+                         "(pitch {1} um).", material, pitch)
+            profile = _PROFILES.pop(key)
+            _PROFILES[key] = profile  # Most recently used
+            return profile
+    profile = _transmission_profile(pitch, duty_cycle, height, material,
+                                    energies, sampling_rate, wafer_material,
+                                    wafer_thickness, fill_material,
+                                    fill_thickness, photo_only,
+                                    look_up_table, precision)
+    profile.setflags(write=False)
+    with _PROFILES_LOCK:
+        _PROFILES[key] = profile
+        while len(_PROFILES) > MAX_CACHED_PROFILES:
+            _PROFILES.popitem(last=False)
+    return profile
+
+
+def profile_options(parameters, grating):
+    """
+    Wafer and fill options of transmission_profile() from input parameters.
+
+    Parameters
+    ==========
+
+    parameters [dict]
+    grating [str]:          'g0', 'g1' or 'g2'
+
+    Returns
+    =======
+
+    options [dict]:         wafer_material, wafer_thickness, fill_material,
+                            fill_thickness, photo_only, look_up_table
+
+    """
+    return dict(wafer_material=parameters['wafer_material_'+grating],
+                wafer_thickness=parameters['wafer_thickness_'+grating] or 0,
+                fill_material=parameters['fill_material_'+grating],
+                fill_thickness=parameters['fill_thickness_'+grating] or 0,
+                photo_only=parameters['photo_only'],
+                look_up_table=parameters['look_up_table'])
+
+
+def sample_profile(profile, x, pitch):
+    """
+    Transmission profile at positions x (periodic, lines start at x=0).
+
+    Parameters
+    ==========
+
+    profile [samples, energies]:    see transmission_profile()
+    x [um]:                         [x] positions
+    pitch [um]
+
+    Returns
+    =======
+
+    transmission [x, energies]
+
+    """
+    number_samples = profile.shape[0]
+    indices = np.floor(np.mod(np.asarray(x, dtype=np.float64), pitch) /
+                       pitch * number_samples).astype(int)
+    return profile[np.minimum(indices, number_samples-1)]
+
+
+def clear_profile_cache():
+    """
+    Clear cached transmission profiles (e.g. after clearing the material
+    cache).
+    """
+    with _PROFILES_LOCK:
+        _PROFILES.clear()
+
+# %% Private utilities
+
+
+@timing.timed('grating profile')
+def _transmission_profile(pitch, duty_cycle, height, material, energies,
+                          sampling_rate, wafer_material, wafer_thickness,
+                          fill_material, fill_thickness, photo_only,
+                          look_up_table, precision):
+    """
+    Calculate transmission profile, see transmission_profile().
+    """
+    [_, complex_type] = utilities.get_dtypes(precision)
+    number_samples = max(1, int(round(pitch / sampling_rate)))
+    if not np.isclose(number_samples * sampling_rate, pitch):
+        logger.warning("Pitch of {0} um is not a multiple of the sampling "
+                       "rate {1} um, using {2} samples per period.",
+                       pitch, sampling_rate, number_samples)
+    logger.debug("Calculating transmission profile of {0} grating (pitch {1}"
+                 " um, {2} samples, {3} energies)...", material, pitch,
+                 number_samples, energies.size)
+    centers = (np.arange(number_samples) + 0.5) / number_samples
+    lines = centers < duty_cycle
+    # [material, thickness [samples]]
+    layers = [[material, np.where(lines, height, 0.0)]]
+    if fill_material and fill_thickness:
+        layers.append([fill_material,
+                       np.where(lines, max(0.0, fill_thickness - height),
+                                fill_thickness)])
+    if wafer_material and wafer_thickness:
+        layers.append([wafer_material,
+                       np.full(number_samples, wafer_thickness)])
+    wavenumber = 2 * np.pi / materials.energy_to_wavelength(energies)  # [1/um]
+    exponent = np.zeros((number_samples, energies.size), dtype=np.complex128)
+    for [layer_material, thickness] in layers:
+        if not np.any(thickness):
+            continue
+        [delta, beta] = materials.delta_beta(layer_material, energies,
+                                             photo_only=photo_only,
+                                             source=look_up_table)[:2]
+        refraction = np.atleast_1d(delta) - 1j*np.atleast_1d(beta)
+        exponent += thickness[:, np.newaxis] * (wavenumber * refraction)
+    logger.debug("... done.")
+    return np.exp(-1j*exponent).astype(complex_type)
+
+
+def _to_float(value):
+    """
+    Scalar (also from single value arrays, e.g. calculated heights), None is
+    0.
+    """
+    if value is None:
+        return 0.0
+    return float(np.asarray(value, dtype=np.float64).reshape(-1)[0])
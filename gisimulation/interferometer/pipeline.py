@@ -0,0 +1,562 @@
+"""
+Streaming pipeline for the simulation chain (source, gratings, sample,
+propagation, detector): wavefields flow through the stages as chunks, keyed
+by tile and energy bin, so that no stage holds the full [x, energies] cube.
+
+Classes
+=======
+
+Stage:          Step of the chain, function(chunk) returns the next chunk.
+                Parameters:
+                    name [str]
+                    function (function(chunk))
+                    number_workers [int] (default 1)
+
+Pipeline:       Runs chunks through all stages, in threads connected by
+                bounded queues (backpressure), and reports the throughput per
+                stage.
+                Parameters:
+                    stages [list]
+                    queue_size [int] (default QUEUE_SIZE)
+                    threaded [boolean] (default True)
+
+Functions
+=========
+
+source_chunks:      Plane wave chunks of the source spectrum (generator).
+                    Parameters:
+                        source [Source]
+                        energies [keV]
+                        x [um]
+                        energies_per_chunk [int] (default 1)
+                        tiles [list] (default None)
+                        precision [str] (default None)
+
+grating_stage:      Multiply wavefield with grating transmission.
+propagation_stage:  Fresnel propagation over distance.
+detector_stage:     Intensity, pixel binning and detection.
+
+Usage
+=====
+
+stages = [grating_stage(g1, sampling),
+          Stage('sample', sample_transmission),
+          propagation_stage(distance_g1_g2, sampling),
+          grating_stage(g2, sampling, **gratings.profile_options(parameters,
+                                                                 'g2')),
+          detector_stage(detector_, samples_per_pixel)]
+pipeline = Pipeline(stages)
+image = 0
+for chunk in pipeline.run(source_chunks(source_, energies, x, 4)):
+    image = image + chunk['image'].sum(axis=-1)  # Sum energy bins
+print(pipeline.format_report())
+
+From gisimulation folder, demo (threaded vs. sequential):
+
+python -m interferometer.pipeline [-ne 64] [-ns 262144] [-epc 4] [-np 2]
+
+Notes
+=====
+
+Chunks are dicts:
+    chunk['key']:               (tile index, energy bin index)
+    chunk['x'] [um]:            [x] sample positions of the tile
+    chunk['energies'] [keV]:    [energies] of the bin
+    chunk['indices']:           [energies] indices into the spectrum (e.g.
+                                for detector efficiency)
+    chunk['wavefield']:         [x, energies] complex
+    chunk['image']:             [pixels, 1, energies] (detector_stage)
+Stages may add keys, and should replace (not modify in place) arrays they
+change, since other chunks may share them.
+
+Threaded: every stage runs in number_workers threads, stages are connected by
+queues of queue_size chunks. A stage, whose output queue is full, waits (the
+slowest stage sets the pace), thus at most about
+(queue_size + number_workers) chunks per stage are in memory. numpy and the
+FFT release the GIL, so stages run in parallel. With several workers per
+stage, chunks may be reordered (use chunk['key']). Errors in a stage stop
+the pipeline and are raised by run().
+
+Sequential (threaded=False): the stages are chained generators, one chunk at a
+time, in order.
+
+Tiles are [start, stop) sample ranges along x; as in simulation.scheduler,
+they must include their overlap for propagation and be aligned to pixels.
+The source is a plane wave (spatial coherence of a finite focal spot is not
+modelled), source.spectrum are the (filtered) photons per energy.
+
+Every stage call is timed as timing stage 'pipeline: <name>' (--profile).
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import sys
+import threading
+import timeit
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+import numpy as np
+sys.path.append('..')  # To allow importing from neighbouring folder
+import simulation.materials as materials
+import simulation.utilities as utilities
+import simulation.timing as timing
+import interferometer.propagation as propagation
+import logging
+logger = utilities.get_logger(__name__)
+
+# Chunks buffered between two stages
+QUEUE_SIZE = 2
+# Waiting threads check for errors of other stages every POLL_INTERVAL [s]
+POLL_INTERVAL = 0.1
+# End of chunks marker
+_END = object()
+
+# %% Classes
+
+
+class Stage(object):
+    """
+    Step of the simulation chain.
+
+    Parameters
+    ==========
+
+    name [str]
+    function:               function(chunk), returns the processed chunk
+    number_workers [int]:   threads of this stage (threaded pipeline),
+                            default is 1
+
+    """
+    def __init__(self, name, function, number_workers=1):
+        self.name = name
+        self.function = function
+        self.number_workers = number_workers
+        self.reset()
+
+    def reset(self):
+        """
+        Reset throughput statistics.
+        """
+        self.chunks = 0
+        self.busy = 0.0  # [s]
+        self.bytes = 0  # Output arrays
+        self._lock = threading.Lock()
+
+    def process(self, chunk):
+        """
+        Process one chunk and record statistics.
+        """
+        start = timeit.default_timer()
+        with timing.stage('pipeline: ' + self.name):
+            chunk = self.function(chunk)
+        duration = timeit.default_timer() - start
+        size = sum(value.nbytes for value in chunk.values()
+                   if isinstance(value, np.ndarray))
+        with self._lock:
+            self.chunks += 1
+            self.busy += duration
+            self.bytes += size
+        return chunk
+
+    def stream(self, chunks):
+        """
+        Process chunks one by one (generator).
+        """
+        for chunk in chunks:
+            yield self.process(chunk)
+
+
+class Pipeline(object):
+    """
+    Runs chunks through all stages.
+
+    Parameters
+    ==========
+
+    stages [list]:          [Stage, ...]
+    queue_size [int]:       chunks between two stages, default is QUEUE_SIZE
+    threaded [boolean]:     stages in threads, default is True
+
+    """
+    def __init__(self, stages, queue_size=QUEUE_SIZE, threaded=True):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.threaded = threaded
+        self.duration = 0.0  # [s]
+
+    def run(self, chunks):
+        """
+        Run chunks through all stages (generator).
+
+        Parameters
+        ==========
+
+        chunks:             iterable of chunks, e.g. source_chunks()
+
+        Returns
+        =======
+
+        chunks:             generator of processed chunks
+
+        """
+        for stage in self.stages:
+            stage.reset()
+        start = timeit.default_timer()
+        logger.debug("Running pipeline {0} ({1})...",
+                     [stage.name for stage in self.stages],
+                     'threaded' if self.threaded else 'sequential')
+        try:
+            if self.threaded:
+                for chunk in self._run_threaded(chunks):
+                    yield chunk
+            else:
+                for stage in self.stages:
+                    chunks = stage.stream(chunks)
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            self.duration = timeit.default_timer() - start
+        logger.debug("... done.")
+
+    def report(self):
+        """
+        Throughput of all stages (of the last run).
+
+        Returns
+        =======
+
+        report [dict]:      report[name] = dict(chunks, busy_s, chunks_per_s,
+                            mb_per_s, utilization), utilization is the
+                            fraction of the run time the stage's workers were
+                            busy (bottleneck close to 1)
+
+        """
+        report_ = dict()
+        for stage in self.stages:
+            busy = max(stage.busy, 1e-12)
+            report_[stage.name] = dict(
+                chunks=stage.chunks, busy_s=stage.busy,
+                chunks_per_s=stage.chunks / busy,
+                mb_per_s=stage.bytes / 1024.0**2 / busy,
+                utilization=stage.busy / max(self.duration *
+                                             stage.number_workers, 1e-12))
+        return report_
+
+    def format_report(self):
+        """
+        Throughput of all stages as table.
+
+        Returns
+        =======
+
+        report [str]
+
+        """
+        report_ = self.report()
+        header = "{0:<20} {1:>7} {2:>10} {3:>10} {4:>10} {5:>8}".format(
+            'Stage', 'Chunks', 'Busy [s]', 'Chunks/s', 'MB/s', 'Busy [%]')
+        lines = ['-'*len(header), header, '-'*len(header)]
+        for stage in self.stages:
+            entry = report_[stage.name]
+            lines.append("{0:<20} {1:>7} {2:>10.4f} {3:>10.1f} {4:>10.1f} "
+                         "{5:>8.1f}".format(stage.name, entry['chunks'],
+                                            entry['busy_s'],
+                                            entry['chunks_per_s'],
+                                            entry['mb_per_s'],
+                                            entry['utilization']*100))
+        lines.append('-'*len(header))
+        lines.append("Total: {0:.4f} s".format(self.duration))
+        return '\n'.join(lines)
+
+    def _run_threaded(self, chunks):
+        """
+        Stages in worker threads, connected by bounded queues.
+        """
+        stopped = threading.Event()
+        errors = []
+        queues = [queue.Queue(self.queue_size)
+                  for _ in range(len(self.stages) + 1)]
+        remaining = [stage.number_workers for stage in self.stages]
+        lock = threading.Lock()
+
+        def put(index, item):
+            while not stopped.is_set():
+                try:
+                    queues[index].put(item, timeout=POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(index):
+            while not stopped.is_set():
+                try:
+                    return queues[index].get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+            return _END
+
+        def fail(error):
+            logger.exception("Pipeline stopped by error: {0}", error)
+            errors.append(error)
+            stopped.set()
+
+        def feed():
+            try:
+                for chunk in chunks:
+                    if not put(0, chunk):
+                        return
+            except Exception as e:
+                fail(e)
+            for _ in range(self.stages[0].number_workers):
+                put(0, _END)
+
+        def work(index):
+            stage = self.stages[index]
+            while True:
+                chunk = get(index)
+                if chunk is _END:
+                    break
+                try:
+                    chunk = stage.process(chunk)
+                except Exception as e:
+                    fail(e)
+                    break
+                put(index + 1, chunk)
+            with lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last:  # Pass end to all workers of the next stage
+                number_next = 1
+                if index + 1 < len(self.stages):
+                    number_next = self.stages[index + 1].number_workers
+                for _ in range(number_next):
+                    put(index + 1, _END)
+
+        threads = [threading.Thread(target=feed)]
+        for index, stage in enumerate(self.stages):
+            threads += [threading.Thread(target=work, args=(index,))
+                        for _ in range(stage.number_workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while True:
+                chunk = get(len(self.stages))
+                if chunk is _END:
+                    break
+                yield chunk
+        finally:
+            stopped.set()  # Stops all threads, if the consumer stops early
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+# %% Functions
+
+
+def source_chunks(source, energies, x, energies_per_chunk=1, tiles=None,
+                  precision=None):
+    """
+    Plane wave chunks of the source spectrum, amplitude sqrt(photons).
+
+    Parameters
+    ==========
+
+    source [Source]:            source.spectrum: photons per energy
+    energies [keV]:             [energies] of source.spectrum
+    x [um]:                     [x] sample positions
+    energies_per_chunk [int]:   default is 1
+    tiles [list]:               [[start, stop], ...] sample ranges, default
+                                is None (one tile)
+    precision [str]:            'single' or 'double', default is None
+                                (see utilities.configure_precision)
+
+    Returns
+    =======
+
+    chunks:                     generator, energy bins of all tiles
+
+    """
+    [_, complex_type] = utilities.get_dtypes(precision)
+    energies = np.atleast_1d(energies)
+    photons = np.asarray(source.spectrum, dtype=np.float64) * \
+        np.ones(energies.shape)
+    x = np.asarray(x)
+    tiles = tiles or [[0, x.size]]
+    for tile_index, [start, stop] in enumerate(tiles):
+        for bin_index, bin_start in enumerate(range(0, energies.size,
+                                                    energies_per_chunk)):
+            indices = np.arange(bin_start, min(bin_start+energies_per_chunk,
+                                               energies.size))
+            amplitude = np.sqrt(photons[indices]).astype(complex_type)
+            wavefield = np.empty((stop-start, indices.size),
+                                 dtype=complex_type)
+            wavefield[...] = amplitude
+            yield dict(key=(tile_index, bin_index), x=x[start:stop],
+                       energies=energies[indices], indices=indices,
+                       wavefield=wavefield)
+
+
+def grating_stage(grating, sampling_rate, name=None, **options):
+    """
+    Stage multiplying the wavefield with the grating transmission profile
+    (cached per energy bin, see gratings.transmission_profile()).
+
+    Parameters
+    ==========
+
+    grating [Grating]:      Grating, PhaseGrating or AbsorptionGrating
+    sampling_rate [um]:     of chunk['x']
+    name [str]:             default is None ('grating')
+    options:                wafer_material, wafer_thickness, fill_material,
+                            fill_thickness, photo_only, look_up_table (see
+                            gratings.profile_options())
+
+    Returns
+    =======
+
+    stage [Stage]
+
+    """
+    import interferometer.gratings as gratings
+
+    def apply_grating(chunk):
+        profile = grating.transmission_profile(
+            chunk['energies'], sampling_rate,
+            precision=_precision(chunk['wavefield']), **options)
+        chunk = dict(chunk)
+        chunk['wavefield'] = chunk['wavefield'] * \
+            gratings.sample_profile(profile, chunk['x'], grating.pitch)
+        return chunk
+    return Stage(name or 'grating', apply_grating)
+
+
+def propagation_stage(distance, sampling_rate, name=None):
+    """
+    Stage propagating the wavefield over distance.
+
+    Parameters
+    ==========
+
+    distance [um]
+    sampling_rate [um]:     of chunk['x']
+    name [str]:             default is None ('propagation')
+
+    Returns
+    =======
+
+    stage [Stage]
+
+    """
+    def propagate(chunk):
+        chunk = dict(chunk)
+        chunk['wavefield'] = propagation.propagate(
+            chunk['wavefield'], distance,
+            materials.energy_to_wavelength(chunk['energies']), sampling_rate,
+            _precision(chunk['wavefield']))
+        return chunk
+    return Stage(name or 'propagation', propagate)
+
+
+def detector_stage(detector, samples_per_pixel, name=None):
+    """
+    Stage detecting the intensity: samples are summed into pixels and
+    detected with the efficiency of the chunk's energies. The wavefield is
+    dropped from the chunk.
+
+    Parameters
+    ==========
+
+    detector [Detector]:        detector.efficiency is scalar or per energy
+                                of the spectrum (chunk['indices'])
+    samples_per_pixel [int]
+    name [str]:                 default is None ('detector')
+
+    Returns
+    =======
+
+    stage [Stage]
+
+    """
+    import copy
+
+    def detect(chunk):
+        chunk = dict(chunk)
+        intensity = propagation.intensity(chunk.pop('wavefield'))
+        pixels = intensity.reshape(-1, samples_per_pixel,
+                                   intensity.shape[-1]).sum(axis=1)
+        chunk_detector = copy.copy(detector)
+        if np.ndim(detector.efficiency):
+            chunk_detector.efficiency = \
+                np.asarray(detector.efficiency)[chunk['indices']]
+        chunk['image'] = chunk_detector.detect(pixels[:, np.newaxis, :])
+        return chunk
+    return Stage(name or 'detector', detect)
+
+# %% Private utilities
+
+
+def _precision(array):
+    """
+    'single' or 'double', from dtype of array.
+    """
+    if array.dtype in [np.float32, np.complex64]:
+        return 'single'
+    return 'double'
+
+# %% Main
+
+
+if __name__ == '__main__':
+    import argparse
+    import interferometer.source as source
+    import interferometer.gratings as gratings
+    import interferometer.detector as detector
+    parser = argparse.ArgumentParser(description="Pipeline demo: source, G1, "
+                                     "propagation, G2 and detector, threaded "
+                                     "and sequential.")
+    parser.add_argument('-ne', dest='number_energies', type=int, default=64)
+    parser.add_argument('-ns', dest='number_samples', type=int,
+                        default=2**18)
+    parser.add_argument('-epc', dest='energies_per_chunk', type=int,
+                        default=4)
+    parser.add_argument('-np', dest='number_workers', type=int, default=2,
+                        help="Threads of the propagation stage.")
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    [pitch, sampling, distance, samples_per_pixel] = \
+        [4.0, 4.0/64, 2e5, 128]  # [um]
+    x = np.arange(arguments.number_samples) * sampling
+    energies = np.linspace(20, 40, arguments.number_energies)
+    source_ = source.Source(np.exp(-(energies-28)**2/50.0), None, None, None,
+                            'nist', False)
+    g1 = gratings.PhaseGrating(pitch, 'Si', 28, phase_shift=np.pi)
+    g2 = gratings.AbsorptionGrating(pitch/2, 'Au', 28, height=50)
+    detector_ = detector.Detector('photon', None, sampling*samples_per_pixel,
+                                  None, None, 'Si', 500, energies, 'nist',
+                                  False, sampling)
+    images = dict()
+    for threaded in [False, True]:
+        stages = [grating_stage(g1, sampling, name='g1'),
+                  propagation_stage(distance, sampling),
+                  grating_stage(g2, sampling, name='g2',
+                                wafer_material='Si', wafer_thickness=200,
+                                fill_material='C5H8O2', fill_thickness=50),
+                  detector_stage(detector_, samples_per_pixel)]
+        if threaded:
+            stages[1].number_workers = arguments.number_workers
+        pipeline = Pipeline(stages, threaded=threaded)
+        image = 0
+        for chunk in pipeline.run(source_chunks(source_, energies, x,
+                                                arguments.energies_per_chunk)):
+            image = image + chunk['image'].sum(axis=-1)
+        images[threaded] = image
+        print("{0}:".format('Threaded' if threaded else 'Sequential'))
+        print(pipeline.format_report())
+    print("Max. relative difference: {0:.2e}"
+          .format(np.abs(images[True] - images[False]).max() /
+                  np.abs(images[False]).max()))
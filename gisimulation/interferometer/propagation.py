@@ -0,0 +1,212 @@
+"""
+Free space propagation of wavefields through a grating interferometer, in
+single or double precision.
+
+Functions
+=========
+
+grating_wavefield:  Complex transmission of a binary line grating.
+                    Parameters:
+                        x [um]
+                        pitch [um]
+                        duty_cycle
+                        phase_shift [rad] (default 0)
+                        transmission (default 1)
+                        precision [str] (default None)
+
+propagate:          Fresnel propagation of a wavefield along z.
+                    Parameters:
+                        wavefield [x] or [x, energies]
+                        distance [um]
+                        wavelength [um]
+                        pixel_size [um]
+                        precision [str] (default None)
+
+propagator:         Fresnel propagator (transfer function) in Fourier space.
+                    Parameters:
+                        number_samples [int]
+                        distance [um]
+                        wavelength [um]
+                        pixel_size [um]
+                        precision [str] (default None)
+
+apply_propagator:   Propagate wavefield with a precalculated propagator.
+                    Parameters:
+                        wavefield [x] or [x, energies]
+                        propagator [x] or [x, energies]
+
+intensity:          Intensity of a wavefield.
+                    Parameters:
+                        wavefield
+
+Notes
+=====
+
+Wavefields are 1D along x (grating lines along y), optionally with a second
+axis for energies. phase_shift, transmission and wavelength can be
+[energies] arrays, which are broadcast along the last axis.
+
+Precision: 'single' (complex64) or 'double' (complex128), see
+utilities.get_dtypes. The propagator phase is calculated in double precision
+and only then cast, since pi*wavelength*distance*f^2 is large. FFTs use
+scipy.fftpack, which keeps single precision (numpy.fft < 2.0 computes in
+double precision only).
+
+Usage
+=====
+
+x = np.arange(number_pixels) * sampling
+g1 = grating_wavefield(x, 4.0, 0.5, np.pi, precision='single')
+wavefield = propagate(g1, distance_g1_g2, wavelength, sampling,
+                      precision='single')
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import numpy as np
+import sys
+sys.path.append('..')  # To allow importing from neighbouring folder
+import simulation.utilities as utilities
+import simulation.timing as timing
+import logging
+logger = utilities.get_logger(__name__)
+
+# %% Functions
+
+
+def grating_wavefield(x, pitch, duty_cycle, phase_shift=0, transmission=1,
+                      precision=None):
+    """
+    Complex transmission of a binary line grating (lines start at x=0).
+
+    Parameters
+    ==========
+
+    x [um]:                 [x] positions
+    pitch [um]
+    duty_cycle:             line width / pitch
+    phase_shift [rad]:      phase shift of the lines, scalar or [energies],
+                            default is 0
+    transmission:           intensity transmission of the lines, scalar or
+                            [energies], default is 1
+    precision [str]:        'single' or 'double', default is None
+                            (see utilities.configure_precision)
+
+    Returns
+    =======
+
+    wavefield [x] or [x, energies]
+
+    """
+    [_, complex_type] = utilities.get_dtypes(precision)
+    lines = np.mod(np.asarray(x, dtype=np.float64), pitch) < \
+        duty_cycle*pitch
+    line_transmission = np.sqrt(transmission) * np.exp(-1j*phase_shift)
+    if np.ndim(line_transmission):
+        lines = lines[:, np.newaxis]
+    wavefield = np.where(lines, line_transmission, 1)
+    return wavefield.astype(complex_type)
+
+
+@timing.timed('propagation')
+def propagate(wavefield, distance, wavelength, pixel_size,
+              precision=None):
+    """
+    Fresnel propagation (angular spectrum, paraxial) of a wavefield along z.
+    The field is periodic along x.
+
+    Parameters
+    ==========
+
+    wavefield:              [x] or [x, energies]
+    distance [um]
+    wavelength [um]:        scalar or [energies]
+    pixel_size [um]:        sampling along x
+    precision [str]:        'single' or 'double', default is None
+                            (see utilities.configure_precision)
+
+    Returns
+    =======
+
+    wavefield:              same shape, complex dtype of precision
+
+    """
+    [_, complex_type] = utilities.get_dtypes(precision)
+    wavefield = np.asarray(wavefield, dtype=complex_type)
+    logger.debug("Propagating wavefield {0} by {1} um...", wavefield.shape,
+                 distance)
+    return apply_propagator(wavefield, propagator(wavefield.shape[0],
+                                                  distance, wavelength,
+                                                  pixel_size, precision))
+
+
+def propagator(number_samples, distance, wavelength, pixel_size,
+               precision=None):
+    """
+    Fresnel propagator (paraxial transfer function) in Fourier space.
+
+    Parameters
+    ==========
+
+    number_samples [int]:   along x
+    distance [um]
+    wavelength [um]:        scalar or [energies]
+    pixel_size [um]:        sampling along x
+    precision [str]:        'single' or 'double', default is None
+                            (see utilities.configure_precision)
+
+    Returns
+    =======
+
+    propagator:             [x] or [x, energies], complex dtype of precision
+
+    """
+    [_, complex_type] = utilities.get_dtypes(precision)
+    frequencies = np.fft.fftfreq(number_samples, pixel_size)  # [1/um]
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    if wavelength.ndim:
+        frequencies = frequencies[:, np.newaxis]
+    return np.exp(-1j*np.pi*wavelength*distance *
+                  frequencies**2).astype(complex_type)
+
+
+def apply_propagator(wavefield, propagator):
+    """
+    Propagate wavefield with a precalculated propagator (see propagator()).
+
+    Parameters
+    ==========
+
+    wavefield:              [x] or [x, ...]
+    propagator:             [x] (same for all other axes) or [x, energies]
+                            (energies last axis of wavefield)
+
+    Returns
+    =======
+
+    wavefield:              dtype of wavefield
+
+    """
+    import scipy.fftpack
+    if propagator.ndim == 1:
+        propagator = propagator.reshape((-1,) + (1,)*(wavefield.ndim-1))
+    spectrum = scipy.fftpack.fft(wavefield, axis=0)
+    spectrum *= propagator
+    return scipy.fftpack.ifft(spectrum, axis=0, overwrite_x=True)
+
+
+def intensity(wavefield):
+    """
+    Intensity of a wavefield.
+
+    Parameters
+    ==========
+
+    wavefield
+
+    Returns
+    =======
+
+    intensity:              real dtype of the same precision
+
+    """
+    return wavefield.real**2 + wavefield.imag**2
@@ -7,8 +7,9 @@ import numpy as np
 import sys
 sys.path.append('..')  # To allow importing from neighbouring folder
 import simulation.materials as materials
+import simulation.utilities as utilities
 import logging
-logger = logging.getLogger(__name__)
+logger = utilities.get_logger(__name__)
 
 
 class Source():
@@ -33,7 +34,7 @@ class Source():
         else:
             self.type = 'finite'
             self.focal_spot_size = focal_spot_size
-        logger.debug("Source type is: {0}".format(self.type))
+        logger.debug("Source type is: {0}", self.type)
 
         if material_filter:
             self.spectrum = self.spectrum * \
@@ -42,4 +43,4 @@ class Source():
                                                  self.spectrum,
                                                  photo_only=photo_only,
                                                  source=look_up_table)
-        logger.debug("Spectrum is:\n{0}".format(self.spectrum))
+        logger.debug("Spectrum is:\n{0}", self.spectrum)
@@ -5,7 +5,6 @@ Module to run grating interferometer simulation and metrics calculation.
 """
 import logging
 import numpy as np
-import scipy.io
 import sys
 import os
 # gisimulation modules
@@ -13,6 +12,10 @@ import simulation.utilities as utilities
 import simulation.parser_def as parser_def
 import simulation.check_input as check_input
 import simulation.geometry as geometry
+import simulation.results_store as results_store
+import simulation.run_cache as run_cache
+import simulation.timing as timing
+import simulation.parallel as parallel
 # import materials
 # import geometry
 # import gratings
@@ -43,13 +46,14 @@ def calculate_geometry(parameters, parser_info, results):
     =====
 
     parameters and results are passed as references, thus the function changes
-    them 'globally'
+    them 'globally' (also if the geometry is loaded from the run cache)
 
     """
     # Check input
     logger.info("Checking geometry input...")
     try:
-        check_input.geometry_input(parameters, parser_info)
+        with timing.stage('input checks'):
+            check_input.geometry_input(parameters, parser_info)
     except check_input.InputError:
         logger.info("Command line error, exiting...")
         sys.exit(2)  # 2: command line syntax errors
@@ -58,12 +62,22 @@ def calculate_geometry(parameters, parser_info, results):
     # Store input
     results['input'] = collect_input(parameters, parser_info)
 
+    # Load identical run from cache
+    run_key = run_cache.run_hash(results['input'], 'geometry')
+    cached_results = run_cache.get(run_key)
+    if cached_results:
+        results['geometry'] = cached_results['geometry']
+        update_from_results(parameters, results['geometry'])
+        return
+
     # Calculate
     logger.info("Calculationg geometry...")
-    gi_geometry = geometry.Geometry(parameters)
-    results['geometry'] = gi_geometry.results
-    parameters = gi_geometry.update_parameters()
+    with timing.stage('geometry'):
+        gi_geometry = geometry.Geometry(parameters)
+        results['geometry'] = gi_geometry.results
+        parameters.update(gi_geometry.update_parameters())
     logger.info("... done.")
+    run_cache.put(run_key, {'geometry': results['geometry']})
 
 # #############################################################################
 # Show results ################################################################
@@ -240,6 +254,7 @@ def collect_input(parameters, parser_info):
     return input_parameters
 
 
+@timing.timed('saving input')
 def save_input(input_file_path, input_parameters, overwrite=False):
     """
     Save string parameter keys and values (as strings) to input file.
@@ -282,7 +297,9 @@ def save_input(input_file_path, input_parameters, overwrite=False):
         logger.warning("Input paramters are NOT saved.")
 
 
-def save_results(results_dir_path, results, overwrite=False):
+@timing.timed('saving')
+def save_results(results_dir_path, results, overwrite=False,
+                 file_format='mat'):
     """
     Save results dict to folder.
 
@@ -293,6 +310,8 @@ def save_results(results_dir_path, results, overwrite=False):
     results [dict]
     overwrite [boolean]:        force overwrite without promt (when called
                                 from GUI)
+    file_format [str]:          'mat', 'hdf5' or 'npy' (see
+                                simulation.results_store), default is 'mat'
 
     Notes
     =====
@@ -309,8 +328,9 @@ def save_results(results_dir_path, results, overwrite=False):
             - input dict as foldername_input.text (via save_input)
             - geometry.mat: all keys/values from dict (here: geometry)
             - ... .mat:
+        or geometry.h5/geometry.npyd etc. for 'hdf5'/'npy'
 
-    Formats:
+    Formats (.mat):
 
         saves booleans (True/False) as 'True'/'False'
         saves None as []
@@ -337,26 +357,19 @@ def save_results(results_dir_path, results, overwrite=False):
                 input_file = os.path.basename(results_dir_path)+'_input.txt'
                 input_file_path = os.path.join(results_dir_path, input_file)
                 save_input(input_file_path, results['input'], True)
+            elif file_format != 'mat':
+                results_store.write(results_store.store_path(results_dir_path,
+                                                             sub_dict_name,
+                                                             file_format),
+                                    results[sub_dict_name])
             else:
                 # Save sub dictionaries in single .mat (from single dict)
                 file_path = os.path.join(results_dir_path,
                                          sub_dict_name+'.mat')
-                # None to [] to store on .mat
-                result_dict = {key: value if value is not None else []
-                               for key, value
+                # None to [] and True/False to 'True'/'False' to store on .mat
+                result_dict = {key: _to_mat_value(value) for key, value
                                in results[sub_dict_name].iteritems()}
-                # Change True/False to True'/'False'
-                true_booleans = [key for key, var in result_dict.iteritems()
-                                 if var is True]
-                false_booleans = [key for key, var in result_dict.iteritems()
-                                  if var is False]
-                result_dict = {key: value
-                               if key not in true_booleans else 'True'
-                               for key, value in result_dict.iteritems()}
-                result_dict = {key: value
-                               if key not in false_booleans else 'False'
-                               for key, value in result_dict.iteritems()}
-
+                import scipy.io
                 scipy.io.savemat(file_path, result_dict)
         # If nothing was saved
         if not os.listdir(results_dir_path):
@@ -399,6 +412,24 @@ def reset_results():
 # Utilities ###################################################################
 
 
+def update_from_results(parameters, sub_results):
+    """
+    Update parameters with the values of all parameters in sub_results (e.g.
+    calculated distances and pitches in results['geometry']), as if they
+    were calculated (e.g. for cached results).
+
+    Parameters
+    ==========
+
+    parameters [dict]
+    sub_results [dict]
+
+    """
+    for var_name, value in sub_results.iteritems():
+        if var_name in parameters:
+            parameters[var_name] = value
+
+
 def compare_dictionaries(a, b):
     """
     Compares if 2 dictionaries are equal (keys and values).
@@ -426,6 +457,19 @@ def compare_dictionaries(a, b):
             return False
 
 
+def _to_mat_value(value):
+    """
+    Convert None to [] and True/False to 'True'/'False' to store on .mat.
+    """
+    if value is None:
+        return []
+    elif value is True:
+        return 'True'
+    elif value is False:
+        return 'False'
+    return value
+
+
 def _overwrite_file(message, default_answer='n'):
     """
     Promt user to enter y [yes] or n [n] when potentially overwriting a file.
@@ -476,6 +520,7 @@ if __name__ == '__main__':
     parameters = vars(parser.parse_args())
 
     results = reset_results()
+    timing.enable(parameters['profile'] is not False)
 
     # Config logger output
     logger_level = utilities.get_logger_level(parameters['verbose'])
@@ -491,11 +536,26 @@ if __name__ == '__main__':
 #        logger.info("Command line error, exiting...")
 #        sys.exit(2)  # 2: command line syntax errors
 
+    # Parallelization (energies, phase steps) and precision of simulations
+    try:
+        check_input.parallel_input(parameters)
+        check_input.precision_input(parameters)
+    except check_input.InputError:
+        logger.info("Command line error, exiting...")
+        sys.exit(2)  # 2: command line syntax errors
+    parallel.configure(parameters['number_workers'], parameters['chunk_size'])
+    utilities.configure_precision(parameters['precision'])
+
     # Calc geometries (params check inside)
     calculate_geometry(parameters, parser_info, results)
 
     show_geometry(results)
 
+    if timing.is_enabled():
+        print(timing.format_report())
+        if parameters['profile'] is not True:
+            timing.write_report(parameters['profile'])
+
 ##    input_parameters = collect_input(parameters, parser_info)
 #    save_input('C:/Users/buechner_m/Documents/Code/bCTDesign/Simulation/Python/gisimulation/gisimulation/data/inputs/test5.txt', results['input'])
 #
@@ -12,9 +12,9 @@ python mainGUI.py [Option...]::
 import numpy as np
 import sys
 import re
+import copy
 from functools import partial
 import os.path
-import scipy.io
 import logging
 # Set kivy logger console output format
 formatter = logging.Formatter('%(asctime)s - %(name)s -    %(levelname)s - '
@@ -28,7 +28,6 @@ from kivy.base import ExceptionHandler, ExceptionManager
 from kivy.logger import Logger
 from kivy.app import App
 from kivy.clock import Clock
-from kivy.garden.filebrowser import FileBrowser
 from kivy.core.window import Window
 from kivy.factory import Factory as F  # Widgets etc. (UIX)
 import kivy.graphics as G
@@ -41,15 +40,17 @@ logging.Logger.manager.root = Logger  # Makes Kivy Logger root for all
 logger = logging.getLogger(__name__)
 
 # All imports using logging
-import matplotlib
-matplotlib.use('module://kivy.garden.matplotlib.backend_kivy')
-import matplotlib.pyplot as plt
 # gisimulation imports
 import main
 import simulation.parser_def as parser_def
 import simulation.utilities as utilities
 import simulation.check_input as check_input
+import simulation.materials as materials
 import simulation.geometry as geometry
+import simulation.results_store as results_store
+import simulation.catalog as catalog
+import simulation.run_cache as run_cache
+import simulation.jobs as jobs
 
 
 # Set App Window configuration
@@ -60,6 +61,9 @@ Window.maximize() # NOTE: On desktop platforms only
 ERROR_MESSAGE_SIZE = (600, 450)  # absolute
 FILE_BROWSER_SIZE = (0.9, 0.9)  # relative
 LINE_HEIGHT = 35
+VALIDATION_DELAY = 0.5  # [s], validate after input paused for this long
+INVALID_COLOR = [0.8, 0, 0, 1]
+VALID_COLOR = [0, 0, 0, 1]
 TAB_HEIGHT = 1200
 
 # %% Custom Widgets
@@ -148,6 +152,7 @@ class Distances(F.GridLayout):
         """
         super(Distances, self).__init__(**kwargs)
         self.cols = 1
+        self._layout = None  # Arguments of current widgets
         self.update(['Source', 'Detector'], False)
         self.distance_fixed = False
 
@@ -194,6 +199,10 @@ class Distances(F.GridLayout):
                         display:    G1-G2
                                     S/G0 to G1
 
+        Widgets are only rebuilt if the layout changed, so that chained
+        handlers (on_gi_geometry, on_beam_geometry, ...) result in one
+        rebuild and entered distances are kept.
+
         """
         # Remove sample from list (if necessary)
         if 'Sample' in component_list:
@@ -201,6 +210,12 @@ class Distances(F.GridLayout):
         # Set relevant components
         if beam_geometry == 'parallel' and gi_geometry != 'free':
             component_list = ['G1', 'G2']
+        layout = (tuple(component_list), dual_phase, beam_geometry,
+                  gi_geometry)
+        if layout == self._layout:
+            logger.debug("Distances layout unchanged, keeping widgets.")
+            return
+        self._layout = layout
         # Remove all old widgets
         self.clear_widgets()
         # Add new ones for all comonents
@@ -823,6 +838,11 @@ def _load_results_dir(results_dir_path):
             - input dict as foldername_input.text (via save_input)
             - geometry.mat: all keys/values from dict (here: geometry)
             - ... .mat:
+        or geometry.h5/geometry.npyd etc. (see simulation.results_store)
+
+    Input and geometry are loaded directly, all other results are
+    results_store.LazyDict, which load their values on first access (.npyd
+    memory mapped).
 
     """
     results = dict()
@@ -832,58 +852,43 @@ def _load_results_dir(results_dir_path):
                                                         results_dir_path))
         file_path = os.path.join(results_dir_path, file_)
         logger.info(file_path)
+        [name, extension] = os.path.splitext(file_)
+        name = str(name)
         if '_input.txt' in file_:
             logger.info("Loading input...")
             results['input'] = _load_input_file(file_path, dict())
             logger.info("... done.")
-        elif '.mat' in file_:
-            matfile_name = str(file_.split('.')[0])
+        elif extension == '.mat':
             logger.info("Loading {0} into results['{1}']..."
-                        .format(file_, matfile_name))
-            raw_mat = scipy.io.loadmat(file_path, squeeze_me=True,
-                                       chars_as_strings=True)
-
-            # Remove __header__ and __globals__
-            del raw_mat['__header__']
-            del raw_mat['__version__']
-            del raw_mat['__globals__']
-            # [] to None to read from .mat
-            # [] are read as np.array([], dtype=float64)
-            empty_arrays = [key for key, value in raw_mat.iteritems()
-                            if (type(value).__module__ == 'numpy' and
-                                value.size == 0)]
-            results[matfile_name] = {key: value
-                                     if key not in empty_arrays else None
-                                     for key, value
-                                     in raw_mat.iteritems()}
-            # Convert strings from unicode to string
-            results[matfile_name] = {key: value
-                                     if not isinstance(value, unicode)
-                                     else str(value) for key, value
-                                     in results[matfile_name].iteritems()}
-            # Change 'True'/'False' to True/False
-            true_booleans = [key for key, value
-                             in results[matfile_name].iteritems()
-                             if (type(value) is str and value == 'True')]
-            false_booleans = [key for key, var
-                              in results[matfile_name].iteritems()
-                              if (type(value) is str and value is 'False')]
-            results[matfile_name] = {key: value
-                                     if key not in true_booleans else True
-                                     for key, value
-                                     in results[matfile_name].iteritems()}
-            results[matfile_name] = {key: value
-                                     if key not in false_booleans else False
-                                     for key, value
-                                     in results[matfile_name].iteritems()}
-            # Read list of strings correctly
-            # (original as numpy str (<U8) array)
-            component_list = results[matfile_name]['component_list']
-            component_list = component_list.astype('str').tolist()
-            component_list = [component.strip(' ')
-                              for component in component_list]
-            results[matfile_name]['component_list'] = component_list
-
+                        .format(file_, name))
+            import scipy.io
+            if name == 'geometry':
+                raw_mat = scipy.io.loadmat(file_path, squeeze_me=True,
+                                           chars_as_strings=True)
+                results[name] = {key: _from_mat_value(value)
+                                 for key, value in raw_mat.iteritems()
+                                 if not key.startswith('__')}
+                # Read list of strings correctly
+                # (original as numpy str (<U8) array)
+                component_list = results[name]['component_list']
+                component_list = component_list.astype('str').tolist()
+                component_list = [component.strip(' ')
+                                  for component in component_list]
+                results[name]['component_list'] = component_list
+            else:
+                variables = [variable[0] for variable
+                             in scipy.io.whosmat(file_path)]
+                results[name] = results_store.LazyDict(variables,
+                                                       partial(_load_mat_value,
+                                                               file_path))
+            logger.info("... done.")
+        elif extension in results_store.EXTENSIONS.values():
+            logger.info("Loading {0} into results['{1}']..."
+                        .format(file_, name))
+            if name == 'geometry':
+                results[name] = results_store.read(file_path)
+            else:
+                results[name] = results_store.read_lazy(file_path)
             logger.info("... done.")
         else:
             logger.warning("Wrong file or file extention in '{0}', skipping..."
@@ -892,6 +897,34 @@ def _load_results_dir(results_dir_path):
     return results
 
 
+def _load_mat_value(file_path, key):
+    """
+    Load single variable from .mat file.
+    """
+    import scipy.io
+    raw_mat = scipy.io.loadmat(file_path, squeeze_me=True,
+                               chars_as_strings=True, variable_names=[key])
+    return _from_mat_value(raw_mat[key])
+
+
+def _from_mat_value(value):
+    """
+    Convert value read from .mat: [] to None (read as
+    np.array([], dtype=float64)), unicode to string and 'True'/'False' to
+    True/False.
+    """
+    if type(value).__module__ == 'numpy' and value.size == 0:
+        return None
+    if isinstance(value, unicode):
+        value = str(value)
+    if isinstance(value, str):
+        if value == 'True':
+            return True
+        elif value == 'False':
+            return False
+    return value
+
+
 # #############################################################################
 # Collect widgets #############################################################
 def _collect_widgets(parameters, ids):
@@ -1037,6 +1070,103 @@ def _collect_input(parameters, ids, parser_info):
     return input_parameters
 
 
+# Background jobs
+def _geometry_job(job, parameters, parser_info, gi_geometry):
+    """
+    Check geometry input and calculate geometry (in worker thread, see
+    jobs.JobExecutor).
+
+    Parameters
+    ==========
+
+    job [jobs.Job]
+    parameters [dict]:          copy of collected parameters
+    parser_info [dict]:         parser_info[var_name] = [var_key, var_help]
+    gi_geometry [Geometry]:     previous geometry to update, None to
+                                calculate from scratch (or load from cache)
+
+    Returns
+    =======
+
+    job_results [dict]:         'parameters', 'input', 'geometry' (results)
+                                and 'gi_geometry'
+
+    """
+    job.progress(0.0, 'Checking input...')
+    check_input.geometry_input(parameters, parser_info)
+    job.check_cancelled()
+
+    job.progress(0.5, 'Calculating geometry...')
+    current_input = main.collect_input(parameters, parser_info)
+    # Calc geometry (update previous geometry, or load identical run from
+    # cache)
+    run_key = run_cache.run_hash(current_input, 'geometry')
+    cached_results = None
+    if gi_geometry is None:
+        cached_results = run_cache.get(run_key)
+    if cached_results:
+        geometry_results = cached_results['geometry']
+        main.update_from_results(parameters, geometry_results)
+    else:
+        logger.info("Calculationg geometry...")
+        if gi_geometry is None:
+            gi_geometry = geometry.Geometry(parameters)
+        else:
+            # Only recalculates what changed, on a copy: the GUI's geometry
+            # is replaced when the job finished (_finish_geometry)
+            gi_geometry = copy.deepcopy(gi_geometry)
+            gi_geometry.update(parameters)
+        geometry_results = gi_geometry.results
+        # Copy, parameters are changed by widgets
+        parameters = gi_geometry.update_parameters().copy()
+        logger.info("... done.")
+        run_cache.put(run_key, {'geometry': geometry_results})
+    job.progress(1.0, 'Geometry calculated.')
+
+    return dict(parameters=parameters, input=current_input,
+                geometry=geometry_results, gi_geometry=gi_geometry)
+
+
+def _material_job(job, materials_to_check, energy, look_up_table,
+                  photo_only):
+    """
+    Check if materials exist (in worker thread, may access the network).
+
+    Parameters
+    ==========
+
+    job [jobs.Job]
+    materials_to_check [list]
+    energy [float]:             [keV]
+    look_up_table [str]
+    photo_only [bool]
+
+    Returns
+    =======
+
+    checks [dict]:              checks[material] = error message, None if
+                                material exists
+
+    """
+    checks = dict()
+    for material in materials_to_check:
+        job.check_cancelled()
+        try:
+            materials.test_material(material, energy, look_up_table,
+                                    photo_only)
+            checks[material] = None
+        except materials.MaterialError as e:
+            checks[material] = str(e)
+    return checks
+
+
+def _on_main_thread(callback):
+    """
+    Dispatch callback of background job to the kivy main thread.
+    """
+    Clock.schedule_once(lambda dt: callback())
+
+
 # #############################################################################
 # Handle exceptions # #########################################################
 class _IgnoreExceptions(ExceptionHandler):
@@ -1090,16 +1220,32 @@ class giGUI(F.BoxLayout):
 
     setup_components = F.ListProperty()
     sample_added = False
+    _gi_geometry = None  # geometry.Geometry, updated incrementally
+    # Background jobs
+    job_running = F.BooleanProperty(defaultvalue=False)
+    job_progress = F.NumericProperty(0)
+    job_status = F.StringProperty()
     available_gratings = F.ListProperty()
 
     def __init__(self, **kwargs):
         super(giGUI, self).__init__(**kwargs)
-        self.parser_info = \
-            parser_def.get_arguments_info(parser_def.input_parser())
+        self.parser_info = parser_def.get_arguments_info()
         self.parser_link = dict()
         for var_name, value in self.parser_info.iteritems():
             self.parser_link[value[0]] = var_name
 
+        # Runs checks and calculations in background
+        self.jobs = jobs.JobExecutor(dispatch=_on_main_thread)
+
+        # Validate material input after typing paused (debounced)
+        self._material_checks = dict()  # [material, energy, lut, photo]: err
+        self._validation_trigger = Clock.create_trigger(self._validate_input,
+                                                        VALIDATION_DELAY)
+        for var_name in self._material_widgets() + ['design_energy',
+                                                    'look_up_table']:
+            self.ids[var_name].bind(text=self.request_validation)
+        self.ids.photo_only.bind(active=self.request_validation)
+
         # Update parameters
         _collect_widgets(self.parameters, self.ids)
         self.parameters['spectrum_file'] = None
@@ -1228,31 +1374,14 @@ class giGUI(F.BoxLayout):
         success = True
         try:
             # Update parameters
-            _collect_widgets(self.parameters, self.ids)
-
-            # Check values
-            logger.info("Checking geometry input parameters...")
-
-            # Are required (in parser) defined?
-            if not self.parameters['design_energy']:
-                error_message = "Input argument missing: 'design_energy' " \
-                                "('-e')."
-                logger.error(error_message)
-                raise check_input.InputError(error_message)
-            # Gratings types defined if selected?
-            for grating in ['g0', 'g1', 'g2']:
-                if self.ids[grating+'_set'].active and \
-                        not self.parameters['type_'+grating]:
-                    error_message = ("Type of {0} not defined."
-                                     .format(grating.upper()))
-                    logger.error(error_message)
-                    raise check_input.InputError(error_message)
+            self._check_geometry_widgets()
+            collected_parameters = self.parameters.copy()
 
             # Check rest
             check_input.geometry_input(self.parameters, self.parser_info)
 
-            # Update widget content
-            self._set_widgets(self.parameters, from_file=False)
+            # Update content of widgets changed by check
+            self._set_changed_widgets(collected_parameters)
 
             logger.info("... done.")
 
@@ -1262,49 +1391,112 @@ class giGUI(F.BoxLayout):
         finally:
             return success
 
+    def _check_geometry_widgets(self):
+        """
+        Load values from all widgets and check manually the required
+        parameters from parser (on main thread, the rest of the checks can
+        run in the background).
+        """
+        # Update parameters
+        _collect_widgets(self.parameters, self.ids)
+
+        # Check values
+        logger.info("Checking geometry input parameters...")
+
+        # Are required (in parser) defined?
+        if not self.parameters['design_energy']:
+            error_message = "Input argument missing: 'design_energy' " \
+                            "('-e')."
+            logger.error(error_message)
+            raise check_input.InputError(error_message)
+        # Gratings types defined if selected?
+        for grating in ['g0', 'g1', 'g2']:
+            if self.ids[grating+'_set'].active and \
+                    not self.parameters['type_'+grating]:
+                error_message = ("Type of {0} not defined."
+                                 .format(grating.upper()))
+                logger.error(error_message)
+                raise check_input.InputError(error_message)
+
     def calculate_geometry(self, switch_tab=False):
         """
         Calculate the GI geometry based on the set input parameters.
 
+        Input checks (including material look ups) and the calculation run in
+        the background (see _geometry_job), results are shown when done.
+
         Parameters
         ==========
 
         switch_tab [bool]:      Default is False, do not switch to geometry
                                 results tab
 
+        Notes
+        =====
+
+        Calling again before the calculation finished cancels the previous
+        calculation, only the latest one is shown.
+
         """
-        if self.check_geometry_input():
-            current_input = _collect_input(self.parameters, self.ids,
-                                           self.parser_info)
+        try:
+            self._check_geometry_widgets()
+        except check_input.InputError as e:
+            ErrorDisplay('Input Error', str(e))
+            return
+        # Widget values before check and calculation
+        collected_parameters = self.parameters.copy()
+        self._submit_job('geometry', _geometry_job,
+                         [self.parameters.copy(), self.parser_info,
+                          self._gi_geometry],
+                         on_done=partial(self._finish_geometry,
+                                         collected_parameters, switch_tab))
 
-            if (self.results['geometry'] and  # geometry must always be calc'ed
-                    main.compare_dictionaries(current_input,
-                                              self.results['input'])):
-                logger.info("Storing current results in previous_results...")
-                self.previous_results = self.results.copy()
-                logger.info("... done.")
+    def _finish_geometry(self, collected_parameters, switch_tab, job,
+                         job_results):
+        """
+        Store and show results of _geometry_job (on main thread).
 
-            # Reset results
-            self.results = main.reset_results()
+        Parameters
+        ==========
 
-            # Store input
-            self.results['input'] = current_input
-            # Calc geometry
-            try:
-                logger.info("Calculationg geometry...")
-                gi_geometry = geometry.Geometry(self.parameters)
-                self.results['geometry'] = gi_geometry.results
-                self.parameters = gi_geometry.update_parameters()
-                logger.info("... done.")
-            except geometry.GeometryError as e:
-                ErrorDisplay('Geometry Error', str(e))
+        collected_parameters [dict]:    parameters collected from widgets
+        switch_tab [bool]
+        job [jobs.Job]
+        job_results [dict]:             see _geometry_job
 
-            # Update geom results
-            self._set_widgets(self.parameters, from_file=False)
+        """
+        self._finish_job(job)
+        current_input = job_results['input']
+
+        if (self.results['geometry'] and  # geometry must always be calc'ed
+                main.compare_dictionaries(current_input,
+                                          self.results['input'])):
+            logger.info("Storing current results in previous_results...")
+            self.previous_results = self.results.copy()
+            logger.info("... done.")
+
+        previous_geometry = self.results['geometry']
+
+        # Reset results
+        self.results = main.reset_results()
+
+        # Store input and geometry
+        self.results['input'] = current_input
+        self.results['geometry'] = job_results['geometry']
+        self.parameters = job_results['parameters']
+        self._gi_geometry = job_results['gi_geometry']
+
+        # Update changed widgets and geom results
+        self._set_changed_widgets(collected_parameters)
+        if previous_geometry:
+            self.show_geometry(self.results,
+                               utilities.changed_keys(self.results['geometry'],
+                                                      previous_geometry))
+        else:
             self.show_geometry(self.results)
-            # Switch tabs
-            if switch_tab:
-                self.ids.result_tabs.switch_to(self.ids.geometry_results)
+        # Switch tabs
+        if switch_tab:
+            self.ids.result_tabs.switch_to(self.ids.geometry_results)
 
     def calculate_analytical(self, switch_tab=False):
         """
@@ -1331,6 +1523,145 @@ class giGUI(F.BoxLayout):
         """
         self.ids.result_tabs.switch_to(self.ids.simulation_results)
 
+    # #########################################################################
+    # Background jobs #########################################################
+
+    def _submit_job(self, name, function, args, on_done):
+        """
+        Run function in background, cancels previous job of same name.
+
+        Parameters
+        ==========
+
+        name [str]
+        function:           function(job, *args), must not access widgets
+        args [list]
+        on_done:            function(job, result), called on main thread
+
+        """
+        self.job_running = True
+        self.job_progress = 0
+        self.jobs.submit(name, function, args, on_done=on_done,
+                         on_error=self._job_failed,
+                         on_progress=self._show_job_progress)
+
+    def _finish_job(self, job):
+        """
+        Reset job status, if no other job is pending.
+        """
+        self.job_running = self.jobs.is_running()
+        if not self.job_running:
+            self.job_progress = 1
+            self.job_status = ''
+
+    def _job_failed(self, job, error):
+        """
+        Display error of background job.
+        """
+        self._finish_job(job)
+        if isinstance(error, check_input.InputError):
+            ErrorDisplay('Input Error', str(error))
+        elif isinstance(error, geometry.GeometryError):
+            ErrorDisplay('Geometry Error', str(error))
+        else:
+            logger.error("Job '{0}' failed: {1}".format(job.name, error))
+            ErrorDisplay('Error', '{0}: {1}'.format(type(error).__name__,
+                                                    error))
+
+    def _show_job_progress(self, job, fraction, message):
+        """
+        Show progress of background job.
+        """
+        self.job_progress = fraction
+        self.job_status = message
+
+    def cancel_jobs(self):
+        """
+        Cancel all running background jobs.
+        """
+        logger.info("Canceling calculations...")
+        self.jobs.cancel()
+        self.job_running = False
+        self.job_progress = 0
+        self.job_status = 'Canceled.'
+
+    # #########################################################################
+    # Input validation ########################################################
+
+    def request_validation(self, *args):
+        """
+        Validate input after VALIDATION_DELAY, restarts delay on every call,
+        so that changes while typing result in one validation.
+        """
+        self._validation_trigger.cancel()
+        self._validation_trigger()
+
+    def _validate_input(self, *args):
+        """
+        Check if entered materials exist. Results are cached, materials not
+        checked yet are looked up in the background (see _material_job).
+        """
+        try:
+            energy = float(self.ids.design_energy.text)
+        except ValueError:
+            return  # Materials depend on energy
+        look_up_table = self.ids.look_up_table.text.lower()
+        # Live widget state of parameters['photo_only'] (_collect_widgets)
+        photo_only = self.ids.photo_only.active
+        unchecked = set(self.ids[var_name].text
+                        for var_name in self._material_widgets()
+                        if self.ids[var_name].text)
+        unchecked = [material for material in unchecked
+                     if (material, energy, look_up_table, photo_only)
+                     not in self._material_checks]
+        if not unchecked:
+            self._show_material_checks()
+            return
+        logger.debug("Checking materials {0}...".format(unchecked))
+        self.jobs.submit('validation', _material_job,
+                         [unchecked, energy, look_up_table, photo_only],
+                         on_done=partial(self._store_material_checks, energy,
+                                         look_up_table, photo_only),
+                         on_error=self._job_failed)
+
+    def _store_material_checks(self, energy, look_up_table, photo_only, job,
+                               checks):
+        """
+        Cache results of _material_job and show them.
+        """
+        for material, error in checks.items():
+            self._material_checks[(material, energy, look_up_table,
+                                   photo_only)] = error
+        self._show_material_checks()
+
+    def _show_material_checks(self):
+        """
+        Mark material widgets with invalid (cached) materials.
+        """
+        try:
+            energy = float(self.ids.design_energy.text)
+        except ValueError:
+            return
+        look_up_table = self.ids.look_up_table.text.lower()
+        photo_only = self.ids.photo_only.active
+        for var_name in self._material_widgets():
+            material = self.ids[var_name].text
+            error = self._material_checks.get((material, energy,
+                                               look_up_table, photo_only))
+            if material and error:
+                logger.warning("Invalid material in '{0}': {1}"
+                               .format(var_name, error))
+                self.ids[var_name].foreground_color = INVALID_COLOR
+            else:
+                self.ids[var_name].foreground_color = VALID_COLOR
+
+    def _material_widgets(self):
+        """
+        Names of material input widgets.
+        """
+        return [var_name for var_name in self.parser_info
+                if 'material' in var_name and var_name in self.ids]
+
     def show_results(self, results):
         """
         Display all results by calling the corresponding functions.
@@ -1346,7 +1677,7 @@ class giGUI(F.BoxLayout):
 #        elif 'analytical' in results:
 #            self.show_analytical(results)
 
-    def show_geometry(self, results):
+    def show_geometry(self, results, changed_results=None):
         """
         Display the GI geometry results. Updates sketch and updates
         distances and gratings result info.
@@ -1355,17 +1686,39 @@ class giGUI(F.BoxLayout):
         ==========
 
         results [dict]:         can be self.results or self.previous_results
+        changed_results [list]: keys of changed geometry results, only
+                                redraw affected tables. Default is None (all)
 
         """
-        geometry_results = results['geometry'].copy()
-        component_list = geometry_results['component_list']
-
+        if changed_results is not None and not changed_results:
+            return
         # Update sketch
-        self.ids.geometry_sketch.update_geometry(geometry_results)
+        self.ids.geometry_sketch.update_geometry(results['geometry'].copy())
 
-        # Clear geometry result tables
+        if changed_results is None or \
+                any(key.startswith(('pitch_', 'duty_cycle_', 'radius_')) or
+                    key in ['component_list', 'dual_phase']
+                    for key in changed_results):
+            self._show_grating_results(results)
+        if changed_results is None or \
+                any('distance' in key or key.startswith('sample_') or
+                    key in ['component_list', 'gi_geometry']
+                    for key in changed_results):
+            self._show_distance_results(results)
+
+    def _show_grating_results(self, results):
+        """
+        Display pitches, duty cycles and radii of gratings.
+
+        Parameters
+        ==========
+
+        results [dict]
+
+        """
+        geometry_results = results['geometry'].copy()
+        component_list = geometry_results['component_list']
         self.ids.grating_results.clear_widgets()
-        self.ids.distances_results.clear_widgets()
 
         # Show gratings results
         gratings = [gratings for gratings
@@ -1418,6 +1771,20 @@ class giGUI(F.BoxLayout):
             self.calc_boxlayout_height(LINE_HEIGHT,
                                        self.ids.grating_results)
 
+    def _show_distance_results(self, results):
+        """
+        Display distances between components.
+
+        Parameters
+        ==========
+
+        results [dict]
+
+        """
+        geometry_results = results['geometry'].copy()
+        component_list = geometry_results['component_list']
+        self.ids.distances_results.clear_widgets()
+
         # Show distances
         if geometry_results['gi_geometry'] != 'free':
             # Show d, l, s first
@@ -1703,8 +2070,8 @@ class giGUI(F.BoxLayout):
                         self._set_widgets(sub_dict, from_file=True)
                     except check_input.InputError as e:
                         ErrorDisplay('Input Error', str(e))
-                else:
-                    # .mat
+                elif dict_name == 'geometry':
+                    # Other results are loaded lazily and have no widgets
                     self._set_widgets(sub_dict, from_file=False)
             # Update parameters
             _collect_widgets(self.parameters, self.ids)
@@ -1859,6 +2226,7 @@ class giGUI(F.BoxLayout):
         spectra_path = os.path.join(os.path.dirname(os.path.
                                                     realpath(__file__)),
                                     'data', 'spectra')
+        from kivy.garden.filebrowser import FileBrowser
         browser = FileBrowser(select_string='Select',
                               path=spectra_path,  # Folder to open at start
                               filters=['*.csv', '*.txt'])
@@ -1897,6 +2265,7 @@ class giGUI(F.BoxLayout):
         input_path = os.path.join(os.path.dirname(os.path.
                                                   realpath(__file__)),
                                   'data', 'inputs')
+        from kivy.garden.filebrowser import FileBrowser
         browser = FileBrowser(select_string='Select',
                               multiselect=True,
                               path=input_path,  # Folder to open at start
@@ -1934,6 +2303,7 @@ class giGUI(F.BoxLayout):
         input_path = os.path.join(os.path.dirname(os.path.
                                                   realpath(__file__)),
                                   'data', 'inputs')
+        from kivy.garden.filebrowser import FileBrowser
         browser = FileBrowser(select_string='Save',
                               path=input_path,  # Folder to open at start
                               filters=['*.txt'])
@@ -1974,6 +2344,58 @@ class giGUI(F.BoxLayout):
 
     # Results
 
+    # Catalog
+    def find_results(self, conditions, results_path=None):
+        """
+        Update results catalog and find all result folders matching the
+        conditions (see simulation.catalog).
+
+        Parameters
+        ==========
+
+        conditions [list]:      e.g. ['gi_geometry=conv', 'pitch_g1<3']
+        results_path [str]:     default is None (./data/results/)
+
+        Returns
+        =======
+
+        folders [list]:         None if the conditions are invalid
+
+        """
+        if results_path is None:
+            results_path = os.path.join(os.path.dirname(os.path.
+                                                        realpath(__file__)),
+                                        'data', 'results')
+        try:
+            catalog.update(results_path)
+            folders = catalog.query(conditions, results_path)
+        except catalog.CatalogError as e:
+            ErrorDisplay('Catalog Error', str(e))
+            return None
+        logger.info("Found {0} matching result folders:\n{1}"
+                    .format(len(folders), '\n'.join(folders)))
+        return folders
+
+    def search_results(self):
+        """
+        Find result folders matching the (comma separated) conditions of the
+        results query and show them.
+        """
+        conditions = [condition.strip() for condition
+                      in self.ids.results_query.text.split(',')
+                      if condition.strip()]
+        folders = self.find_results(conditions)
+        if folders is None:
+            return  # Error is displayed
+        if folders:
+            message = '\n'.join(os.path.basename(folder)
+                                for folder in folders)
+        else:
+            message = 'No matching results.'
+        results_popup = _OKPopupWindow("Results: {0}".format(
+            ', '.join(conditions) or 'all'), message)
+        results_popup.popup.open()
+
     # Loading
     def show_results_load(self):
         """
@@ -1993,6 +2415,7 @@ class giGUI(F.BoxLayout):
         results_path = os.path.join(os.path.dirname(os.path.
                                                     realpath(__file__)),
                                     'data', 'results')
+        from kivy.garden.filebrowser import FileBrowser
         browser = FileBrowser(select_string='Select',
                               dirselect=True,
                               path=results_path,  # Folder to open at start
@@ -2031,6 +2454,7 @@ class giGUI(F.BoxLayout):
         results_path = os.path.join(os.path.dirname(os.path.
                                                     realpath(__file__)),
                                     'data', 'results')
+        from kivy.garden.filebrowser import FileBrowser
         browser = FileBrowser(select_string='Save',
                               dirselect=True,
                               path=results_path,  # Folder to open at start
@@ -2843,6 +3267,25 @@ class giGUI(F.BoxLayout):
             logger.error(error_message)
             raise check_input.InputError(error_message)
 
+    def _set_changed_widgets(self, previous_parameters):
+        """
+        Update content of widgets, whose parameters changed compared to
+        previous_parameters.
+
+        Parameters
+        ==========
+
+        previous_parameters [dict]
+
+        """
+        changed_parameters = {var_name: self.parameters[var_name]
+                              for var_name
+                              in utilities.changed_keys(self.parameters,
+                                                        previous_parameters)
+                              if var_name in self.parameters}
+        if changed_parameters:
+            self._set_widgets(changed_parameters, from_file=False)
+
     # Clear widgets
     def reset_input(self):
         """
@@ -3041,6 +3484,9 @@ class giGUIApp(App):
         self.title = 'GI Simumlation'
         return giGUI()  # Main widget, root
 
+    def on_stop(self):
+        self.root.jobs.shutdown()
+
 # %% Main
 
 if __name__ == '__main__':
@@ -0,0 +1,569 @@
+"""
+Module to run campaigns (parameter sweeps, CT angles) on several hosts: a
+coordinator expands the campaign into tasks, workers (on any host, which
+mounts the campaign folder) claim tasks from a file system queue, calculate
+them and write their results to the campaign's results folder.
+
+Classes
+=======
+
+CampaignError:  Raised for invalid campaign definitions.
+
+Functions
+=========
+
+expand:         Expand input file, sweeps and CT angles into tasks.
+                Parameters:
+                    input_file_path [str]
+                    sweeps [list] (default None)
+                    number_projections [int] (default None)
+                    angular_range [deg] (default 360)
+
+create:         Create campaign folder and queue all tasks which are not
+                queued or finished yet.
+                Parameters:
+                    campaign_path [str]
+                    input_file_path [str]
+                    sweeps [list] (default None)
+                    number_projections [int] (default None)
+                    angular_range [deg] (default 360)
+
+work:           Claim and run tasks until the queue is empty.
+                Parameters:
+                    campaign_path [str]
+                    lease_time [s] (default LEASE_TIME)
+                    max_tasks [int] (default None)
+
+requeue:        Queue expired (or all) running tasks and failed tasks again.
+                Parameters:
+                    campaign_path [str]
+                    lease_time [s] (default LEASE_TIME)
+                    failed [boolean] (default False)
+
+status:         Number of tasks per state.
+                Parameters:
+                    campaign_path [str]
+
+Usage
+=====
+
+From gisimulation folder, coordinator:
+
+python -m simulation.campaign create CAMPAIGN_DIR -i input.txt
+    -s design_energy 25 35 45 -s talbot_order 1 3 [-ct 180 [-ar 360]]
+
+Workers (on every host, or -np to start several local worker processes):
+
+python -m simulation.campaign work CAMPAIGN_DIR [-np 4] [-l 60]
+
+Status and resume (e.g. after all workers were killed):
+
+python -m simulation.campaign status CAMPAIGN_DIR
+python -m simulation.campaign requeue CAMPAIGN_DIR [--all] [--failed]
+
+Notes
+=====
+
+Campaign folder:
+    campaign.json:          definition (input arguments, sweeps, angles)
+    tasks/pending/<id>.json
+    tasks/running/<id>.json
+    tasks/done/<id>.json
+    tasks/failed/<id>.json  (with error message)
+    results/<id>/           main.save_results folder ('npy' format)
+
+The input file has the same format as parser_def reads ('@file', one
+argument or value per line). Sweeps ([var_name, values]) are combined as
+cartesian product, every combination is appended to the input arguments
+(the last occurrence of an argument is used by argparse). With CT, every
+combination is repeated for all projection angles, the angle is stored in
+results/<id>/campaign.npyd.
+
+Tasks are claimed by renaming them from pending/ to running/, which is atomic
+on one file system (local and NFS), so every task is run by one worker only.
+Workers touch their running task every lease_time/4 (heartbeat). Running
+tasks older than lease_time belong to crashed workers and are requeued by
+idle workers (and by requeue). A task is moved to done/ only after its
+results are written, thus a killed campaign is resumed by calling create
+(adds missing tasks only) or requeue and starting workers again: finished
+tasks are not calculated again.
+
+A TCP queue is not necessary as long as all hosts mount the campaign folder,
+which they need for the results anyway.
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import sys
+import json
+import time
+import socket
+import itertools
+import threading
+import multiprocessing
+import numpy as np
+import simulation.utilities as utilities
+import simulation.parser_def as parser_def
+import logging
+logger = utilities.get_logger(__name__)
+
+LEASE_TIME = 60  # [s]
+POLL_INTERVAL = 1  # [s]
+STATES = ['pending', 'running', 'done', 'failed']
+RESULTS_FORMAT = 'npy'
+_CAMPAIGN_FILE = 'campaign.json'
+
+# %% Classes
+
+
+class CampaignError(Exception):
+    """
+    Error is raised, if the campaign definition is invalid or does not match
+    the existing campaign.
+    """
+
+# %% Functions
+
+
+def expand(input_file_path, sweeps=None, number_projections=None,
+           angular_range=360):
+    """
+    Expand input file, sweeps and CT angles into tasks.
+
+    Parameters
+    ==========
+
+    input_file_path [str]:      input file ('@file' format)
+    sweeps [list]:              [[var_name, [value, ...]], ...], default is
+                                None
+    number_projections [int]:   CT angles per sweep point, default is None
+                                (no CT)
+    angular_range [deg]:        default is 360
+
+    Returns
+    =======
+
+    tasks [list]:               [{'id': str, 'arguments': [str, ...],
+                                  'sweep': {var_name: value},
+                                  'angle': [deg] or None}, ...]
+
+    """
+    parser_info = parser_def.get_arguments_info()
+    sweeps = sweeps or []
+    for [var_name, values] in sweeps:
+        if var_name not in parser_info:
+            error_message = ("Sweep parameter '{0}' is not an input "
+                             "parameter.".format(var_name))
+            logger.error(error_message)
+            raise CampaignError(error_message)
+        if not values:
+            error_message = ("Sweep parameter '{0}' has no values."
+                             .format(var_name))
+            logger.error(error_message)
+            raise CampaignError(error_message)
+    with open(input_file_path) as f:
+        arguments = [line.strip() for line in f if line.strip()]
+    if number_projections:
+        angles = list(np.linspace(0, angular_range, number_projections,
+                                  endpoint=False))
+    else:
+        angles = [None]
+
+    tasks = []
+    names = [var_name for [var_name, _] in sweeps]
+    combinations = itertools.product(*[values for [_, values] in sweeps])
+    for combination in combinations:
+        sweep_arguments = []
+        for var_name, value in zip(names, combination):
+            sweep_arguments += [parser_info[var_name][0], str(value)]
+        for angle in angles:
+            tasks.append({'id': '{0:06d}'.format(len(tasks)),
+                          'arguments': arguments + sweep_arguments,
+                          'sweep': dict(zip(names, combination)),
+                          'angle': None if angle is None else float(angle)})
+    logger.info("Campaign expanded into {0} tasks.", len(tasks))
+    return tasks
+
+
+def create(campaign_path, input_file_path, sweeps=None,
+           number_projections=None, angular_range=360):
+    """
+    Create campaign folder and queue all tasks, which are not in the queue
+    yet (in any state). Calling create again with the same definition resumes
+    an interrupted creation, a different definition raises CampaignError.
+
+    Parameters
+    ==========
+
+    campaign_path [str]
+    input_file_path [str]:      see expand()
+    sweeps [list]:              see expand(), default is None
+    number_projections [int]:   default is None
+    angular_range [deg]:        default is 360
+
+    Returns
+    =======
+
+    number_queued [int]:        number of newly queued tasks
+
+    """
+    tasks = expand(input_file_path, sweeps, number_projections,
+                   angular_range)
+    definition = {'tasks': [[task['arguments'], task['angle']]
+                            for task in tasks]}
+    campaign_file_path = os.path.join(campaign_path, _CAMPAIGN_FILE)
+    if os.path.isfile(campaign_file_path):
+        with open(campaign_file_path) as f:
+            if json.load(f) != json.loads(json.dumps(definition)):
+                error_message = ("Campaign '{0}' exists with a different "
+                                 "definition.".format(campaign_path))
+                logger.error(error_message)
+                raise CampaignError(error_message)
+    else:
+        for state in STATES:
+            _makedirs(_state_path(campaign_path, state))
+        _makedirs(os.path.join(campaign_path, 'results'))
+        _write_json(campaign_file_path, definition)
+
+    existing = set()
+    for state in STATES:
+        existing.update(_task_ids(campaign_path, state))
+    number_queued = 0
+    for task in tasks:
+        if task['id'] not in existing:
+            _write_json(_task_path(campaign_path, 'pending', task['id']),
+                        task)
+            number_queued += 1
+    logger.info("{0} tasks queued ({1} already in campaign).", number_queued,
+                len(tasks) - number_queued)
+    return number_queued
+
+
+def work(campaign_path, lease_time=LEASE_TIME, max_tasks=None):
+    """
+    Claim and run tasks until no tasks are pending or running (tasks of
+    other workers are waited for, since they are requeued if their worker
+    crashed).
+
+    Parameters
+    ==========
+
+    campaign_path [str]
+    lease_time [s]:     running tasks without heartbeat for lease_time are
+                        requeued, default is LEASE_TIME
+    max_tasks [int]:    stop after max_tasks, default is None (all)
+
+    Returns
+    =======
+
+    number_done [int]:  tasks finished by this worker
+
+    """
+    worker = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+    logger.info("Worker {0} started on '{1}'.", worker, campaign_path)
+    number_done = 0
+    while max_tasks is None or number_done < max_tasks:
+        task = _claim(campaign_path, worker)
+        if task is None:
+            requeue(campaign_path, lease_time)
+            task = _claim(campaign_path, worker)
+        if task is None:
+            if not _task_ids(campaign_path, 'running'):
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+        running_path = _task_path(campaign_path, 'running', task['id'])
+        heartbeat = _Heartbeat(running_path, lease_time/4.0)
+        heartbeat.start()
+        try:
+            _run_task(campaign_path, task)
+        except (Exception, SystemExit) as e:
+            heartbeat.stop()
+            task['error'] = '{0}: {1}'.format(type(e).__name__, e)
+            logger.warning("Task {0} failed ({1}).", task['id'],
+                           task['error'])
+            _finish(campaign_path, task, 'failed')
+            continue
+        heartbeat.stop()
+        _finish(campaign_path, task, 'done')
+        number_done += 1
+    logger.info("Worker {0} finished {1} tasks.", worker, number_done)
+    return number_done
+
+
+def requeue(campaign_path, lease_time=LEASE_TIME, failed=False):
+    """
+    Queue running tasks without heartbeat for lease_time (crashed workers)
+    and optionally failed tasks again.
+
+    Parameters
+    ==========
+
+    campaign_path [str]
+    lease_time [s]:     default is LEASE_TIME, 0 requeues all running tasks
+                        (only if no workers are running)
+    failed [boolean]:   requeue failed tasks, default is False
+
+    Returns
+    =======
+
+    number_requeued [int]
+
+    """
+    now = time.time()
+    states = ['running', 'failed'] if failed else ['running']
+    number_requeued = 0
+    for state in states:
+        for task_id in _task_ids(campaign_path, state):
+            task_path = _task_path(campaign_path, state, task_id)
+            try:
+                if state == 'running' and \
+                        now - os.path.getmtime(task_path) < lease_time:
+                    continue
+                os.rename(task_path, _task_path(campaign_path, 'pending',
+                                                task_id))
+            except OSError:
+                continue  # Finished or requeued by other worker
+            logger.info("Task {0} ({1}) requeued.", task_id, state)
+            number_requeued += 1
+    return number_requeued
+
+
+def status(campaign_path):
+    """
+    Number of tasks per state.
+
+    Parameters
+    ==========
+
+    campaign_path [str]
+
+    Returns
+    =======
+
+    counts [dict]:      counts[state] = number of tasks
+
+    """
+    return {state: len(_task_ids(campaign_path, state)) for state in STATES}
+
+# %% Private utilities
+
+
+class _Heartbeat(object):
+    """
+    Touches file every interval [s] in a background thread.
+    """
+    def __init__(self, file_path, interval):
+        self._file_path = file_path
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                os.utime(self._file_path, None)
+            except OSError:
+                return  # Requeued
+
+
+def _claim(campaign_path, worker):
+    """
+    Claim first pending task (atomic rename to running/), None if there is
+    none.
+    """
+    for task_id in _task_ids(campaign_path, 'pending'):
+        running_path = _task_path(campaign_path, 'running', task_id)
+        try:
+            os.rename(_task_path(campaign_path, 'pending', task_id),
+                      running_path)
+        except OSError:
+            continue  # Claimed by other worker
+        os.utime(running_path, None)  # Lease starts now
+        with open(running_path) as f:
+            task = json.load(f)
+        task['worker'] = worker
+        task.pop('error', None)
+        logger.debug("Task {0} claimed by {1}.", task_id, worker)
+        return task
+    return None
+
+
+def _finish(campaign_path, task, state):
+    """
+    Move running task to done/ or failed/ (with worker and error).
+    """
+    running_path = _task_path(campaign_path, 'running', task['id'])
+    state_path = _task_path(campaign_path, state, task['id'])
+    # Move first: if the lease expired, the running file is gone (requeued)
+    try:
+        os.rename(running_path, state_path)
+    except OSError:
+        logger.warning("Task {0} was requeued while running (lease "
+                       "expired).", task['id'])
+        return
+    _write_json(state_path, task)
+
+
+def _run_task(campaign_path, task):
+    """
+    Calculate task and save its results (replacing results of a previous,
+    interrupted run).
+    """
+    import main
+    parser = parser_def.input_parser(main.NUMERICAL_TYPE)
+    parser_info = parser_def.get_arguments_info(parser)
+    # JSON strings are unicode in python 2, parser types expect str
+    parameters = vars(parser.parse_args([str(argument) for argument
+                                         in task['arguments']]))
+    results = main.reset_results()
+    logger.info("Running task {0} ({1})...", task['id'], task['sweep'])
+    main.calculate_geometry(parameters, parser_info, results)
+    results['campaign'] = {'task': task['id']}
+    if task['angle'] is not None:
+        results['campaign']['angle'] = task['angle']
+    main.save_results(os.path.join(campaign_path, 'results', task['id']),
+                      results, overwrite=True, file_format=RESULTS_FORMAT)
+    logger.info("... done.")
+
+
+def _state_path(campaign_path, state):
+    return os.path.join(campaign_path, 'tasks', state)
+
+
+def _task_path(campaign_path, state, task_id):
+    return os.path.join(_state_path(campaign_path, state), task_id + '.json')
+
+
+def _task_ids(campaign_path, state):
+    """
+    Sorted task ids in state.
+    """
+    try:
+        file_names = os.listdir(_state_path(campaign_path, state))
+    except OSError:
+        error_message = ("'{0}' is not a campaign folder."
+                         .format(campaign_path))
+        logger.error(error_message)
+        raise CampaignError(error_message)
+    return sorted(os.path.splitext(file_name)[0] for file_name in file_names
+                  if file_name.endswith('.json'))
+
+
+def _write_json(file_path, data):
+    """
+    Write atomically (temporary file and rename), so that readers never see
+    partial files.
+    """
+    temporary_path = '{0}.{1}.tmp'.format(file_path, os.getpid())
+    with open(temporary_path, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.rename(temporary_path, file_path)
+
+
+def _makedirs(folder_path):
+    if not os.path.isdir(folder_path):
+        os.makedirs(folder_path)
+
+
+def _parse_value_list(text):
+    """
+    'start:stop:step' (stop included) or single value.
+    """
+    if text.count(':') == 2:
+        [start, stop, step] = [float(value) for value in text.split(':')]
+        return ['{0:.12g}'.format(value)
+                for value in np.arange(start, stop + step/2.0, step)]
+    return [text]
+
+# %% Main
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Run sweeps and CT "
+                                     "campaigns with workers on several "
+                                     "hosts (shared campaign folder).")
+    parser.add_argument('-v', dest='verbose', action='count',
+                        help="See main.py.")
+    subparsers = parser.add_subparsers(dest='command')
+    create_parser = subparsers.add_parser('create', help="Create campaign "
+                                          "or queue missing tasks.")
+    create_parser.add_argument('campaign_path')
+    create_parser.add_argument('-i', dest='input_file_path', required=True,
+                               help="Input file, as for main.py @file.")
+    create_parser.add_argument('-s', dest='sweeps', nargs='+',
+                               action='append', default=[],
+                               metavar=('VAR_NAME', 'VALUE'),
+                               help="Sweep parameter (name as in "
+                               "parser_def) and values or start:stop:step. "
+                               "Can be used multiple times.")
+    create_parser.add_argument('-ct', dest='number_projections', type=int,
+                               help="Number of CT angles per sweep point.")
+    create_parser.add_argument('-ar', dest='angular_range', type=float,
+                               default=360, help="CT angular range [deg].")
+    work_parser = subparsers.add_parser('work', help="Run worker(s).")
+    work_parser.add_argument('campaign_path')
+    work_parser.add_argument('-np', dest='number_workers', type=int,
+                             default=1, help="Local worker processes.")
+    work_parser.add_argument('-l', dest='lease_time', type=float,
+                             default=LEASE_TIME,
+                             help="Requeue running tasks without heartbeat "
+                             "after LEASE_TIME [s].")
+    work_parser.add_argument('-m', dest='max_tasks', type=int,
+                             help="Stop each worker after MAX_TASKS.")
+    requeue_parser = subparsers.add_parser('requeue', help="Requeue tasks of "
+                                           "crashed workers.")
+    requeue_parser.add_argument('campaign_path')
+    requeue_parser.add_argument('--all', dest='all', action='store_true',
+                                help="Requeue all running tasks (no workers "
+                                "must be running).")
+    requeue_parser.add_argument('--failed', dest='failed',
+                                action='store_true',
+                                help="Requeue failed tasks.")
+    status_parser = subparsers.add_parser('status', help="Tasks per state.")
+    status_parser.add_argument('campaign_path')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=utilities.get_logger_level(arguments.verbose),
+                        format='%(asctime)s - %(processName)s - '
+                        '%(levelname)s - %(message)s')
+
+    try:
+        if arguments.command == 'create':
+            sweeps = [[sweep[0], [value for text in sweep[1:]
+                                  for value in _parse_value_list(text)]]
+                      for sweep in arguments.sweeps]
+            create(arguments.campaign_path, arguments.input_file_path,
+                   sweeps, arguments.number_projections,
+                   arguments.angular_range)
+        elif arguments.command == 'work':
+            if arguments.number_workers > 1:
+                workers = [multiprocessing.Process(
+                               target=work,
+                               args=(arguments.campaign_path,
+                                     arguments.lease_time,
+                                     arguments.max_tasks))
+                           for _ in range(arguments.number_workers)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            else:
+                work(arguments.campaign_path, arguments.lease_time,
+                     arguments.max_tasks)
+        elif arguments.command == 'requeue':
+            requeue(arguments.campaign_path,
+                    0 if arguments.all else LEASE_TIME, arguments.failed)
+        counts = status(arguments.campaign_path)
+        print(", ".join("{0}: {1}".format(state, counts[state])
+                        for state in STATES))
+    except CampaignError:
+        sys.exit(2)
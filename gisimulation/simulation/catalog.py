@@ -0,0 +1,403 @@
+"""
+Module to index result folders (input parameters and scalar results) in a
+local SQLite database, to query runs by parameters without opening every
+result file.
+
+Functions
+=========
+
+update:         Index new and changed result folders, remove deleted ones.
+                Parameters:
+                    results_root [str]
+                    database_path [str] (default None)
+
+query:          Find result folders matching all conditions.
+                Parameters:
+                    conditions [list of str or tuples]
+                    results_root [str]
+                    database_path [str] (default None)
+
+values:         Indexed values of a result folder.
+                Parameters:
+                    folder [str]
+                    results_root [str]
+                    database_path [str] (default None)
+
+Usage
+=====
+
+From gisimulation folder:
+
+python -m simulation.catalog data/results -q "gi_geometry=inv" -q "pitch_g1<3"
+
+Notes
+=====
+
+Database (default: <results_root>/catalog.sqlite):
+
+    folders(folder, mtime):     folder path relative to results_root, mtime is
+                                the latest mtime of the folder and its files
+    entries(folder, name, value_text, value_number):
+                                input parameters (by variable name, e.g.
+                                'pitch_g1') and scalar results (e.g.
+                                'distance_g1_g2') of folder. value_number is
+                                NULL for non-numerical values, booleans are
+                                stored as 1/0.
+
+Results and input parameters share names, results overwrite input (e.g.
+calculated distances).
+
+Conditions: 'name<op>value' or (name, op, value), with op one of
+    =, !=, <, <=, >, >=
+Numerical values are compared numerically, all others as text (= and !=).
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import re
+import sqlite3
+import argparse
+import numpy as np
+import simulation.parser_def as parser_def
+import simulation.results_store as results_store
+import logging
+logger = logging.getLogger(__name__)
+
+DATABASE_NAME = 'catalog.sqlite'
+OPERATORS = ['=', '!=', '<', '<=', '>', '>=']
+_CONDITION_PATTERN = re.compile(r'^\s*(\w+)\s*(<=|>=|!=|=|<|>)\s*(.+?)\s*$')
+
+# %% Classes
+
+
+class CatalogError(Exception):
+    """
+    Error is raised, if catalog query is invalid.
+    """
+
+# %% Functions
+
+
+def update(results_root, database_path=None):
+    """
+    Index new and changed result folders, remove deleted ones.
+
+    Parameters
+    ==========
+
+    results_root [str]:         folder containing result folders
+    database_path [str]:        default is None (<results_root>/catalog.sqlite)
+
+    Returns
+    =======
+
+    [number_updated, number_removed]
+
+    """
+    connection = _connect(results_root, database_path)
+    with connection:
+        indexed = dict(connection.execute("SELECT folder, mtime "
+                                          "FROM folders"))
+        folders = [folder for folder in os.listdir(results_root)
+                   if os.path.isdir(os.path.join(results_root, folder))]
+        number_updated = 0
+        for folder in folders:
+            folder_path = os.path.join(results_root, folder)
+            mtime = _latest_mtime(folder_path)
+            if indexed.get(folder) == mtime:
+                continue
+            logger.debug("Indexing {0}...".format(folder_path))
+            entries = _collect_entries(folder_path)
+            connection.execute("DELETE FROM entries WHERE folder=?",
+                               (folder,))
+            connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?)",
+                                   [(folder, name) + _to_columns(value)
+                                    for name, value in entries.items()])
+            connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?)",
+                               (folder, mtime))
+            number_updated += 1
+        removed = [(folder,) for folder in indexed if folder not in folders]
+        connection.executemany("DELETE FROM entries WHERE folder=?", removed)
+        connection.executemany("DELETE FROM folders WHERE folder=?", removed)
+    connection.close()
+    logger.info("Catalog of {0}: {1} folders updated, {2} removed."
+                .format(results_root, number_updated, len(removed)))
+    return [number_updated, len(removed)]
+
+
+def query(conditions, results_root, database_path=None):
+    """
+    Find result folders matching all conditions.
+
+    Parameters
+    ==========
+
+    conditions [list]:      'name<op>value' strings or (name, op, value)
+    results_root [str]
+    database_path [str]:    default is None (<results_root>/catalog.sqlite)
+
+    Returns
+    =======
+
+    folders [list]:         sorted paths of matching result folders
+
+    """
+    sql = "SELECT folder FROM folders"
+    clauses = []
+    arguments = []
+    for condition in conditions:
+        [name, operator, value] = _parse_condition(condition)
+        number = _to_number(value)
+        if number is not None:
+            clauses.append("folder IN (SELECT folder FROM entries WHERE "
+                           "name=? AND value_number {0} ?)".format(operator))
+            arguments.extend([name, number])
+        elif operator in ['=', '!=']:
+            clauses.append("folder IN (SELECT folder FROM entries WHERE "
+                           "name=? AND value_text {0} ?)".format(operator))
+            arguments.extend([name, str(value)])
+        else:
+            error_message = ("Operator '{0}' requires a numerical value, "
+                             "'{1}' given.".format(operator, value))
+            logger.error(error_message)
+            raise CatalogError(error_message)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY folder"
+
+    connection = _connect(results_root, database_path)
+    folders = [os.path.join(results_root, row[0])
+               for row in connection.execute(sql, arguments)]
+    connection.close()
+    return folders
+
+
+def values(folder, results_root, database_path=None):
+    """
+    Indexed values of a result folder.
+
+    Parameters
+    ==========
+
+    folder [str]:           name of result folder
+    results_root [str]
+    database_path [str]:    default is None (<results_root>/catalog.sqlite)
+
+    Returns
+    =======
+
+    entries [dict]:         entries[name] = value (number if numerical, else
+                            text)
+
+    """
+    connection = _connect(results_root, database_path)
+    entries = {str(name): (value_number if value_number is not None
+                           else str(value_text))
+               for [name, value_text, value_number]
+               in connection.execute("SELECT name, value_text, value_number "
+                                     "FROM entries WHERE folder=?",
+                                     (os.path.basename(folder),))}
+    connection.close()
+    return entries
+
+# %% Private utilities
+
+
+def _connect(results_root, database_path):
+    """
+    Connect to database and create tables if necessary.
+    """
+    if database_path is None:
+        database_path = os.path.join(results_root, DATABASE_NAME)
+    connection = sqlite3.connect(database_path)
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS folders "
+                           "(folder TEXT PRIMARY KEY, mtime REAL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS entries "
+                           "(folder TEXT, name TEXT, value_text TEXT, "
+                           "value_number REAL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_number "
+                           "ON entries (name, value_number)")
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_text "
+                           "ON entries (name, value_text)")
+    return connection
+
+
+def _latest_mtime(folder_path):
+    """
+    Latest mtime of folder and the files in it (files can be overwritten
+    without changing the folder mtime).
+    """
+    mtimes = [os.stat(folder_path).st_mtime]
+    mtimes.extend(os.stat(os.path.join(folder_path, file_)).st_mtime
+                  for file_ in os.listdir(folder_path))
+    return max(mtimes)
+
+
+def _collect_entries(folder_path):
+    """
+    Read input parameters and scalar results of result folder. Only scalars
+    (and strings) are read, their shapes are checked first.
+    """
+    entries = dict()
+    for file_ in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, file_)
+        if file_.endswith('_input.txt'):
+            entries.update(_read_input_file(file_path))
+    for file_ in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, file_)
+        extension = os.path.splitext(file_)[1]
+        try:
+            if extension == '.mat':
+                results = _read_mat_scalars(file_path)
+            elif extension in results_store.EXTENSIONS.values():
+                results = _read_store_scalars(file_path)
+            else:
+                continue
+        except Exception as e:
+            logger.warning("Could not read {0}, skipping: {1}"
+                           .format(file_path, e))
+            continue
+        for name in results:
+            if name.startswith('__'):
+                continue
+            value = results[name]
+            if isinstance(value, np.ndarray):
+                if value.size != 1:
+                    continue  # Only scalar results
+                value = value.item()
+            if value is None or isinstance(value, (list, dict)):
+                continue
+            entries[str(name)] = value
+    return entries
+
+
+def _read_mat_scalars(file_path):
+    """
+    Read scalar and string variables of .mat file (see scipy.io.whosmat).
+    """
+    import scipy.io
+    variable_names = [name for [name, shape, class_]
+                      in scipy.io.whosmat(file_path)
+                      if int(np.prod(shape)) == 1 or
+                      (class_ == 'char' and len(shape) == 2 and
+                       shape[0] == 1)]
+    if not variable_names:
+        return dict()
+    return scipy.io.loadmat(file_path, variable_names=variable_names,
+                            squeeze_me=True, chars_as_strings=True)
+
+
+def _read_store_scalars(file_path):
+    """
+    Read attributes and single element datasets of results store (see
+    results_store.shapes).
+    """
+    shapes = results_store.shapes(file_path)
+    return {key: results_store.read_dataset(file_path, key)
+            for key in results_store.keys(file_path)
+            if key not in shapes or int(np.prod(shapes[key])) == 1}
+
+
+def _read_input_file(input_file_path):
+    """
+    Read input file (see main.save_input) into dict of variable names and
+    values (str, multiple values joined by ' ', flags are True).
+    """
+    parser_link = {var_key: var_name for var_name, [var_key, _]
+                   in parser_def.get_arguments_info().items()}
+    with open(input_file_path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    entries = dict()
+    var_key = None
+    for line in lines:
+        if line.startswith('-') and _to_number(line) is None:
+            var_key = line
+            entries[var_key] = []
+        elif var_key is not None:
+            entries[var_key].append(line)
+    return {parser_link.get(var_key, var_key.lstrip('-')):
+            ' '.join(value) if value else True
+            for var_key, value in entries.items()}
+
+
+def _to_columns(value):
+    """
+    Convert value to (value_text, value_number).
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return (str(bool(value)), int(value))
+    number = _to_number(value)
+    if isinstance(value, (str, type(u''))):
+        if value in ['True', 'False']:
+            return (value, int(value == 'True'))
+        return (value, number)
+    return (str(value), number)
+
+
+def _to_number(value):
+    """
+    Convert to float, None if not numerical.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_condition(condition):
+    """
+    Parse 'name<op>value' string or check (name, op, value).
+    """
+    if isinstance(condition, (list, tuple)):
+        [name, operator, value] = condition
+    else:
+        match = _CONDITION_PATTERN.match(condition)
+        if not match:
+            error_message = ("Condition '{0}' must be 'name<op>value', with "
+                             "op one of {1}.".format(condition, OPERATORS))
+            logger.error(error_message)
+            raise CatalogError(error_message)
+        [name, operator, value] = match.groups()
+    if operator not in OPERATORS:
+        error_message = ("Operator '{0}' must be one of {1}."
+                         .format(operator, OPERATORS))
+        logger.error(error_message)
+        raise CatalogError(error_message)
+    return [name, operator, value]
+
+# %% Main
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Update and query the "
+                                     "catalog of result folders.")
+    parser.add_argument('results_root',
+                        help="Folder containing result folders.")
+    parser.add_argument('-q', dest='conditions', action='append', default=[],
+                        help="Condition 'name<op>value', op one of {0}. "
+                        "Can be used multiple times.".format(OPERATORS))
+    parser.add_argument('-db', dest='database_path',
+                        help="Database file (default: "
+                        "<results_root>/{0}).".format(DATABASE_NAME))
+    parser.add_argument('-s', dest='show', action='append', default=[],
+                        help="Show value of this name for every match.")
+    parser.add_argument('-v', '--verbose', action='count')
+    arguments = parser.parse_args()
+
+    import simulation.utilities as utilities
+    logging.basicConfig(level=utilities.get_logger_level(arguments.verbose),
+                        format='%(asctime)s - %(name)s - %(levelname)s - '
+                        '%(message)s')
+
+    update(arguments.results_root, arguments.database_path)
+    for folder in query(arguments.conditions, arguments.results_root,
+                        arguments.database_path):
+        if arguments.show:
+            entries = values(folder, arguments.results_root,
+                             arguments.database_path)
+            print('{0}\t{1}'.format(folder, '\t'.join(
+                '{0}={1}'.format(name, entries.get(name))
+                for name in arguments.show)))
+        else:
+            print(folder)
@@ -19,6 +19,8 @@ check_input:    Checks the input parameters, logs errors and raises an
 import numpy as np
 import simulation.parser_def as parser_def
 import simulation.materials as materials
+import simulation.spectrum as spectrum
+import simulation.file_cache as file_cache
 import logging
 logger = logging.getLogger(__name__)
 
@@ -45,7 +47,7 @@ def _test_check_parser(parameters):
 
     """
     # Get parameter infos from parser, to link var_names and var_keys
-    parser_info = parser_def.get_arguments_info(parser_def.input_parser())
+    parser_info = parser_def.get_arguments_info()
 
     logger.info("Checking geometry input...")
     geometry_input(parameters, parser_info)
@@ -172,18 +174,23 @@ def all_input(parameters, parser_info):
             raise InputError(error_message)
         logger.debug("... done.")
 
-        # Check all selected gratings (materials and phase/absorption)
+        # Check all selected gratings (materials and phase/absorption),
+        # convert thicknesses/phase shifts after checking materials
+        conversions = []
         if 'G0' in parameters['component_list']:
             logger.debug("Checking G0...")
-            _check_grating_input('g0', parameters, parser_info, False)
+            _check_grating_input('g0', parameters, parser_info, False,
+                                 conversions)
             logger.debug("... done.")
         if 'G1' in parameters['component_list']:
             logger.debug("Checking G1...")
-            _check_grating_input('g1', parameters, parser_info, False)
+            _check_grating_input('g1', parameters, parser_info, False,
+                                 conversions)
             logger.debug("... done.")
         if 'G2' in parameters['component_list']:
             logger.debug("Checking G2...")
-            _check_grating_input('g2', parameters, parser_info, False)
+            _check_grating_input('g2', parameters, parser_info, False,
+                                 conversions)
             logger.debug("... done.")
 
         # Check all materials if exist
@@ -191,7 +198,8 @@ def all_input(parameters, parser_info):
             for var_name, value in parameters.iteritems():
                 if 'material' in var_name and value:
                     materials.test_material(value, parameters['design_energy'],
-                                            parameters['look_up_table'])
+                                            parameters['look_up_table'],
+                                            parameters['photo_only'])
         except materials.MaterialError as e:
             error_message = ("Invalid material name in '{0}' ({1}): {2}"
                              .format(var_name,
@@ -200,6 +208,27 @@ def all_input(parameters, parser_info):
             logger.error(error_message)
             raise InputError(error_message)
 
+        # Grating thicknesses/phase shifts (one look up per material)
+        _convert_gratings(conversions, parameters)
+
+        # Rebin spectrum
+        if (parameters.get('spectrum_bins') or
+                parameters.get('spectrum_tolerance')) and \
+                parameters['spectrum']['energies'].size > 1:
+            logger.debug("Rebinning spectrum...")
+            parameters['spectrum'] = _rebin_spectrum(parameters)
+            logger.debug("... done.")
+
+        # Monte-Carlo sampling of spectrum
+        if parameters.get('monte_carlo_samples'):
+            logger.debug("Sampling spectrum...")
+            parameters['spectrum'] = \
+                spectrum.sample_energies(parameters['spectrum'],
+                                         parameters['monte_carlo_samples'],
+                                         _spectrum_efficiency(parameters),
+                                         parameters.get('seed'))
+            logger.debug("... done.")
+
         logger.debug("... done.")  # General checking
 
     except AttributeError as e:
@@ -209,6 +238,58 @@ def all_input(parameters, parser_info):
         raise InputError(error_message)
 
 
+def parallel_input(parameters):
+    """
+    Checking parallelization input (number of worker processes and chunk
+    size, see simulation.parallel). Missing values (e.g. from the GUI) are
+    set to the defaults.
+
+    Parameters
+    ==========
+
+    parameters [dict]
+
+    """
+    logger.debug("Checking parallelization input...")
+    parameters.setdefault('number_workers', 1)
+    parameters.setdefault('chunk_size', None)
+    if parameters['number_workers'] is None or \
+            parameters['number_workers'] < 0:
+        error_message = ("Number of worker processes (-np) must be 0 (all "
+                         "cores) or positive, is {0}."
+                         .format(parameters['number_workers']))
+        logger.error(error_message)
+        raise InputError(error_message)
+    if parameters['chunk_size'] is not None and \
+            parameters['chunk_size'] < 1:
+        error_message = ("Chunk size (-cs) must be positive, is {0}."
+                         .format(parameters['chunk_size']))
+        logger.error(error_message)
+        raise InputError(error_message)
+    logger.debug("... done.")
+
+
+def precision_input(parameters):
+    """
+    Checking numerical precision input (see utilities.configure_precision).
+    Missing value (e.g. from older input files) is set to the default.
+
+    Parameters
+    ==========
+
+    parameters [dict]
+
+    """
+    logger.debug("Checking precision input...")
+    parameters.setdefault('precision', 'double')
+    if parameters['precision'] not in ['single', 'double']:
+        error_message = ("Precision (-prec) must be 'single' or 'double', is "
+                         "'{0}'.".format(parameters['precision']))
+        logger.error(error_message)
+        raise InputError(error_message)
+    logger.debug("... done.")
+
+
 def geometry_input(parameters, parser_info):
     """
     Checking geometry input (everything to calculate the geometries).
@@ -944,6 +1025,80 @@ def _get_spectrum(spectrum_file, range_, spectrum_step, design_energy):
     return spectrum, min_energy, max_energy
 
 
+def _rebin_spectrum(parameters):
+    """
+    Rebin spectrum into 'spectrum_bins' bins or, if 'spectrum_tolerance' is
+    set, into the smallest number of bins meeting the tolerance (with
+    maximum 'spectrum_bins' bins). Bins are adapted to the detected photons.
+
+    Parameters
+    ==========
+
+    parameters [dict]
+
+    Returns
+    =======
+
+    spectrum [dict] [keV]:          spectrum['energies']
+                                    spectrum['photons']
+
+    """
+    energies = parameters['spectrum']['energies']
+    efficiency = _spectrum_efficiency(parameters)
+
+    if parameters.get('spectrum_tolerance'):
+        return spectrum.optimal_rebin(parameters['spectrum'], efficiency,
+                                      parameters['spectrum_tolerance'],
+                                      max_bins=
+                                      parameters.get('spectrum_bins'))
+    bin_indices = spectrum.adaptive_bins(parameters['spectrum']['photons'] *
+                                         efficiency,
+                                         parameters['spectrum_bins'])
+    rebinned = spectrum.rebin(parameters['spectrum'], bin_indices,
+                              parameters['spectrum']['photons'] * efficiency)
+    logger.info("Rebinned spectrum from {0} to {1} energies."
+                .format(energies.size, rebinned['energies'].size))
+    return rebinned
+
+
+def _spectrum_efficiency(parameters):
+    """
+    Calculate the efficiency for each energy of the spectrum, to get the
+    number of detected photons: filter transmission * detector absorption.
+
+    Parameters
+    ==========
+
+    parameters [dict]
+
+    Returns
+    =======
+
+    efficiency [array]
+
+    """
+    energies = parameters['spectrum']['energies']
+    efficiency = np.ones(energies.size)
+    if parameters['material_filter']:
+        efficiency = efficiency * \
+            materials.height_to_transmission(parameters['thickness_filter'],
+                                             parameters['material_filter'],
+                                             energies,
+                                             photo_only=
+                                             parameters['photo_only'],
+                                             source=
+                                             parameters['look_up_table'])
+    if parameters['material_detector']:
+        efficiency = efficiency * \
+            materials.height_to_absorption(parameters['thickness_detector'],
+                                           parameters['material_detector'],
+                                           energies,
+                                           photo_only=parameters['photo_only'],
+                                           source=
+                                           parameters['look_up_table'])
+    return efficiency
+
+
 def _read_spectrum(spectrum_file_path):
     """
     Read from spectrum file.
@@ -973,17 +1128,16 @@ def _read_spectrum(spectrum_file_path):
     """
     # Read dict from file
     logger.debug("Reading from file {}...".format(spectrum_file_path))
-    spectrum_struct_array = np.genfromtxt(spectrum_file_path, delimiter=',',
-                                          names=True)  # np ndarray
-    if 'energy' in spectrum_struct_array.dtype.names:
-        # Rename 'energy' to 'energies'
-        spectrum_struct_array.dtype.names = ('energies', 'photons')
+    spectrum_struct_array = file_cache.read_csv(spectrum_file_path)
     # Convert to dict
     spectrum = dict()
     try:
-        spectrum['energies'] = spectrum_struct_array['energies']
-        spectrum['photons'] = spectrum_struct_array['photons']
-    except AttributeError as e:
+        if 'energy' in spectrum_struct_array.dtype.names:
+            spectrum['energies'] = np.array(spectrum_struct_array['energy'])
+        else:
+            spectrum['energies'] = np.array(spectrum_struct_array['energies'])
+        spectrum['photons'] = np.array(spectrum_struct_array['photons'])
+    except (ValueError, TypeError) as e:
         error_message = "Spectrum file at {0} is missing '{1}'-column." \
                         .format(spectrum_file_path, str(e).split()[-1])
         logger.error(error_message)
@@ -1019,7 +1173,8 @@ def _nearest_value(array, value):
     return array[nearest_index], nearest_index
 
 
-def _check_grating_input(grating, parameters, parser_info, geometry):
+def _check_grating_input(grating, parameters, parser_info, geometry,
+                         conversions=None):
     """
     Check grating input.
 
@@ -1030,6 +1185,10 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
     parameters [dict]
     parser_info [dict]:     parser_info[var_name] = [var_key, var_help]
     geometry [boolean]:     called from check geometry (True), or check all (F)
+    conversions [list]:     if given, the thickness/phase shift conversions
+                            are appended (see _convert_gratings) instead of
+                            calculated, to convert all gratings at once.
+                            Default is None (convert now)
 
     Notes
     =====
@@ -1076,6 +1235,9 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
 
     """
     grating = grating.lower()
+    convert_now = conversions is None
+    if convert_now:
+        conversions = []
     # Is defined?
     if not parameters['type_'+grating]:
         error_message = ("Type of {0} ({1}) not defined."
@@ -1177,30 +1339,18 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
                     logger.warn(warning_message)
                 # Calc thickness
                 if not geometry:
-                    parameters['thickness_'+grating] = \
-                        materials.shift_to_height(parameters
-                                                  ['phase_shift_'+grating],
-                                                  parameters
-                                                  ['material_'+grating],
-                                                  parameters['design_energy'],
-                                                  photo_only=
-                                                  parameters['photo_only'],
-                                                  source=
-                                                  parameters['look_up_table'])
+                    conversions.append(['thickness_'+grating,
+                                        'shift_to_height',
+                                        parameters['phase_shift_'+grating],
+                                        parameters['material_'+grating]])
             else:
                 # Phase not defined, but thickness
                 # Calc phase shift
                 if not geometry:
-                    parameters['phase_shift_'+grating] = \
-                        materials.height_to_shift(parameters
-                                                  ['thickness_'+grating],
-                                                  parameters
-                                                  ['material_'+grating],
-                                                  parameters['design_energy'],
-                                                  photo_only=
-                                                  parameters['photo_only'],
-                                                  source=
-                                                  parameters['look_up_table'])
+                    conversions.append(['phase_shift_'+grating,
+                                        'height_to_shift',
+                                        parameters['thickness_'+grating],
+                                        parameters['material_'+grating]])
         else:
             # GI setup
             # Either phase G1 (normal and dual phase) or
@@ -1240,15 +1390,10 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
                 logger.warn(warning_message)
             # Calc thickness
             if not geometry:
-                parameters['thickness_'+grating] = \
-                    materials.shift_to_height(parameters['phase_shift_' +
-                                                         grating],
-                                              parameters['material_'+grating],
-                                              parameters['design_energy'],
-                                              photo_only=
-                                              parameters['photo_only'],
-                                              source=
-                                              parameters['look_up_table'])
+                conversions.append(['thickness_'+grating,
+                                    'shift_to_height',
+                                    parameters['phase_shift_'+grating],
+                                    parameters['material_'+grating]])
     else:
         # Mix grating
         if parameters['gi_geometry'] == 'free':
@@ -1274,30 +1419,18 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
                     logger.warn(warning_message)
                 # Calc phase shift
                 if not geometry:
-                    parameters['phase_shift_'+grating] = \
-                        materials.height_to_shift(parameters
-                                                  ['thickness_'+grating],
-                                                  parameters
-                                                  ['material_'+grating],
-                                                  parameters['design_energy'],
-                                                  photo_only=
-                                                  parameters['photo_only'],
-                                                  source=
-                                                  parameters['look_up_table'])
+                    conversions.append(['phase_shift_'+grating,
+                                        'height_to_shift',
+                                        parameters['thickness_'+grating],
+                                        parameters['material_'+grating]])
             else:
                 # Phase shift defined
                 # Calc thickness
                 if not geometry:
-                    parameters['thickness_'+grating] = \
-                        materials.shift_to_height(parameters
-                                                  ['phase_shift_'+grating],
-                                                  parameters['material_' +
-                                                             grating],
-                                                  parameters['design_energy'],
-                                                  photo_only=
-                                                  parameters['photo_only'],
-                                                  source=
-                                                  parameters['look_up_table'])
+                    conversions.append(['thickness_'+grating,
+                                        'shift_to_height',
+                                        parameters['phase_shift_'+grating],
+                                        parameters['material_'+grating]])
         else:
             # GI setup
             if grating == 'g0' or (grating == 'g2' and
@@ -1320,16 +1453,10 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
                     logger.warn(warning_message)
                 # Calc phase shift
                 if not geometry:
-                    parameters['phase_shift_'+grating] = \
-                        materials.height_to_shift(parameters
-                                                  ['thickness_'+grating],
-                                                  parameters
-                                                  ['material_'+grating],
-                                                  parameters['design_energy'],
-                                                  photo_only=
-                                                  parameters['photo_only'],
-                                                  source=
-                                                  parameters['look_up_table'])
+                    conversions.append(['phase_shift_'+grating,
+                                        'height_to_shift',
+                                        parameters['thickness_'+grating],
+                                        parameters['material_'+grating]])
             else:
                 # G1 (normal and dual phase) or G2 if dual phase
                 if not parameters['phase_shift_'+grating]:
@@ -1348,16 +1475,10 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
                     logger.warn(warning_message)
                 # Calc thickness
                 if not geometry:
-                    parameters['thickness_'+grating] = \
-                        materials.shift_to_height(parameters
-                                                  ['phase_shift_'+grating],
-                                                  parameters['material_' +
-                                                             grating],
-                                                  parameters['design_energy'],
-                                                  photo_only=
-                                                  parameters['photo_only'],
-                                                  source=
-                                                  parameters['look_up_table'])
+                    conversions.append(['thickness_'+grating,
+                                        'shift_to_height',
+                                        parameters['phase_shift_'+grating],
+                                        parameters['material_'+grating]])
 
     # Optional input if not geometry check
     # Always required
@@ -1367,6 +1488,8 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
                                  parser_info['material_'+grating][0]))
         logger.error(error_message)
         raise InputError(error_message)
+    if convert_now:
+        _convert_gratings(conversions, parameters)
 
     # Optional input
     # Wafer
@@ -1434,4 +1557,29 @@ def _check_grating_input(grating, parameters, parser_info, geometry):
                                "gnoring set radius..."
                                .format(grating.upper()))
             logger.warning(warning_message)
-            parameters['radius_'+grating] = None
\ No newline at end of file
+            parameters['radius_'+grating] = None
+
+
+def _convert_gratings(conversions, parameters):
+    """
+    Calculate grating thicknesses/phase shifts at design energy, see
+    materials.convert.
+
+    Parameters
+    ==========
+
+    conversions [list]:     [[var_name, conversion, value, material], ...],
+                            result is stored in parameters[var_name]
+    parameters [dict]
+
+    """
+    if not conversions:
+        return
+    results = materials.convert([conversion[1:] for conversion
+                                 in conversions],
+                                parameters['design_energy'],
+                                photo_only=parameters['photo_only'],
+                                source=parameters['look_up_table'])
+    for [var_name, conversion, _, _], result in zip(conversions, results):
+        logger.debug("{0}: {1} = {2}".format(conversion, var_name, result))
+        parameters[var_name] = result
@@ -0,0 +1,312 @@
+"""
+Module to checkpoint long simulations: completed items (energy bins, CT
+angles, phase steps, strips) are persisted periodically, keyed by the hash
+of the run's input parameters (run_cache.run_hash), so that a rerun with the
+same input resumes from the last checkpoint instead of starting over.
+
+Classes
+=======
+
+Checkpoint:     Completed items of a run, persisted periodically.
+                Parameters:
+                    key [str]
+                    checkpoint_dir [str] (default None)
+                    interval [s] (default INTERVAL)
+
+Functions
+=========
+
+entries:        List checkpoints.
+                Parameters:
+                    checkpoint_dir [str] (default None)
+
+Usage
+=====
+
+key = run_cache.run_hash(results['input'], 'simulation')
+with Checkpoint(key) as checkpoint:
+    for energy_bin in checkpoint.pending(range(number_energies)):
+        checkpoint.add(energy_bin, {'intensity': simulate(energy_bin)})
+intensities = [checkpoint.get(energy_bin)['intensity']
+               for energy_bin in range(number_energies)]
+save_results(...)
+checkpoint.remove()  # Run is complete
+
+From gisimulation folder:
+
+python -m simulation.checkpoint list
+python -m simulation.checkpoint remove KEY [KEY ...]
+
+Notes
+=====
+
+Each checkpoint is a folder <checkpoint_dir>/<key> with one results_store
+.npyd store per flush and index.json ([item, store] of all completed items).
+Stores are written to temporary folders and renamed, and index.json is
+replaced only afterwards, thus a crash (even while flushing) loses at most
+the items of the last interval.
+
+Items must be JSON serializable (int, float, str), the results of an item
+are a dict (results_store.write). Added items are kept in memory until the
+next flush, which happens when interval has passed since the previous
+flush (on add), and on leaving the with block (also on exceptions, e.g.
+KeyboardInterrupt). interval=0 flushes every item.
+
+Since the key includes the versions of all input files and CACHE_VERSION
+(see run_cache), changed input never resumes from a stale checkpoint.
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+import numpy as np
+import simulation.utilities as utilities
+import simulation.results_store as results_store
+import logging
+logger = utilities.get_logger(__name__)
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.expanduser('~'),
+                                      '.gisimulation', 'checkpoints')
+INTERVAL = 60  # [s]
+_INDEX_FILE = 'index.json'
+
+# %% Classes
+
+
+class Checkpoint(object):
+    """
+    Completed items of a run, persisted periodically. Existing items of the
+    same key are loaded (resume).
+
+    Parameters
+    ==========
+
+    key [str]:              run hash, see run_cache.run_hash()
+    checkpoint_dir [str]:   default is None (DEFAULT_CHECKPOINT_DIR)
+    interval [s]:           minimum time between flushes, default is
+                            INTERVAL
+
+    """
+    def __init__(self, key, checkpoint_dir=None, interval=INTERVAL):
+        self.key = key
+        self.path = os.path.join(checkpoint_dir or DEFAULT_CHECKPOINT_DIR,
+                                 key)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stores = dict()  # _stores[item key] = [item, store name]
+        self._added = dict()  # _added[item key] = [item, results]
+        self._last_flush = time.time()
+        self._number_stores = 0
+        index_path = os.path.join(self.path, _INDEX_FILE)
+        if os.path.isfile(index_path):
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            for [item, store] in index['items']:
+                self._stores[_item_key(item)] = [item, store]
+            self._number_stores = index['number_stores']
+            logger.info("Resuming run {0} from checkpoint ({1} items "
+                        "done).", key, len(self._stores))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+    def __contains__(self, item):
+        item_key = _item_key(item)
+        return item_key in self._stores or item_key in self._added
+
+    def done(self):
+        """
+        Completed items (persisted and not yet flushed).
+
+        Returns
+        =======
+
+        items [list]
+
+        """
+        with self._lock:
+            return [item for [item, _] in
+                    list(self._stores.values()) + list(self._added.values())]
+
+    def pending(self, items):
+        """
+        Items, which are not completed yet.
+
+        Parameters
+        ==========
+
+        items [list]
+
+        Returns
+        =======
+
+        pending_items [list]:   in order of items
+
+        """
+        items = list(items)
+        pending_items = [item for item in items if item not in self]
+        logger.debug("{0} of {1} items pending.", len(pending_items),
+                     len(items))
+        return pending_items
+
+    def add(self, item, results):
+        """
+        Mark item as completed, flush if interval has passed.
+
+        Parameters
+        ==========
+
+        item:               int, float or str
+        results [dict]:     results of item
+
+        """
+        with self._lock:
+            self._added[_item_key(item)] = [item, results]
+            due = time.time() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def get(self, item):
+        """
+        Results of completed item.
+
+        Parameters
+        ==========
+
+        item
+
+        Returns
+        =======
+
+        results [dict]
+
+        """
+        item_key = _item_key(item)
+        with self._lock:
+            if item_key in self._added:
+                return self._added[item_key][1]
+            store = self._stores[item_key][1]
+        return results_store.read(os.path.join(self.path, store))
+
+    def flush(self):
+        """
+        Persist all added items.
+        """
+        with self._lock:
+            self._last_flush = time.time()
+            if not self._added:
+                return
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            logger.debug("Checkpointing {0} items of run {1}...",
+                         len(self._added), self.key)
+            for item_key, [item, results] in self._added.items():
+                store = '{0}{1}'.format(self._number_stores,
+                                        results_store.EXTENSIONS['npy'])
+                self._number_stores += 1
+                store_path = os.path.join(self.path, store)
+                temp_path = os.path.join(self.path, 'tmp.{0}{1}'.format(
+                    os.getpid(), results_store.EXTENSIONS['npy']))
+                results_store.write(temp_path, results)
+                if os.path.isdir(store_path):
+                    shutil.rmtree(store_path)  # Orphan of a crashed flush
+                os.rename(temp_path, store_path)
+                self._stores[item_key] = [item, store]
+            self._added.clear()
+            index_path = os.path.join(self.path, _INDEX_FILE)
+            with open(index_path + '.tmp', 'w') as f:
+                json.dump(dict(items=list(self._stores.values()),
+                               number_stores=self._number_stores,
+                               updated=self._last_flush), f)
+            os.rename(index_path + '.tmp', index_path)
+            logger.debug("... done.")
+
+    def remove(self):
+        """
+        Remove checkpoint (e.g. after the complete results are saved).
+        """
+        with self._lock:
+            self._stores.clear()
+            self._added.clear()
+            self._number_stores = 0
+            shutil.rmtree(self.path, ignore_errors=True)
+        logger.debug("Checkpoint of run {0} removed.", self.key)
+
+# %% Functions
+
+
+def entries(checkpoint_dir=None):
+    """
+    List checkpoints, most recently updated first.
+
+    Parameters
+    ==========
+
+    checkpoint_dir [str]:   default is None (DEFAULT_CHECKPOINT_DIR)
+
+    Returns
+    =======
+
+    entries [list]:         [[key, number_items, updated [s]], ...]
+
+    """
+    checkpoint_dir = checkpoint_dir or DEFAULT_CHECKPOINT_DIR
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    entries_ = []
+    for key in os.listdir(checkpoint_dir):
+        index_path = os.path.join(checkpoint_dir, key, _INDEX_FILE)
+        if not os.path.isfile(index_path):
+            continue
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        entries_.append([key, len(index['items']), index['updated']])
+    return sorted(entries_, key=lambda entry: entry[2], reverse=True)
+
+# %% Private utilities
+
+
+def _item_key(item):
+    """
+    Hashable, type independent key of item (e.g. 1, np.int64(1) and 1.0).
+    """
+    if isinstance(item, np.generic):
+        item = item.item()
+    if isinstance(item, float) and item.is_integer():
+        item = int(item)  # 25.0 and 25 are the same item
+    return json.dumps(item)
+
+# %% Main
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect and remove "
+                                     "checkpoints of interrupted runs.")
+    parser.add_argument('command', choices=['list', 'remove'])
+    parser.add_argument('keys', nargs='*', help="Checkpoints to remove.")
+    parser.add_argument('-d', dest='checkpoint_dir',
+                        default=DEFAULT_CHECKPOINT_DIR,
+                        help="Checkpoint folder.")
+    arguments = parser.parse_args()
+
+    if arguments.command == 'list':
+        checkpoints = entries(arguments.checkpoint_dir)
+        for [key, number_items, updated] in checkpoints:
+            print("{0}  {1:>6} items  {2}"
+                  .format(key, number_items,
+                          time.strftime('%Y-%m-%d %H:%M:%S',
+                                        time.localtime(updated))))
+        print("{0} checkpoints in {1}".format(len(checkpoints),
+                                               arguments.checkpoint_dir))
+    else:
+        for key in arguments.keys:
+            Checkpoint(key, arguments.checkpoint_dir).remove()
+        print("Removed {0} checkpoints.".format(len(arguments.keys)))
@@ -0,0 +1,170 @@
+"""
+Module to cache parsed csv files (spectra, sample values) as binary numpy
+files, which are memory mapped on loading.
+
+Functions
+=========
+
+read_csv:       Read csv file with header into structured array, via cache.
+                Parameters:
+                    file_path [str]
+                    cache_dir [str] (default None)
+
+cache_paths:    Paths to cached array and its info file.
+                Parameters:
+                    file_path [str]
+                    cache_dir [str] (default None)
+
+Notes
+=====
+
+The cache is stored next to the source file as hidden files:
+    .<file name>.cache.npy:     structured array
+    .<file name>.cache.json:    size and modification time of source file
+If the source folder is not writable, the cache is stored in cache_dir
+(default: ~/.gisimulation/cache), named by the hash of the absolute source
+path.
+The cache is invalid, if size or modification time of the source changed.
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.gisimulation',
+                                 'cache')
+
+# %% Functions
+
+
+def read_csv(file_path, cache_dir=None):
+    """
+    Read csv file with header (names=True, delimiter ',') into a structured
+    array. Parsed files are cached, repeated reads only map the cached
+    binary file.
+
+    Parameters
+    ==========
+
+    file_path [str]
+    cache_dir [str]:        fallback cache folder, if source folder is not
+                            writable, default is None (DEFAULT_CACHE_DIR)
+
+    Returns
+    =======
+
+    struct_array [np.ndarray]:  read-only (memory mapped)
+
+    """
+    file_info = _file_info(file_path)
+    for [array_path, info_path] in [cache_paths(file_path),
+                                    cache_paths(file_path, cache_dir,
+                                                local=False)]:
+        if _is_valid(info_path, file_info):
+            logger.debug("Loading {0} from cache at {1}."
+                         .format(file_path, array_path))
+            return np.load(array_path, mmap_mode='r')
+
+    logger.debug("Parsing {0}...".format(file_path))
+    struct_array = _parse(file_path)
+    for [array_path, info_path] in [cache_paths(file_path),
+                                    cache_paths(file_path, cache_dir,
+                                                local=False)]:
+        try:
+            _write_cache(struct_array, file_info, array_path, info_path)
+        except (IOError, OSError) as e:
+            logger.debug("Could not write cache at {0}: {1}"
+                         .format(array_path, e))
+            continue
+        return np.load(array_path, mmap_mode='r')
+    logger.warning("Could not cache {0}.".format(file_path))
+    return struct_array
+
+
+def cache_paths(file_path, cache_dir=None, local=True):
+    """
+    Paths to cached array and its info file.
+
+    Parameters
+    ==========
+
+    file_path [str]
+    cache_dir [str]:        default is None (DEFAULT_CACHE_DIR)
+    local [bool]:           next to source file (True) or in cache_dir,
+                            default is True
+
+    Returns
+    =======
+
+    [array_path, info_path]
+
+    """
+    file_path = os.path.abspath(file_path)
+    if local:
+        base_path = os.path.join(os.path.dirname(file_path),
+                                 '.' + os.path.basename(file_path))
+    else:
+        if cache_dir is None:
+            cache_dir = DEFAULT_CACHE_DIR
+        base_path = os.path.join(cache_dir,
+                                 hashlib.sha1(file_path.encode('utf-8'))
+                                 .hexdigest())
+    return [base_path + '.cache.npy', base_path + '.cache.json']
+
+
+def _parse(file_path):
+    """
+    Parse csv file with header. Missing trailing values are read as nan.
+    """
+    with open(file_path, 'r') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    number_delimiters = lines[0].count(',')
+    lines = [line + ',' * (number_delimiters - line.count(','))
+             for line in lines]
+    return np.genfromtxt(lines, delimiter=',', names=True)
+
+
+def _file_info(file_path):
+    """
+    Size and modification time of file.
+    """
+    stat = os.stat(file_path)
+    return dict(size=stat.st_size, mtime=stat.st_mtime)
+
+
+def _is_valid(info_path, file_info):
+    """
+    Check if cache info matches file info.
+    """
+    try:
+        with open(info_path, 'r') as f:
+            cached_info = json.load(f)
+    except (IOError, OSError, ValueError):
+        return False
+    return cached_info == file_info and \
+        os.path.isfile(info_path.replace('.cache.json', '.cache.npy'))
+
+
+def _write_cache(struct_array, file_info, array_path, info_path):
+    """
+    Write array and info. Info is written last, so that an interrupted write
+    leaves an invalid cache.
+    """
+    cache_folder = os.path.dirname(array_path)
+    if not os.path.isdir(cache_folder):
+        os.makedirs(cache_folder)
+    if os.path.isfile(info_path):
+        os.remove(info_path)
+    # Temporary name must end with .npy, otherwise np.save appends it
+    temp_path = array_path.replace('.cache.npy', '.tmp.npy')
+    np.save(temp_path, struct_array)
+    if os.path.isfile(array_path):
+        os.remove(array_path)  # os.rename does not overwrite on Windows
+    os.rename(temp_path, array_path)
+    with open(info_path, 'w') as f:
+        json.dump(file_info, f)
+    logger.debug("Cached at {0}.".format(array_path))
@@ -8,8 +8,16 @@ ToDo:
 @author: buechner_m <maria.buechner@gmail.com>
 """
 import numpy as np
+import simulation.utilities as utilities
 import logging
-logger = logging.getLogger(__name__)
+logger = utilities.get_logger(__name__)
+
+# %% Constants
+# Parameters, which only affect the sample position or the detector results,
+# see Geometry.update()
+SAMPLE_PARAMETERS = ['sample_position', 'sample_distance', 'sample_diameter',
+                     'sample_shape']
+DETECTOR_PARAMETERS = ['field_of_view', 'pixel_size', 'curved_detector']
 
 
 class GeometryError(Exception):
@@ -45,7 +53,7 @@ class Geometry():
         if self._parameters['gi_geometry'] != 'free':
             # nu = 2 if pi shift, nu = 1 if pi-half shift
             self._nu = round(self._parameters['phase_shift_g1'] * 2/np.pi)
-            logger.debug("self._nu: {0}".format(self._nu))
+            logger.debug("self._nu: {0}", self._nu)
 
         # Calculate geometries
         if self._parameters['gi_geometry'] == 'conv':
@@ -64,6 +72,66 @@ class Geometry():
         # Update geometry results
         self._get_geometry_results()
 
+    def update(self, parameters):
+        """
+        Update geometry for new parameters, recalculating only the quantities
+        depending on the changed parameters.
+
+        Parameters
+        ==========
+
+        parameters [dict]:      e.g. from update_parameters(), with some
+                                values changed
+
+        Returns
+        =======
+
+        changed_results [list]: keys of changed self.results
+
+        Notes
+        =====
+
+        Compared to self._parameters:
+            - only SAMPLE_PARAMETERS changed (and sample in setup): only
+              sample position is recalculated
+            - only DETECTOR_PARAMETERS changed: only results are updated
+            - else: full recalculation
+
+        """
+        changed_parameters = utilities.changed_keys(parameters,
+                                                    self._parameters)
+        if not changed_parameters:
+            return []
+        previous_results = self.results
+        # Restore previous state on errors
+        previous_state = self.__dict__.copy()
+        previous_state['_parameters'] = self._parameters.copy()
+
+        try:
+            if set(changed_parameters) <= set(SAMPLE_PARAMETERS) and \
+                    'Sample' in self._parameters['component_list']:
+                logger.debug("Updating sample position ({0})...",
+                             changed_parameters)
+                for var_name in changed_parameters:
+                    self._parameters[var_name] = parameters[var_name]
+                self._check_sample_position()
+                self._get_geometry_results()
+            elif set(changed_parameters) <= set(DETECTOR_PARAMETERS):
+                logger.debug("Updating detector results ({0})...",
+                             changed_parameters)
+                for var_name in changed_parameters:
+                    self._parameters[var_name] = parameters[var_name]
+                self._get_geometry_results()
+            else:
+                logger.debug("Recalculating geometry ({0} changed)...",
+                             changed_parameters)
+                self.__init__(parameters)
+        except GeometryError:
+            self.__dict__ = previous_state
+            raise
+
+        return utilities.changed_keys(self.results, previous_results)
+
     def update_parameters(self):
         """
         Return updated parameter dict.
@@ -1135,3 +1203,64 @@ class Geometry():
             self.results['cone_angle'] = 2.0 * \
                 np.arctan(self.results['height'] / (2.0 *
                           self.results['distance_source_detector']))
+
+    def pixel_ray_angles(self):
+        """
+        Angles of the rays through each pixel column (fan) and row (cone)
+        center, see ray_angles().
+
+        Returns
+        =======
+
+        [fan_angles, cone_angles] [rad]:   [columns], [rows]
+
+        """
+        if self._parameters['beam_geometry'] == 'parallel':
+            return (np.zeros(self._parameters['field_of_view'][0]),
+                    np.zeros(self._parameters['field_of_view'][1]))
+        return (ray_angles(self._parameters['field_of_view'][0],
+                           self._parameters['pixel_size'],
+                           self._parameters['distance_source_detector'],
+                           self._parameters['curved_detector']),
+                ray_angles(self._parameters['field_of_view'][1],
+                           self._parameters['pixel_size'],
+                           self._parameters['distance_source_detector'],
+                           self._parameters['curved_detector']))
+
+
+# %% Functions
+
+
+def ray_angles(number_pixels, pixel_size, distance_source_detector,
+               curved_detector=False):
+    """
+    Calculate the angle between the central ray and the ray hitting each
+    pixel center along one detector axis.
+
+    Parameters
+    ==========
+
+    number_pixels [int]
+    pixel_size [um]
+    distance_source_detector [mm]
+    curved_detector [bool]:         default=False
+
+    Returns
+    =======
+
+    angles [rad]:                   [number_pixels]
+
+    Notes
+    =====
+
+    Flat detector:      angle = arctan(x / distance_source_detector)
+    Curved detector:    angle = x / distance_source_detector (arc length)
+
+    with x the pixel center position relative to the detector center.
+
+    """
+    positions = (np.arange(number_pixels) - (number_pixels - 1) / 2.0) * \
+        pixel_size * 1e-3  # [mm]
+    if curved_detector:
+        return positions / distance_source_detector
+    return np.arctan(positions / distance_source_detector)
@@ -0,0 +1,318 @@
+"""
+Module to run computations (input checks, geometry, analytical results,
+simulations) in background worker threads, so that the GUI stays responsive.
+
+Classes
+=======
+
+JobExecutor:    Runs jobs in worker threads, only the latest job of each name
+                is kept.
+                Parameters:
+                    dispatch (function(callback)) (default None)
+                    number_workers [int] (default 1)
+
+Job:            Handle of a submitted job, used by the job function to report
+                progress and check for cancellation.
+
+JobCancelled:   Raised by Job.check_cancelled() to stop a canceled job.
+
+Notes
+=====
+
+Job functions are called as function(job, *args, **kwargs) in a worker
+thread. They must not access widgets, only the (copied) values passed to them.
+Cancellation is cooperative: a job stops at the next job.check_cancelled(),
+results of canceled jobs are discarded.
+
+All callbacks (on_done(job, result), on_error(job, error),
+on_progress(job, fraction, message)) are passed to dispatch, which must run
+them on the main thread (e.g. via kivy.clock.Clock.schedule_once). Without
+dispatch, callbacks are called in the worker thread.
+
+Submitting a job cancels the previous job of the same name, pending and
+running. Thus, when e.g. 'geometry' is requested several times in a row, only
+the latest request is calculated and reported.
+
+Usage
+=====
+
+executor = JobExecutor(dispatch)
+executor.submit('geometry', function, args=[parameters],
+                on_done=show, on_error=display_error)
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import threading
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+from functools import partial
+import logging
+logger = logging.getLogger(__name__)
+
+# %% Classes
+
+
+class JobCancelled(Exception):
+    """
+    Raised by Job.check_cancelled(), if the job was canceled.
+    """
+
+
+class Job(object):
+    """
+    Handle of a submitted job.
+
+    Parameters
+    ==========
+
+    name [str]
+    function:           function(job, *args, **kwargs)
+    args [list]
+    kwargs [dict]
+    callbacks [dict]:   callbacks['on_done'|'on_error'|'on_progress']
+    dispatch:           function(callback), runs callback on main thread
+
+    """
+    def __init__(self, name, function, args, kwargs, callbacks, dispatch):
+        self.name = name
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._callbacks = callbacks
+        self._dispatch = dispatch
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def cancelled(self):
+        """
+        True if job was canceled.
+        """
+        return self._cancelled.is_set()
+
+    @property
+    def finished(self):
+        """
+        True if job was run (successful, failed or canceled).
+        """
+        return self._finished.is_set()
+
+    def cancel(self):
+        """
+        Cancel job. Pending jobs are skipped, running jobs stop at the next
+        check_cancelled(), their results are discarded.
+        """
+        if not self.cancelled:
+            logger.debug("Canceling job '{0}'.".format(self.name))
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        """
+        Raise JobCancelled, if job was canceled. Call in job function between
+        steps.
+        """
+        if self.cancelled:
+            raise JobCancelled("Job '{0}' canceled.".format(self.name))
+
+    def progress(self, fraction, message=''):
+        """
+        Report progress to on_progress callback.
+
+        Parameters
+        ==========
+
+        fraction [float]:   [0, 1]
+        message [str]:      default is ''
+
+        """
+        self._report('on_progress', fraction, message)
+
+    def wait(self, timeout=None):
+        """
+        Wait until job was run.
+
+        Parameters
+        ==========
+
+        timeout [float]:    [s], default is None (no timeout)
+
+        Returns
+        =======
+
+        finished [bool]
+
+        """
+        self._finished.wait(timeout)
+        return self.finished
+
+    def _run(self):
+        """
+        Run job function and report result or error (in worker thread).
+        """
+        if self.cancelled:
+            logger.debug("Skipping canceled job '{0}'.".format(self.name))
+            self._finished.set()
+            return
+        logger.debug("Running job '{0}'...".format(self.name))
+        try:
+            result = self._function(self, *self._args, **self._kwargs)
+        except JobCancelled:
+            logger.debug("... job '{0}' canceled.".format(self.name))
+            self._finished.set()
+            return
+        except Exception as e:
+            logger.debug("... job '{0}' failed.".format(self.name),
+                         exc_info=True)
+            self._finished.set()  # Before reporting, job is not running
+            self._report('on_error', e)
+            return
+        logger.debug("... job '{0}' done.".format(self.name))
+        self._finished.set()
+        self._report('on_done', result)
+
+    def _report(self, callback_name, *args):
+        """
+        Dispatch callback, unless job is (or gets) canceled.
+        """
+        callback = self._callbacks.get(callback_name)
+        if callback is None or self.cancelled:
+            return
+        self._dispatch(partial(self._call_if_active, callback, *args))
+
+    def _call_if_active(self, callback, *args):
+        """
+        Call callback, unless job was canceled after dispatching.
+        """
+        if not self.cancelled:
+            callback(self, *args)
+
+
+class JobExecutor(object):
+    """
+    Runs jobs in worker threads, only the latest job of each name is kept.
+
+    Parameters
+    ==========
+
+    dispatch:               function(callback), runs callback on main thread,
+                            default is None (call in worker thread)
+    number_workers [int]:   default is 1 (jobs run in submission order)
+
+    """
+    def __init__(self, dispatch=None, number_workers=1):
+        self._dispatch = dispatch or _call
+        self._queue = queue.Queue()
+        self._latest = dict()  # Latest job of each name
+        self._lock = threading.Lock()
+        self._workers = []
+        for _ in range(number_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True  # Do not block exiting
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, name, function, args=(), kwargs=None, on_done=None,
+               on_error=None, on_progress=None):
+        """
+        Submit job, cancels previous job of the same name.
+
+        Parameters
+        ==========
+
+        name [str]:         e.g. 'geometry'
+        function:           function(job, *args, **kwargs)
+        args [list]:        default is ()
+        kwargs [dict]:      default is None
+        on_done:            function(job, result), default is None
+        on_error:           function(job, error), default is None
+        on_progress:        function(job, fraction, message), default is None
+
+        Returns
+        =======
+
+        job [Job]
+
+        """
+        callbacks = dict(on_done=on_done, on_error=on_error,
+                         on_progress=on_progress)
+        job = Job(name, function, list(args), kwargs or dict(), callbacks,
+                  self._dispatch)
+        with self._lock:
+            if name in self._latest:
+                self._latest[name].cancel()
+            self._latest[name] = job
+        self._queue.put(job)
+        return job
+
+    def cancel(self, name=None):
+        """
+        Cancel latest job of name.
+
+        Parameters
+        ==========
+
+        name [str]:         default is None (all jobs)
+
+        """
+        with self._lock:
+            for job_name, job in self._latest.items():
+                if name is None or job_name == name:
+                    job.cancel()
+
+    def is_running(self, name=None):
+        """
+        Check if the latest job of name is pending or running.
+
+        Parameters
+        ==========
+
+        name [str]:         default is None (any job)
+
+        Returns
+        =======
+
+        running [bool]
+
+        """
+        with self._lock:
+            return any(not job.finished and not job.cancelled
+                       for job_name, job in self._latest.items()
+                       if name is None or job_name == name)
+
+    def shutdown(self, wait=False):
+        """
+        Cancel all jobs and stop workers.
+
+        Parameters
+        ==========
+
+        wait [bool]:        wait for running jobs to stop, default is False
+
+        """
+        self.cancel()
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _work(self):
+        """
+        Worker loop, None stops the worker.
+        """
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job._run()
+
+# %% Private utilities
+
+
+def _call(callback):
+    """
+    Default dispatch: call directly.
+    """
+    callback()
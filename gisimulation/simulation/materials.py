@@ -23,16 +23,39 @@ Beta:
 
 Rho: density in [g/cm3]
 
+Notes
+=====
+
+'nist_lookup' and 'urllib2' are imported on first use, to keep importing
+this module (and thus the command line interface) fast.
+
+Looked up values are cached for the lifetime of the process (see
+clear_cache): the density table is fetched once, delta and beta once per
+material, energies and options, and invalid materials are remembered, so
+repeated input checks and conversions do not repeat (network) look ups.
+
 @author: buechner_m <maria.buechner@gmail.com>
 """
-import nist_lookup.xraydb_plugin as xdb
-import urllib2
+import os
 import numpy as np
+import simulation.file_cache as file_cache
+import simulation.utilities as utilities
+import simulation.timing as timing
 import logging
-logger = logging.getLogger(__name__)
+logger = utilities.get_logger(__name__)
 
 # Constants
 H_C = 1.23984193  # [eV um]
+SAMPLES_FOLDER = os.path.join(os.path.dirname(os.path.dirname(
+                              os.path.abspath(__file__))), 'data', 'samples')
+
+# Process wide caches, see clear_cache()
+_DENSITIES = None  # _DENSITIES[material] = rho, from density table
+_DELTA_BETA = dict()  # _DELTA_BETA[key] = (delta, beta, rho), see _cache_key
+_INVALID_MATERIALS = dict()  # _INVALID_MATERIALS[material, source] = error
+# Conversions of convert()
+CONVERSIONS = ['shift_to_height', 'height_to_shift', 'absorption_to_height',
+               'height_to_absorption']
 
 ###############################################################################
 # Material constant look ups
@@ -75,10 +98,18 @@ def density(material):
     19.3
 
     """
+    global _DENSITIES
     url_material = ('http://x-server.gmca.aps.anl.gov/cgi/'
                     'www_dbli.exe?x0hdb=amorphous%2Batoms')
-    try:
-        page = urllib2.urlopen(url_material).read()
+    if _DENSITIES is None:
+        # Fetch table of all materials once
+        import urllib2
+        try:
+            page = urllib2.urlopen(url_material).read()
+        except urllib2.URLError:
+            logger.error('URL "{0}" cannot be accessed, check internet '
+                         'connection'.format(url_material))
+            raise
         # Format of page, using \r\n to seperate lines
         #   Header
         #   Ac              *Amorphous*     rho=10.05     /Ac/
@@ -91,12 +122,9 @@ def density(material):
             del row[1]  # delete second column '*Amorphous*'
             del row[-1]  # delete last column '/name/'
         page = [[row[0], np.float(row[1].split('=')[1])] for row in page]
-        page = dict(page)
-        return page[material]  # return density belonging to material
-    except urllib2.URLError:
-        logger.error('URL "{0}" cannot be accessed, check internet connection'
-                     .format(url_material))
-        raise
+        _DENSITIES = dict(page)
+    try:
+        return _DENSITIES[material]  # return density belonging to material
     except KeyError:
         logger.error("Density of material '{0}' not accessible at {1}. "
                      "Check spelling and capitalization."
@@ -142,7 +170,7 @@ def read_x0h(material, energy):
     """
     energy = np.array(energy)
     if energy.size > 1:
-        logger.debug('Size of "energy": {}'.format(energy.size))
+        logger.debug('Size of "energy": {}', energy.size)
         raise ValueError('"read_x0h()" does not accept multiple energies at '
                          'a time.')
     url_material = ('http://x-server.gmca.aps.anl.gov/cgi/x0h_form.exe?'
@@ -155,6 +183,7 @@ def read_x0h(material, energy):
     # Miller indices: (i1, i2, i3) = 1, df1df2 = -1
     # modeout: 0 - html out, 1 - quasy-text out with keywords
     # detail: 0 - don't print coords, 1 = print coords
+    import urllib2
     try:
         page = urllib2.urlopen(url_material).read()
         # Retrieve delta and beta values, look at 'page' for details
@@ -219,29 +248,29 @@ def delta_beta_nist(material, energy, rho=0, photo_only=False):
 
     """
     energy = np.array(energy)
-    logger.debug('Material is "{}", energy is {} keV.'.format(material,
-                 energy))
+    logger.debug('Material is "{}", energy is {} keV.', material, energy)
     if photo_only:
         logger.debug('Only consider photo cross-section component.')
     else:
         logger.debug('Consider total cross-section.')
+    import nist_lookup.xraydb_plugin as xdb
     if rho is not 0:
-        logger.debug('Density entered manually: rho = {}'.format(rho))
+        logger.debug('Density entered manually: rho = {}', rho)
         [delta, beta, attenuation_length] = xdb.xray_delta_beta(material, rho,
                                                                 energy*1e3,
                                                                 photo_only)
-        logger.debug('delta: {},\tbeta: {},\tattenuation length: {}'.format(
-            delta, beta, attenuation_length))
+        logger.debug('delta: {},\tbeta: {},\tattenuation length: {}',
+                     delta, beta, attenuation_length)
     else:
         logger.debug('Retrieve density (rho) from'
                      '"http://x-server.gmca.aps.anl.gov/cgi/www_dbli.exe"')
         rho = density(material)
-        logger.debug('Density calculated: rho = {}'.format(rho))
+        logger.debug('Density calculated: rho = {}', rho)
         [delta, beta, attenuation_length] = xdb.xray_delta_beta(material, rho,
                                                                 energy*1e3,
                                                                 photo_only)
-        logger.debug('delta: {},\tbeta: {},\tattenuation length: {}'.format(
-                     delta, beta, attenuation_length))
+        logger.debug('delta: {},\tbeta: {},\tattenuation length: {}',
+                     delta, beta, attenuation_length)
     return delta, beta, rho
 
 
@@ -289,21 +318,20 @@ def delta_beta_x0h(material, energy):
     """
     logger.warning('Values interatively retrieved for each energy. Slow!')
     energy = np.array(energy)
-    logger.debug('Material is "{}", energy is {} keV.'.format(material,
-                 energy))
+    logger.debug('Material is "{}", energy is {} keV.', material, energy)
     logger.debug('Retrieve density (rho) from'
                  '"http://x-server.gmca.aps.anl.gov/cgi/www_dbli.exe"')
     rho = density(material)
-    logger.debug('Density calculated: rho = {}'.format(rho))
+    logger.debug('Density calculated: rho = {}', rho)
     if energy.size is 1:
         delta, beta = read_x0h(material, energy)
     else:
         delta, beta = np.array([read_x0h(material, e) for e in energy]).T
-    logger.debug('delta: {},\tbeta: {}'.format(
-        delta, beta))
+    logger.debug('delta: {},\tbeta: {}', delta, beta)
     return delta, beta, rho
 
 
+@timing.timed('material look up')
 def delta_beta(material, energy, rho=0, photo_only=False, source='nist'):
     """
     Calculate delta and beta values for given material and energy, using the
@@ -348,19 +376,33 @@ def delta_beta(material, energy, rho=0, photo_only=False, source='nist'):
     delta_beta('Au', 30, source='X0h')
     (3.5477e-06, -1.8106e-07, 19.3)
 
+    Values (and invalid materials) are cached, see clear_cache().
+
     """
-    if source.lower() == 'nist':
-        logger.debug('Looking up delta and beta from "nist_lookup"')
-        return delta_beta_nist(material, energy, rho, photo_only)
-    elif source.lower() == 'x0h':
-        logger.debug('Looking up delta and beta from "X0h"')
-        return delta_beta_x0h(material, energy)
-    else:
-        raise ValueError("Wrong data source specified: {0}. Source must be "
-                         "'nist' or 'X0h'".format(source))
+    if (material, source.lower()) in _INVALID_MATERIALS:
+        raise MaterialError(_INVALID_MATERIALS[material, source.lower()])
+    key = _cache_key(material, energy, rho, photo_only, source)
+    if key in _DELTA_BETA:
+        logger.debug('Using cached delta and beta of "{0}".', material)
+        return _copy(_DELTA_BETA[key])
+    try:
+        if source.lower() == 'nist':
+            logger.debug('Looking up delta and beta from "nist_lookup"')
+            values = delta_beta_nist(material, energy, rho, photo_only)
+        elif source.lower() == 'x0h':
+            logger.debug('Looking up delta and beta from "X0h"')
+            values = delta_beta_x0h(material, energy)
+        else:
+            raise ValueError("Wrong data source specified: {0}. Source must "
+                             "be 'nist' or 'X0h'".format(source))
+    except MaterialError as e:
+        _INVALID_MATERIALS[material, source.lower()] = str(e)
+        raise
+    _DELTA_BETA[key] = values
+    return _copy(values)
 
 
-def test_material(material, energy, lut='nist'):
+def test_material(material, energy, lut='nist', photo_only=False):
     """
     Test, if material does exist. Disable logger to suppress logger errors and
     warnings, since here only the existance matters.
@@ -373,16 +415,52 @@ def test_material(material, energy, lut='nist'):
     energy [float]:     x-ray energy [keV]
     lut [str]:          source of values, choices=['nist','X0h'],
                         default='nist'
+    photo_only [bool]:  default=False
+
+    Notes
+    =====
+
+    The looked up values are cached, so that following conversions with the
+    same material, energy and options (e.g. shift_to_height) reuse them.
 
     """
     try:
         logger_level = logger.level
         logger.level = logging.CRITICAL
-        material = delta_beta(material, energy, source=lut)
+        material = delta_beta(material, energy, photo_only=photo_only,
+                              source=lut)
         logger.level = logger_level
     finally:
         logger.level = logger_level
 
+
+def clear_cache():
+    """
+    Clear cached densities, delta and beta values and invalid materials
+    (e.g. after going online or updating the look up table).
+    """
+    global _DENSITIES
+    _DENSITIES = None
+    _DELTA_BETA.clear()
+    _INVALID_MATERIALS.clear()
+
+
+def _cache_key(material, energy, rho, photo_only, source):
+    """
+    Hashable key of delta_beta arguments.
+    """
+    energy = np.asarray(energy, dtype=float)
+    return (material, energy.shape, energy.tobytes(), float(rho),
+            bool(photo_only), source.lower())
+
+
+def _copy(values):
+    """
+    Copy cached (delta, beta, rho), so that callers can not change the cache.
+    """
+    return tuple(value.copy() if isinstance(value, np.ndarray) else value
+                 for value in values)
+
 ###############################################################################
 # Conversions
 ###############################################################################
@@ -416,7 +494,7 @@ def energy_to_wavelength(energy):
 
     """
     energy = np.array(energy)*1e3  # [eV]
-    logger.debug('Energy is {} [eV].'.format(energy))
+    logger.debug('Energy is {} [eV].', energy)
     return H_C / energy  # [um]
 
 
@@ -447,7 +525,7 @@ def wavelength_to_energy(wavelength):
 
     """
     energy = H_C/np.array(wavelength)
-    logger.debug('Energy is {} [eV].'.format(energy))
+    logger.debug('Energy is {} [eV].', energy)
     return energy*1e-3  # [keV]
 
 
@@ -486,7 +564,7 @@ def attenuation_coefficient(beta, energy):
     if np.array(beta).size is not np.array(energy).size:
         raise Exception('Number of betas and energies do not match.')
     wavelength = energy_to_wavelength(energy)
-    logger.debug('Wavelengthis {} [um].'.format(wavelength))
+    logger.debug('Wavelengthis {} [um].', wavelength)
     return 4*np.pi*beta/wavelength
 
 
@@ -572,9 +650,9 @@ def absorption_to_height(absorption, material, energy, rho=0,
 
     """
     beta = delta_beta(material, energy, rho, photo_only, source)[1]
-    logger.debug('Beta is {}.'.format(beta))
+    logger.debug('Beta is {}.', beta)
     mu = attenuation_coefficient(beta, energy)
-    logger.debug('The attenuation coefficient is {} [1/um].'.format(mu))
+    logger.debug('The attenuation coefficient is {} [1/um].', mu)
     return -np.log(1-absorption)/mu
 
 
@@ -617,9 +695,9 @@ def height_to_absorption(height, material, energy, rho=0, photo_only=False,
 
     """
     beta = delta_beta(material, energy, rho, photo_only, source)[1]
-    logger.debug('Beta is {}.'.format(beta))
+    logger.debug('Beta is {}.', beta)
     mu = attenuation_coefficient(beta, energy)
-    logger.debug('The attenuation coefficient is {} [1/um].'.format(mu))
+    logger.debug('The attenuation coefficient is {} [1/um].', mu)
     return 1 - np.exp(-mu*height)
 
 
@@ -683,7 +761,7 @@ def phase_shift(delta, energy):
     if np.array(delta).size is not np.array(energy).size:
         raise Exception('Number of deltas and energies do not match.')
     wavelength = energy_to_wavelength(energy)
-    logger.debug('Wavelengthis {} [um].'.format(wavelength))
+    logger.debug('Wavelengthis {} [um].', wavelength)
     return 2*np.pi*delta/wavelength
 
 
@@ -724,9 +802,9 @@ def shift_to_height(dphi, material, energy, rho=0, photo_only=False,
 
     """
     delta = delta_beta(material, energy, rho, photo_only, source)[0]
-    logger.debug('Delta is {}.'.format(delta))
+    logger.debug('Delta is {}.', delta)
     wavelength = energy_to_wavelength(energy)
-    logger.debug('Wavelengthis {} [um].'.format(wavelength))
+    logger.debug('Wavelengthis {} [um].', wavelength)
     return dphi*wavelength / (2*np.pi*delta)
 
 
@@ -767,18 +845,138 @@ def height_to_shift(height, material, energy, rho=0, photo_only=False,
 
     """
     delta = delta_beta(material, energy, rho, photo_only, source)[0]
-    logger.debug('Delta is {}.'.format(delta))
+    logger.debug('Delta is {}.', delta)
     wavelength = energy_to_wavelength(energy)
-    logger.debug('Wavelengthis {} [um].'.format(wavelength))
+    logger.debug('Wavelengthis {} [um].', wavelength)
     dphi = 2*np.pi*delta*height/wavelength
     return np.mod(dphi, 2.0*np.pi)
 
 
-def read_sample_values():
+def convert(conversions, energy, rho=0, photo_only=False, source='nist'):
     """
-    Read delta and mu fom sample files and interpolate for energies
+    Batched version of shift_to_height, height_to_shift, absorption_to_height
+    and height_to_absorption: converts the values of multiple gratings for
+    all energies at once, looking up delta and beta once per material.
+
+    Parameters
+    ==========
+
+    conversions [list]:     [[conversion, value, material], ...], with
+                            conversion one of CONVERSIONS and value the
+                            phase shift [rad], height [um] or absorption
+    energy: x-ray energy [keV], single value or array
+    rho: density in [g/cm3], default=0 (no density given)
+    photo_only: boolean for returning photo cross-section component only,
+    default=False
+    source: material params LUT... default='nist'
+
+    Returns
+    =======
+
+    results [list]:         converted value of each conversion, with the
+                            shape of energy
+
+    Examples
+    ========
+
+    convert([['shift_to_height', np.pi, 'Au'],
+             ['height_to_shift', 5.8333355272546301, 'Au'],
+             ['absorption_to_height', 0.9, 'Au']], 30)
+    [5.8333355272546301, 3.1415926535897927, 44.209650135346017]
+
     """
-    pass
+    energy = np.array(energy, dtype=float)
+    wavelength = energy_to_wavelength(energy)
+    # Group by material
+    indices = dict()
+    for index, [conversion, value, material] in enumerate(conversions):
+        if conversion not in CONVERSIONS:
+            raise ValueError("Wrong conversion specified: {0}. Conversion "
+                             "must be one of {1}."
+                             .format(conversion, CONVERSIONS))
+        indices.setdefault(material, []).append(index)
+
+    results = [None] * len(conversions)
+    for material, material_indices in indices.items():
+        [delta, beta] = delta_beta(material, energy, rho, photo_only,
+                                   source)[:2]
+        logger.debug('Delta and beta of {0} are {1} and {2}.',
+                     material, delta, beta)
+        mu = attenuation_coefficient(beta, energy)
+        for conversion in CONVERSIONS:
+            group = [index for index in material_indices
+                     if conversions[index][0] == conversion]
+            if not group:
+                continue
+            # values x energies
+            values = np.array([conversions[index][1] for index in group],
+                              dtype=float).reshape((-1,) + (1,)*energy.ndim)
+            if conversion == 'shift_to_height':
+                converted = values*wavelength / (2*np.pi*delta)
+            elif conversion == 'height_to_shift':
+                converted = np.mod(2*np.pi*delta*values/wavelength,
+                                   2.0*np.pi)
+            elif conversion == 'absorption_to_height':
+                converted = -np.log(1-values)/mu
+            else:
+                converted = 1 - np.exp(-mu*values)
+            for index, result in zip(group, converted):
+                results[index] = result
+    return results
+
+
+def read_sample_values(sample, energy, samples_folder=SAMPLES_FOLDER):
+    """
+    Read delta and mu fom sample files and interpolate for energies.
+
+    Parameters
+    ==========
+
+    sample [str]:           name of sample files ('Adipose')
+    energy: x-ray energy [keV]
+    samples_folder [str]:   folder containing 'delta' and 'mu' subfolders,
+                            default is SAMPLES_FOLDER
+
+    Returns
+    =======
+
+    [delta, mu, rho]:       mu as listed in file, rho in [g/cm3] (nan if not
+                            listed)
+
+    Notes
+    =====
+
+    Files are <samples_folder>/delta/<sample>.csv and
+    <samples_folder>/mu/<sample>.csv, with header 'energy,delta' and
+    'energy,mu,density' (density in first row only).
+    Values are interpolated linearly in log-log space, outside of the listed
+    energies the outermost values are used.
+    Parsed files are cached, see simulation.file_cache.
+
+    """
+    energy = np.asarray(energy, dtype=float)
+    values = dict()
+    for value_type in ['delta', 'mu']:
+        file_path = os.path.join(samples_folder, value_type, sample + '.csv')
+        if not os.path.isfile(file_path):
+            error_message = ("Sample file {0} does not exist."
+                             .format(file_path))
+            logger.error(error_message)
+            raise MaterialError(error_message)
+        values[value_type] = file_cache.read_csv(file_path)
+
+    delta = np.exp(np.interp(np.log(energy),
+                             np.log(values['delta']['energy']),
+                             np.log(values['delta']['delta'])))
+    mu = np.exp(np.interp(np.log(energy),
+                          np.log(values['mu']['energy']),
+                          np.log(values['mu']['mu'])))
+    rho = np.nan
+    if 'density' in values['mu'].dtype.names:
+        rho = float(values['mu']['density'][0])
+    logger.debug("Delta and mu of sample {0} are {1} and {2}.",
+                 sample, delta, mu)
+    return [delta, mu, rho]
 
 
 #if _name__ == '__main__':
@@ -0,0 +1,411 @@
+"""
+Module to run independent tasks (energy bins, phase steps) in worker
+processes, with large arrays (grating transmissions, propagators, output
+cubes) shared as memory mapped files instead of pickled copies.
+
+Classes
+=======
+
+SharedArrays:       Arrays in memory mapped files, which workers attach to.
+                    Parameters:
+                        directory [str] (default None)
+
+ParallelExecutor:   Runs function(arrays, task) for all tasks in worker
+                    processes.
+                    Parameters:
+                        number_workers [int] (default None, configured)
+                        chunk_size [int] (default None, configured)
+
+Functions
+=========
+
+configure:          Set default number of workers and chunk size (from
+                    input '-np' and '-cs').
+                    Parameters:
+                        number_workers [int] (default 1)
+                        chunk_size [int] (default None)
+
+chunks:             Split range into chunks.
+                    Parameters:
+                        number_items [int]
+                        chunk_size [int]
+
+attach:             Attach to shared arrays (in worker).
+                    Parameters:
+                        handles [dict]
+
+Usage
+=====
+
+def propagate_energies(arrays, [start, stop]):
+    arrays['output'][..., start:stop] = ...  # Write into shared output
+
+with SharedArrays() as shared:
+    shared.put('g1', g1)
+    shared.create('output', shape, dtype)
+    executor = ParallelExecutor()  # As configured by main (-np, -cs)
+    executor.map(propagate_energies, chunks(number_energies, 4), shared)
+    output = np.array(shared['output'])
+
+From gisimulation folder, demo (polychromatic phase stepping):
+
+python -m simulation.parallel -np 4 -cs 2
+
+Notes
+=====
+
+Arrays are stored as .npy files in a temporary folder (in /dev/shm, i.e.
+RAM, where available) and memory mapped by all processes: only the small
+handles (path, shape, dtype) are pickled. Workers attach once per process
+and array. Inputs should be treated as read-only, outputs must be written by
+disjoint tasks (e.g. energy chunks), since there is no locking.
+
+function must be defined at module level (picklable) and returns the result
+of a task (should be small, e.g. None or scalars).
+
+number_workers: 1 runs all tasks in the calling process, 0 uses all cores.
+main.py configures the defaults of all executors from the input ('-np',
+'-cs', see configure()).
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+import simulation.utilities as utilities
+import logging
+logger = utilities.get_logger(__name__)
+
+# RAM backed folder for shared arrays, if available
+SHARED_MEMORY_DIR = '/dev/shm'
+# Arrays attached by this process: _ATTACHED[path] = np.memmap
+_ATTACHED = dict()
+# Defaults of ParallelExecutor, see configure()
+_NUMBER_WORKERS = 1
+_CHUNK_SIZE = None
+
+# %% Classes
+
+
+class SharedArrays(object):
+    """
+    Arrays in memory mapped files, which worker processes attach to without
+    copying. Use as context manager, to remove the files afterwards.
+
+    Parameters
+    ==========
+
+    directory [str]:    parent folder of the temporary folder, default is
+                        None (SHARED_MEMORY_DIR if available, else system
+                        temporary folder)
+
+    """
+    def __init__(self, directory=None):
+        if directory is None and os.path.isdir(SHARED_MEMORY_DIR):
+            directory = SHARED_MEMORY_DIR
+        self.path = tempfile.mkdtemp(prefix='gisimulation_', dir=directory)
+        self._arrays = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def create(self, name, shape, dtype=np.float64):
+        """
+        Create zero initialized shared array.
+
+        Parameters
+        ==========
+
+        name [str]
+        shape [tuple]
+        dtype:              default is np.float64
+
+        Returns
+        =======
+
+        array [np.memmap]
+
+        """
+        array_path = os.path.join(self.path, name + '.npy')
+        self._arrays[name] = np.lib.format.open_memmap(array_path, mode='w+',
+                                                       dtype=dtype,
+                                                       shape=tuple(shape))
+        return self._arrays[name]
+
+    def put(self, name, array):
+        """
+        Copy array into shared array.
+
+        Parameters
+        ==========
+
+        name [str]
+        array
+
+        Returns
+        =======
+
+        array [np.memmap]
+
+        """
+        array = np.asarray(array)
+        shared = self.create(name, array.shape, array.dtype)
+        shared[...] = array
+        shared.flush()
+        return shared
+
+    def handles(self):
+        """
+        Picklable handles of all arrays, see attach().
+
+        Returns
+        =======
+
+        handles [dict]:     handles[name] = path
+
+        """
+        for array in self._arrays.values():
+            array.flush()
+        return {name: array.filename
+                for name, array in self._arrays.items()}
+
+    def close(self):
+        """
+        Remove all shared arrays.
+        """
+        for array in self._arrays.values():
+            _ATTACHED.pop(array.filename, None)
+        self._arrays.clear()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ParallelExecutor(object):
+    """
+    Runs function(arrays, task) for all tasks in worker processes, arrays are
+    the attached shared arrays.
+
+    Parameters
+    ==========
+
+    number_workers [int]:   worker processes, 0: all cores, 1: in calling
+                            process, default is None (configured, see
+                            configure())
+    chunk_size [int]:       tasks sent to a worker at once, default is None
+                            (configured, else about 4 chunks per worker)
+
+    """
+    def __init__(self, number_workers=None, chunk_size=None):
+        if number_workers is None:
+            number_workers = _NUMBER_WORKERS
+        if chunk_size is None:
+            chunk_size = _CHUNK_SIZE
+        _check_settings(number_workers, chunk_size)
+        if not number_workers:
+            number_workers = multiprocessing.cpu_count()
+        self.number_workers = number_workers
+        self.chunk_size = chunk_size
+
+    def map(self, function, tasks, shared):
+        """
+        Run function for all tasks.
+
+        Parameters
+        ==========
+
+        function:               function(arrays [dict], task), module level
+        tasks [list]
+        shared [SharedArrays]
+
+        Returns
+        =======
+
+        results [list]:         results of function, in order of tasks
+
+        """
+        tasks = list(tasks)
+        handles = shared.handles()
+        if self.number_workers == 1 or len(tasks) <= 1:
+            logger.debug("Running {0} tasks in calling process.", len(tasks))
+            return [_run_task([function, handles, task]) for task in tasks]
+        chunk_size = self.chunk_size or \
+            max(1, int(np.ceil(len(tasks) / (4.0*self.number_workers))))
+        logger.debug("Running {0} tasks in {1} processes (chunk size {2})...",
+                     len(tasks), self.number_workers, chunk_size)
+        pool = multiprocessing.Pool(self.number_workers)
+        try:
+            results = pool.map(_run_task,
+                               [[function, handles, task] for task in tasks],
+                               chunksize=chunk_size)
+        finally:
+            pool.close()
+            pool.join()
+        logger.debug("... done.")
+        return results
+
+# %% Functions
+
+
+def configure(number_workers=1, chunk_size=None):
+    """
+    Set the defaults of all ParallelExecutors (e.g. from input '-np' and
+    '-cs').
+
+    Parameters
+    ==========
+
+    number_workers [int]:   0: all cores, default is 1
+    chunk_size [int]:       default is None (about 4 chunks per worker)
+
+    """
+    global _NUMBER_WORKERS, _CHUNK_SIZE
+    _check_settings(number_workers, chunk_size)
+    _NUMBER_WORKERS = number_workers
+    _CHUNK_SIZE = chunk_size
+    logger.debug("Parallel executors use {0} workers (chunk size {1}).",
+                 number_workers, chunk_size)
+
+
+def chunks(number_items, chunk_size):
+    """
+    Split range(number_items) into chunks.
+
+    Parameters
+    ==========
+
+    number_items [int]
+    chunk_size [int]
+
+    Returns
+    =======
+
+    chunks [list]:      [[start, stop], ...]
+
+    """
+    return [[start, min(start + chunk_size, number_items)]
+            for start in range(0, number_items, chunk_size)]
+
+
+def attach(handles):
+    """
+    Attach to shared arrays (memory mapped, read and write), once per
+    process and array.
+
+    Parameters
+    ==========
+
+    handles [dict]:     see SharedArrays.handles()
+
+    Returns
+    =======
+
+    arrays [dict]:      arrays[name] = np.memmap
+
+    """
+    arrays = dict()
+    for name, path in handles.items():
+        if path not in _ATTACHED:
+            _ATTACHED[path] = np.load(path, mmap_mode='r+')
+        arrays[name] = _ATTACHED[path]
+    return arrays
+
+# %% Private utilities
+
+
+def _check_settings(number_workers, chunk_size):
+    """
+    Raise ValueError for negative number of workers or chunk size < 1.
+    """
+    if number_workers < 0 or (chunk_size is not None and chunk_size < 1):
+        error_message = ("Number of workers must be >= 0 and chunk size >= "
+                         "1, are {0} and {1}."
+                         .format(number_workers, chunk_size))
+        logger.error(error_message)
+        raise ValueError(error_message)
+
+
+def _run_task(arguments):
+    """
+    Attach to shared arrays and run task (in worker).
+    """
+    [function, handles, task] = arguments
+    return function(attach(handles), task)
+
+
+def _stepping_task(arrays, chunk):
+    """
+    Demo task: propagate energies [start, stop) and step G2.
+    """
+    import interferometer.propagation as propagation
+    [start, stop] = chunk
+    wavefield = propagation.apply_propagator(arrays['g1'][:, start:stop],
+                                             arrays['propagators']
+                                             [:, start:stop])
+    intensity = propagation.intensity(wavefield)
+    [number_pixels, number_steps, _] = arrays['output'].shape
+    step_samples = int(arrays['step_samples'][0])
+    for step in range(number_steps):
+        stepped = intensity * \
+            np.roll(arrays['g2'], step*step_samples)[:, np.newaxis]
+        arrays['output'][:, step, start:stop] = \
+            stepped.reshape(number_pixels, -1, stop-start).sum(axis=1)
+
+# %% Main
+
+
+if __name__ == '__main__':
+    import argparse
+    import timeit
+    import simulation.materials as materials
+    import interferometer.propagation as propagation
+    parser = argparse.ArgumentParser(description="Parallel phase stepping "
+                                     "demo, compared to a single process.")
+    parser.add_argument('-np', dest='number_workers', type=int, default=0,
+                        help="Worker processes (0: all cores).")
+    parser.add_argument('-cs', dest='chunk_size', type=int,
+                        help="Tasks (energies) sent to a worker at once.")
+    parser.add_argument('-ne', dest='number_energies', type=int, default=32)
+    parser.add_argument('-ns', dest='number_samples', type=int,
+                        default=2**18)
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    [pitch, sampling, distance] = [4.0, 4.0/256, 4e4]  # [um]
+    [number_pixels, number_steps] = [64, 8]
+    x = np.arange(arguments.number_samples) * sampling
+    energies = np.linspace(20, 40, arguments.number_energies)
+    wavelengths = materials.energy_to_wavelength(energies)
+    with SharedArrays() as shared:
+        shared.put('g1', propagation.grating_wavefield(x, pitch, 0.5,
+                                                       np.pi*30/energies))
+        shared.put('propagators',
+                   propagation.propagator(x.size, distance, wavelengths,
+                                          sampling))
+        shared.put('g2', np.mod(x, pitch/2) >= pitch/4)
+        shared.put('step_samples', [int(pitch/2/sampling/number_steps)])
+        output = shared.create('output', (number_pixels, number_steps,
+                                          energies.size))
+        tasks = chunks(energies.size, 1)
+        timings = dict()
+        for number_workers in [1, arguments.number_workers]:
+            executor = ParallelExecutor(number_workers, arguments.chunk_size)
+            start = timeit.default_timer()
+            executor.map(_stepping_task, tasks, shared)
+            timings[executor.number_workers] = timeit.default_timer() - start
+            if number_workers == 1:
+                reference = np.array(output)
+                output[...] = 0
+        print("Processes: {0}".format(", ".join(
+            "{0}: {1:.2f} s".format(number_workers, duration)
+            for number_workers, duration in sorted(timings.items()))))
+        print("Max. relative difference: {0:.2e}"
+              .format(np.abs(output - reference).max() /
+                      np.abs(reference).max()))
@@ -11,11 +11,13 @@ input_parser():     defines and returns parser
                     Parameters:
                         numerical_type [numpy type] for all numerical arguments
 
+get_arguments_info():   optional keys and help messages of all input arguments
+                        Parameters:
+                            parser (default None: input_parser())
+
 @author: buechner_m <maria.buechner@gmail.com>
 """
 import os.path
-import sys
-import re
 import argparse
 import numpy as np
 
@@ -202,6 +204,20 @@ def input_parser(numerical_type=NUMERICAL_TYPE):
                         help="Increase verbosity level. 'v': error, "
                         "'vv': warning,"
                         "'vvv': info (None=default), 'vvvv': debug")
+    # Timing of calculation stages
+    parser.add_argument('--profile', dest='profile', nargs='?', const=True,
+                        default=False, metavar='JSON_FILE',
+                        help="Print wall time, calls and peak memory per "
+                        "calculation stage at the end. If JSON_FILE is "
+                        "given, the report is also written to it.")
+    # Parallelization
+    parser.add_argument('-np', dest='number_workers', type=int, default=1,
+                        help="Number of worker processes for energies and "
+                        "phase steps (0: all cores).")
+    parser.add_argument('-cs', dest='chunk_size', type=int,
+                        help="Number of tasks (e.g. energies) sent to a "
+                        "worker at once. If not set, about 4 chunks per "
+                        "worker.")
 
     # General and GI Design
     parser.add_argument('-gi', dest='gi_geometry', default='sym',
@@ -244,6 +260,14 @@ def input_parser(numerical_type=NUMERICAL_TYPE):
                         help="Option to consider only photo_absorption "
                         "[bool]. Else, the total cross_section is considered "
                         "(default).")
+    parser.add_argument('-prec', dest='precision', default='double',
+                        type=str.lower,
+                        choices=['single', 'double'],
+                        metavar='PRECISION',
+                        help="Numerical precision of wavefield propagation, "
+                        "detection and retrieval. Choices are\n"
+                        "'single': float32/complex64 (half the memory, "
+                        "faster FFTs), 'double': float64/complex128.")
 
     # Source
     parser.add_argument('-fs', dest='focal_spot_size',
@@ -279,6 +303,29 @@ def input_parser(numerical_type=NUMERICAL_TYPE):
                         action=_TruePositiveNumber,
                         type=numerical_type,
                         help="Step size of range [keV].")
+    parser.add_argument('-sb', dest='spectrum_bins',
+                        action=_TruePositiveNumber,
+                        type=int,
+                        help="Rebin spectrum into this number of bins, "
+                        "adapted to the detected photons (photon "
+                        "conserving).")
+    parser.add_argument('-stol', dest='spectrum_tolerance',
+                        action=_TruePositiveNumber,
+                        type=numerical_type,
+                        help="Rebin spectrum into the smallest number of "
+                        "bins, for which the relative error of the "
+                        "polychromatic mean 1/E^2 stays below this "
+                        "tolerance. Maximum number of bins is "
+                        "'spectrum_bins', if set.")
+    parser.add_argument('-mc', dest='monte_carlo_samples',
+                        action=_TruePositiveNumber,
+                        type=int,
+                        help="Number of Monte-Carlo draws from the detected "
+                        "spectrum. Simulates only the sampled energies "
+                        "instead of the full spectrum.")
+    parser.add_argument('-seed', dest='seed',
+                        type=int,
+                        help="Seed of Monte-Carlo draws.")
     parser.add_argument('-et', dest='exposure_time', default=1,
                         action=_TruePositiveNumber,
                         type=numerical_type,
@@ -598,15 +645,15 @@ def input_parser(numerical_type=NUMERICAL_TYPE):
     return parser
 
 
-def get_arguments_info(parser):
+def get_arguments_info(parser=None):
     """
-    Read help message into variable by putting the stdout output from
-    parser.print_help() into a custom sdtout.
+    Collect optional key and help message of all input arguments directly
+    from the actions of the parser.
 
     Parameters
     ==========
 
-    parser [argparse.ArgumentParser]
+    parser [argparse.ArgumentParser]:   default is None (input_parser())
 
     Returns
     =======
@@ -626,70 +673,32 @@ def get_arguments_info(parser):
     Notes
     =====
 
-    Removes all linebreaks in help message, as they are not the original
-    anymore, but defined via the help formatter used by parser.print_help
-
+    Arguments which are not simulation input (see _NON_INPUT_ARGUMENTS) are
+    skipped.
+    Whitespaces (including linebreaks) in help messages are merged.
+    The info of the default parser is calculated once and then cached, do
+    not modify the returned dict.
 
     """
-    # Reset stdout
-    old_stdout = sys.stdout
-    sys.stdout = parser_help_string = _ListStream()
-    parser.print_help()
-    # Set back to console
-    sys.stdout = old_stdout
-
-    # Get infos
-    complete_help_message = parser_help_string.data[0]
-    help_messages = complete_help_message.split('optional arguments:')[1]
-    help_messages = help_messages.split('-')[7:]
+    global _ARGUMENTS_INFO
+    if parser is None:
+        if _ARGUMENTS_INFO is None:
+            _ARGUMENTS_INFO = get_arguments_info(input_parser())
+        return _ARGUMENTS_INFO
+
     arguments_info = dict()
-    for help_message in help_messages:
-        # Flags (--flag)
-        # A) generate an extra empty help_message
-        if not help_message:
+    for action in parser._actions:
+        if action.dest in _NON_INPUT_ARGUMENTS or not action.option_strings:
             continue
-
-        # "optional_key METAVAR(S)       variable_help\n"
-        # Words in message
-        words = re.split(' ', help_message)
-        variable_key = '-' + words[0]
-        # B) do not accept a metavar (if store_true): words[1] is ''
-        # C) have 2 dashes (--) in their variable key
-        if not words[1]:
-            words[1] = words[0]
-            variable_key = '--' + words[0]
-
-        variable_name = words[1].lower().rstrip()  # Make lower case and
-                                                   # remove trailing \n
-        # Remove potential [] (for e.g. file types)
-        variable_name = variable_name.replace("[", "")  # Remove potential []
-        variable_name = variable_name.replace("]", "")
-        # For nargs=2, remove second entry
-        if words[1] in words[2]:
-            variable_help = filter(None, words[3:])  # Remove ''
-        else:
-            variable_help = filter(None, words[2:])  # Remove ''
-        variable_help = ' '.join(variable_help)
-        variable_help = re.sub('\n', '', variable_help)  # remove print_help
-                                                         # format (induces \n)
-        # Remove: (default..) without removing all '('
-        variable_help = '('.join(variable_help.split('(')[:-1])[:-1]# Remove: (default..)
-        arguments_info[variable_name] = [variable_key, variable_help]
-
+        help_message = ' '.join((action.help or '').split())
+        arguments_info[action.dest] = [action.option_strings[0],
+                                       help_message]
     return arguments_info
 
 # %% Private utilities
 
-
-class _ListStream:
-    """
-    Custom stdout to print into list of string.
-    """
-    def __init__(self):
-        self.data = []
-    def write(self, s):
-        self.data.append(s)
-
-
-
-
+# Parser destinations, which are not simulation input
+_NON_INPUT_ARGUMENTS = ['help', 'verbose', 'profile', 'number_workers',
+                        'chunk_size']
+# Cache of get_arguments_info() for default parser
+_ARGUMENTS_INFO = None
@@ -0,0 +1,541 @@
+"""
+Module to store results dicts in chunked, compressed array stores.
+
+Arrays (ndim >= 1) are stored as datasets, all other values (scalars,
+strings, booleans, None, lists) as attributes. Single datasets can be read
+without loading the whole store and datasets can be extended (appended to)
+along their first axis, e.g. for image stacks or sweep tables.
+
+Formats
+=======
+
+'hdf5':     <name>.h5, one dataset per array (gzip, chunked, resizable along
+            first axis), attributes as JSON strings. Requires h5py.
+'npy':      <name>.npyd folder, one .npy file per array (memory mapped on
+            reading), attributes in attributes.json. Appended parts are
+            stored as <key>.<part>.npy.
+
+Functions
+=========
+
+available_formats:  Formats usable with installed packages.
+
+store_path:         Path of store of results[name] in results folder.
+                    Parameters:
+                        results_dir_path [str]
+                        name [str]
+                        file_format [str]
+
+write:              Write dict to store.
+                    Parameters:
+                        path [str]
+                        results [dict]
+                        mode [str] (default 'w')
+
+append:             Extend dataset along first axis.
+                    Parameters:
+                        path [str]
+                        key [str]
+                        array
+
+read:               Read whole store into dict.
+                    Parameters:
+                        path [str]
+
+read_dataset:       Read single dataset or attribute.
+                    Parameters:
+                        path [str]
+                        key [str]
+
+keys:               List dataset and attribute keys of store.
+                    Parameters:
+                        path [str]
+
+shapes:             Shapes of datasets, without reading them.
+                    Parameters:
+                        path [str]
+
+read_lazy:          Dict of store, values are read on first access.
+                    Parameters:
+                        path [str]
+
+Classes
+=======
+
+LazyDict:           Dict which loads values on first access.
+                    Parameters:
+                        keys [list]
+                        loader (function(key))
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import json
+import shutil
+from functools import partial
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # python 2
+    from collections import MutableMapping
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'hdf5': '.h5', 'npy': '.npyd'}
+COMPRESSION = 'gzip'
+COMPRESSION_LEVEL = 4
+_ATTRIBUTES_FILE = 'attributes.json'
+# h5py module, imported on first use (False if not installed)
+_H5PY = None
+
+# %% Classes
+
+
+class StoreError(Exception):
+    """
+    Error is raised, if store can not be written or read.
+    """
+
+
+class LazyDict(MutableMapping):
+    """
+    Dict which loads values on first access and keeps them afterwards.
+    Behaves like a dict (including iteritems in python 2), but iterating
+    over the values loads all of them.
+
+    Parameters
+    ==========
+
+    keys [list]
+    loader:             function(key), returning value of key
+
+    """
+    _NOT_LOADED = object()
+
+    def __init__(self, keys, loader):
+        self._loader = loader
+        self._data = dict.fromkeys(keys, self._NOT_LOADED)
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if value is self._NOT_LOADED:
+            logger.debug("Loading '{0}'...".format(key))
+            value = self._loader(key)
+            self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, sorted(self._data))
+
+    def is_loaded(self, key):
+        """
+        Check if value of key has already been loaded.
+        """
+        return self._data[key] is not self._NOT_LOADED
+
+    def copy(self):
+        """
+        Shallow copy, keeping values not loaded yet unloaded.
+        """
+        copied = LazyDict([], self._loader)
+        copied._data = self._data.copy()
+        return copied
+
+# %% Functions
+
+
+def available_formats():
+    """
+    Formats usable with installed packages.
+
+    Returns
+    =======
+
+    formats [list]
+
+    """
+    if not _h5py():
+        return ['npy']
+    return ['hdf5', 'npy']
+
+
+def store_path(results_dir_path, name, file_format):
+    """
+    Path of store of results[name] in results folder.
+
+    Parameters
+    ==========
+
+    results_dir_path [str]
+    name [str]:             name of sub dict (e.g. 'geometry')
+    file_format [str]:      'hdf5' or 'npy'
+
+    Returns
+    =======
+
+    path [str]
+
+    """
+    return os.path.join(results_dir_path, name + EXTENSIONS[file_format])
+
+
+def write(path, results, mode='w'):
+    """
+    Write dict to store.
+
+    Parameters
+    ==========
+
+    path [str]:         path to store, format from extension
+    results [dict]
+    mode [str]:         'w': replace existing store, 'a': add to and update
+                        keys of existing store, default is 'w'
+
+    """
+    file_format = _get_format(path)
+    logger.debug("Writing {0} store at {1} (mode '{2}')..."
+                 .format(file_format, path, mode))
+    [datasets, attributes] = _split(results)
+    if file_format == 'hdf5':
+        with _h5py().File(path, mode) as f:
+            for key, array in datasets.items():
+                if key in f:
+                    del f[key]
+                if key in f.attrs:
+                    del f.attrs[key]
+                _create_dataset(f, key, array)
+            for key, value in attributes.items():
+                if key in f:
+                    del f[key]
+                f.attrs[key] = json.dumps(value)
+    else:
+        if mode == 'w' and os.path.isdir(path):
+            shutil.rmtree(path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        stored_attributes = _read_attributes(path)
+        for key, array in datasets.items():
+            _remove_npy_dataset(path, key)
+            stored_attributes.pop(key, None)
+            np.save(os.path.join(path, key + '.npy'), array)
+        for key, value in attributes.items():
+            _remove_npy_dataset(path, key)
+            stored_attributes[key] = value
+        with open(os.path.join(path, _ATTRIBUTES_FILE), 'w') as f:
+            json.dump(stored_attributes, f, indent=1, sort_keys=True)
+    logger.debug("... done.")
+
+
+def append(path, key, array):
+    """
+    Extend dataset along its first axis. Dataset (and store) is created, if
+    it does not exist.
+
+    Parameters
+    ==========
+
+    path [str]:         path to store, format from extension
+    key [str]
+    array:              shape[1:] must match stored dataset
+
+    """
+    array = np.atleast_1d(np.asarray(array))
+    file_format = _get_format(path)
+    if file_format == 'hdf5':
+        with _h5py().File(path, 'a') as f:
+            if key not in f:
+                _create_dataset(f, key, array)
+                return
+            dataset = f[key]
+            if dataset.shape[1:] != array.shape[1:]:
+                error_message = ("Cannot append shape {0} to dataset '{1}' "
+                                 "with entries of shape {2}."
+                                 .format(array.shape, key, dataset.shape[1:]))
+                logger.error(error_message)
+                raise StoreError(error_message)
+            start = dataset.shape[0]
+            dataset.resize(start + array.shape[0], axis=0)
+            dataset[start:] = array
+    else:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        parts = _npy_parts(path, key)
+        if parts:
+            stored_shape = np.load(parts[0], mmap_mode='r').shape
+            if stored_shape[1:] != array.shape[1:]:
+                error_message = ("Cannot append shape {0} to dataset '{1}' "
+                                 "with entries of shape {2}."
+                                 .format(array.shape, key, stored_shape[1:]))
+                logger.error(error_message)
+                raise StoreError(error_message)
+            part_path = os.path.join(path, '{0}.{1}.npy'
+                                     .format(key, len(parts)))
+        else:
+            part_path = os.path.join(path, key + '.npy')
+        np.save(part_path, array)
+
+
+def read(path):
+    """
+    Read whole store into dict.
+
+    Parameters
+    ==========
+
+    path [str]
+
+    Returns
+    =======
+
+    results [dict]
+
+    """
+    return {key: read_dataset(path, key) for key in keys(path)}
+
+
+def read_dataset(path, key):
+    """
+    Read single dataset or attribute, without reading the rest of the store.
+
+    Parameters
+    ==========
+
+    path [str]
+    key [str]
+
+    Returns
+    =======
+
+    value:              npy datasets are memory mapped (read-only), if not
+                        appended to
+
+    """
+    file_format = _get_format(path)
+    if file_format == 'hdf5':
+        with _h5py().File(path, 'r') as f:
+            if key in f:
+                return f[key][...]
+            if key in f.attrs:
+                return _from_json(f.attrs[key])
+    else:
+        parts = _npy_parts(path, key)
+        if len(parts) == 1:
+            return np.load(parts[0], mmap_mode='r')
+        elif parts:
+            return np.concatenate([np.load(part, mmap_mode='r')
+                                   for part in parts])
+        attributes = _read_attributes(path)
+        if key in attributes:
+            return attributes[key]
+    error_message = "'{0}' is not stored in {1}.".format(key, path)
+    logger.error(error_message)
+    raise KeyError(error_message)
+
+
+def keys(path):
+    """
+    List dataset and attribute keys of store.
+
+    Parameters
+    ==========
+
+    path [str]
+
+    Returns
+    =======
+
+    keys [list]
+
+    """
+    file_format = _get_format(path)
+    if file_format == 'hdf5':
+        with _h5py().File(path, 'r') as f:
+            return list(f.keys()) + list(f.attrs.keys())
+    keys_ = [file_[:-len('.npy')] for file_ in os.listdir(path)
+             if file_.endswith('.npy') and
+             not file_[:-len('.npy')].split('.')[-1].isdigit()]
+    return keys_ + list(_read_attributes(path).keys())
+
+
+def shapes(path):
+    """
+    Shapes of datasets, without reading them (attributes are not included).
+
+    Parameters
+    ==========
+
+    path [str]
+
+    Returns
+    =======
+
+    shapes [dict]:      shapes[key] = shape [tuple], including appended parts
+
+    """
+    file_format = _get_format(path)
+    if file_format == 'hdf5':
+        with _h5py().File(path, 'r') as f:
+            return {key: f[key].shape for key in f.keys()}
+    shapes_ = dict()
+    for key in keys(path):
+        parts = _npy_parts(path, key)
+        if not parts:
+            continue  # Attribute
+        # Memory mapped, only the headers are read
+        part_shapes = [np.load(part, mmap_mode='r').shape for part in parts]
+        shapes_[key] = ((sum(shape[0] for shape in part_shapes),) +
+                        part_shapes[0][1:])
+    return shapes_
+
+
+def read_lazy(path):
+    """
+    Dict of store, values are read on first access (npy datasets are memory
+    mapped).
+
+    Parameters
+    ==========
+
+    path [str]
+
+    Returns
+    =======
+
+    results [LazyDict]
+
+    """
+    return LazyDict(keys(path), partial(read_dataset, path))
+
+# %% Private utilities
+
+
+def _h5py():
+    """
+    Import h5py on first use, returns False if it is not installed.
+    """
+    global _H5PY
+    if _H5PY is None:
+        try:
+            import h5py
+            _H5PY = h5py
+        except ImportError:
+            _H5PY = False
+    return _H5PY
+
+
+def _get_format(path):
+    """
+    Get store format from path extension, check if it is available.
+    """
+    for file_format, extension in EXTENSIONS.items():
+        if path.endswith(extension):
+            if file_format not in available_formats():
+                error_message = ("Format '{0}' requires h5py, which is not "
+                                 "installed.".format(file_format))
+                logger.error(error_message)
+                raise StoreError(error_message)
+            return file_format
+    error_message = ("Unknown store extension of {0}, must be one of {1}."
+                     .format(path, EXTENSIONS.values()))
+    logger.error(error_message)
+    raise StoreError(error_message)
+
+
+def _split(results):
+    """
+    Split dict into arrays (datasets) and JSON serializable attributes.
+    """
+    datasets = dict()
+    attributes = dict()
+    for key, value in results.items():
+        if isinstance(value, np.ndarray) and value.ndim >= 1 and \
+                value.size > 0 and value.dtype.kind in 'biufc':
+            datasets[key] = value
+        else:
+            attributes[key] = _to_json_value(value)
+    return [datasets, attributes]
+
+
+def _to_json_value(value):
+    """
+    Convert numpy types to JSON serializable types.
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(entry) for entry in value]
+    return value
+
+
+def _from_json(text):
+    """
+    Load JSON attribute, with strings as str.
+    """
+    return _to_str(json.loads(text))
+
+
+def _to_str(value):
+    """
+    Convert unicode (python 2) in JSON values to str.
+    """
+    if isinstance(value, list):
+        return [_to_str(entry) for entry in value]
+    if isinstance(value, dict):
+        return {_to_str(key): _to_str(entry) for key, entry in value.items()}
+    if type(value) is not str and hasattr(value, 'encode'):
+        return value.encode('utf-8')
+    return value
+
+
+def _create_dataset(h5_file, key, array):
+    """
+    Create chunked, compressed dataset, resizable along first axis.
+    """
+    h5_file.create_dataset(key, data=array, chunks=True,
+                           maxshape=(None,) + array.shape[1:],
+                           compression=COMPRESSION,
+                           compression_opts=COMPRESSION_LEVEL,
+                           shuffle=True)
+
+
+def _read_attributes(path):
+    """
+    Read attributes.json of npy store.
+    """
+    attributes_path = os.path.join(path, _ATTRIBUTES_FILE)
+    if not os.path.isfile(attributes_path):
+        return dict()
+    with open(attributes_path, 'r') as f:
+        return _to_str(json.load(f))
+
+
+def _npy_parts(path, key):
+    """
+    Sorted part files of npy dataset.
+    """
+    parts = []
+    part_path = os.path.join(path, key + '.npy')
+    while os.path.isfile(part_path):
+        parts.append(part_path)
+        part_path = os.path.join(path, '{0}.{1}.npy'.format(key, len(parts)))
+    return parts
+
+
+def _remove_npy_dataset(path, key):
+    """
+    Remove all parts of npy dataset.
+    """
+    for part in _npy_parts(path, key):
+        os.remove(part)
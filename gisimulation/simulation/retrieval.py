@@ -0,0 +1,114 @@
+"""
+Module to retrieve transmission, differential phase and dark field from
+phase stepping curves (Fourier analysis), in single or double precision.
+
+Functions
+=========
+
+phase_stepping:     Offset, phase and visibility of stepping curves.
+                    Parameters:
+                        stepping_curves [..., steps]
+                        precision [str] (default None)
+
+retrieve:           Transmission, differential phase and dark field of
+                    sample relative to reference scan.
+                    Parameters:
+                        sample_curves [..., steps]
+                        reference_curves [..., steps]
+                        precision [str] (default None)
+
+Notes
+=====
+
+Steps must be equidistant and cover exactly one period of the stepped
+grating. The stepping axis is the last axis.
+
+Per pixel, with F the FFT along the steps:
+    offset = |F[0]| / steps
+    phase = angle(F[1])
+    visibility = 2 |F[1]| / |F[0]|
+
+Relative to the reference:
+    transmission = offset_sample / offset_reference
+    differential_phase = phase_sample - phase_reference, wrapped to [-pi, pi)
+    dark_field = visibility_sample / visibility_reference
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import numpy as np
+import simulation.utilities as utilities
+import simulation.timing as timing
+import logging
+logger = utilities.get_logger(__name__)
+
+# %% Functions
+
+
+def phase_stepping(stepping_curves, precision=None):
+    """
+    Offset, phase and visibility of stepping curves.
+
+    Parameters
+    ==========
+
+    stepping_curves:        [..., steps]
+    precision [str]:        'single' or 'double', default is None
+                            (see utilities.configure_precision)
+
+    Returns
+    =======
+
+    [offset, phase, visibility]:    [...], real dtype of precision
+
+    """
+    import scipy.fftpack
+    [real_type, _] = utilities.get_dtypes(precision)
+    stepping_curves = np.asarray(stepping_curves, dtype=real_type)
+    number_steps = stepping_curves.shape[-1]
+    if number_steps < 3:
+        error_message = ("At least 3 phase steps are required, {0} given."
+                         .format(number_steps))
+        logger.error(error_message)
+        raise ValueError(error_message)
+    coefficients = scipy.fftpack.fft(stepping_curves, axis=-1)[..., :2]
+    amplitudes = np.abs(coefficients)
+    offset = amplitudes[..., 0] / number_steps
+    phase = np.angle(coefficients[..., 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        visibility = 2 * amplitudes[..., 1] / amplitudes[..., 0]
+    return [offset.astype(real_type), phase.astype(real_type),
+            visibility.astype(real_type)]
+
+
+@timing.timed('retrieval')
+def retrieve(sample_curves, reference_curves, precision=None):
+    """
+    Transmission, differential phase and dark field of the sample scan
+    relative to the reference scan.
+
+    Parameters
+    ==========
+
+    sample_curves:          [..., steps]
+    reference_curves:       [..., steps]
+    precision [str]:        'single' or 'double', default is None
+                            (see utilities.configure_precision)
+
+    Returns
+    =======
+
+    [transmission, differential_phase, dark_field]:     [...], real dtype of
+                                                        precision
+
+    """
+    [offset_sample, phase_sample, visibility_sample] = \
+        phase_stepping(sample_curves, precision)
+    [offset_reference, phase_reference, visibility_reference] = \
+        phase_stepping(reference_curves, precision)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        transmission = offset_sample / offset_reference
+        dark_field = visibility_sample / visibility_reference
+    differential_phase = np.mod(phase_sample - phase_reference + np.pi,
+                                2*np.pi) - np.pi
+    return [transmission, differential_phase.astype(transmission.dtype),
+            dark_field]
@@ -0,0 +1,348 @@
+"""
+Module to cache results of identical runs, content-addressed by a hash of the
+canonical input parameters (see main.collect_input) and the versions of all
+files and look up tables the run depends on.
+
+Functions
+=========
+
+run_hash:       Stable hash of input parameters and file versions.
+                Parameters:
+                    input_parameters [dict]
+                    stage [str]
+
+get:            Cached results of hash, None if not cached.
+                Parameters:
+                    key [str]
+                    cache_dir [str] (default None)
+
+put:            Store results and evict least recently used entries.
+                Parameters:
+                    key [str]
+                    results [dict]
+                    cache_dir [str] (default None)
+                    max_size [int] (default MAX_SIZE)
+
+entries:        List cache entries.
+                Parameters:
+                    cache_dir [str] (default None)
+
+prune:          Remove least recently used entries until total size fits.
+                Parameters:
+                    max_size [int]
+                    cache_dir [str] (default None)
+
+Usage
+=====
+
+From gisimulation folder:
+
+python -m simulation.run_cache list
+python -m simulation.run_cache prune -s 100     (max. size in MB)
+python -m simulation.run_cache prune -s 0       (clear cache)
+
+Notes
+=====
+
+Each entry is a folder <cache_dir>/<hash> with one results_store .npyd store
+per results sub dict and info.json. The modification time of info.json is
+the last use (updated on every hit), which orders the LRU eviction.
+
+Hashed input:
+    - input_parameters as canonical JSON (sorted keys, arrays as lists)
+    - stage (e.g. 'geometry') and CACHE_VERSION
+    - for every value, which is a path to an existing file (e.g. spectrum):
+      sha1 of file content
+    - look up table and the version of its source (nist_lookup files)
+
+Increase CACHE_VERSION if the calculations change, to invalidate all entries.
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import simulation.results_store as results_store
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.gisimulation',
+                                 'runs')
+MAX_SIZE = 1024**3  # [bytes]
+_INFO_FILE = 'info.json'
+_LOOK_UP_TABLE_KEY = '-lut'
+
+# %% Functions
+
+
+def run_hash(input_parameters, stage):
+    """
+    Stable hash of input parameters and the versions of the files and look up
+    table they depend on.
+
+    Parameters
+    ==========
+
+    input_parameters [dict]:    input_parameters[var_key] = value
+                                (main.collect_input)
+    stage [str]:                calculation stage, e.g. 'geometry'
+
+    Returns
+    =======
+
+    key [str]:                  sha1 hex digest
+
+    """
+    canonical = dict()
+    canonical['input'] = {str(var_key): _to_json_value(value)
+                          for var_key, value in input_parameters.items()}
+    canonical['stage'] = stage
+    canonical['cache_version'] = CACHE_VERSION
+    canonical['files'] = {str(value): _file_hash(value)
+                          for value in input_parameters.values()
+                          if isinstance(value, str) and os.path.isfile(value)}
+    canonical['look_up_table'] = \
+        _look_up_table_version(input_parameters.get(_LOOK_UP_TABLE_KEY))
+    text = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def get(key, cache_dir=None):
+    """
+    Cached results of hash, marks entry as used.
+
+    Parameters
+    ==========
+
+    key [str]
+    cache_dir [str]:        default is None (DEFAULT_CACHE_DIR)
+
+    Returns
+    =======
+
+    results [dict]:         results[sub_dict_name] = dict, None if not cached
+
+    """
+    entry_path = os.path.join(cache_dir or DEFAULT_CACHE_DIR, key)
+    info_path = os.path.join(entry_path, _INFO_FILE)
+    if not os.path.isfile(info_path):
+        logger.debug("Run {0} not cached.".format(key))
+        return None
+    results = dict()
+    for store in os.listdir(entry_path):
+        [name, extension] = os.path.splitext(store)
+        if extension != results_store.EXTENSIONS['npy']:
+            continue
+        results[name] = {variable: _to_array(value) for variable, value
+                         in results_store.read(os.path.join(entry_path,
+                                                            store)).items()}
+    os.utime(info_path, None)  # Mark as used
+    logger.info("Loaded cached results of run {0}.".format(key))
+    return results
+
+
+def put(key, results, cache_dir=None, max_size=MAX_SIZE):
+    """
+    Store results of hash and evict least recently used entries, until the
+    cache fits max_size. Caching is best effort, errors on writing are
+    logged, not raised.
+
+    Parameters
+    ==========
+
+    key [str]
+    results [dict]:         results[sub_dict_name] = dict, empty sub dicts
+                            are skipped
+    cache_dir [str]:        default is None (DEFAULT_CACHE_DIR)
+    max_size [int]:         [bytes], default is MAX_SIZE
+
+    Returns
+    =======
+
+    success [bool]
+
+    """
+    try:
+        _put(key, results, cache_dir or DEFAULT_CACHE_DIR)
+        prune(max_size, cache_dir)
+    except (IOError, OSError) as e:
+        logger.warning("Could not cache results of run {0}: {1}"
+                       .format(key, e))
+        return False
+    return True
+
+
+def entries(cache_dir=None):
+    """
+    List cache entries, most recently used first.
+
+    Parameters
+    ==========
+
+    cache_dir [str]:        default is None (DEFAULT_CACHE_DIR)
+
+    Returns
+    =======
+
+    entries [list]:         [[key, size [bytes], last_used [s]], ...]
+
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return []
+    entries_ = []
+    for key in os.listdir(cache_dir):
+        info_path = os.path.join(cache_dir, key, _INFO_FILE)
+        if not os.path.isfile(info_path):
+            continue  # Temporary or incomplete
+        with open(info_path, 'r') as f:
+            size = json.load(f)['size']
+        entries_.append([key, size, os.stat(info_path).st_mtime])
+    return sorted(entries_, key=lambda entry: entry[2], reverse=True)
+
+
+def prune(max_size, cache_dir=None):
+    """
+    Remove least recently used entries, until the total size fits max_size.
+
+    Parameters
+    ==========
+
+    max_size [int]:         [bytes], 0 clears the cache
+    cache_dir [str]:        default is None (DEFAULT_CACHE_DIR)
+
+    Returns
+    =======
+
+    removed [list]:         keys of removed entries
+
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    total_size = 0
+    removed = []
+    for [key, size, _] in entries(cache_dir):
+        total_size += size
+        if total_size > max_size:
+            shutil.rmtree(os.path.join(cache_dir, key))
+            removed.append(key)
+    if removed:
+        logger.info("Removed {0} cached runs.".format(len(removed)))
+    return removed
+
+# %% Private utilities
+
+
+def _put(key, results, cache_dir):
+    """
+    Write cache entry.
+    """
+    entry_path = os.path.join(cache_dir, key)
+    # Write to temporary folder and rename, so entries are always complete
+    temp_path = '{0}.{1}.tmp'.format(entry_path, os.getpid())
+    if os.path.isdir(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+    for name, sub_dict in results.items():
+        if not sub_dict:
+            continue
+        results_store.write(results_store.store_path(temp_path, name, 'npy'),
+                            sub_dict)
+    with open(os.path.join(temp_path, _INFO_FILE), 'w') as f:
+        json.dump(dict(created=time.time(), size=_folder_size(temp_path)), f)
+    if os.path.isdir(entry_path):
+        shutil.rmtree(entry_path)
+    os.rename(temp_path, entry_path)
+    logger.debug("Cached results of run {0}.".format(key))
+
+
+def _to_json_value(value):
+    """
+    Convert numpy types to JSON serializable types.
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(entry) for entry in value]
+    return value
+
+
+def _to_array(value):
+    """
+    Copy memory mapped arrays into memory, so cache entries can be removed.
+    """
+    if isinstance(value, np.memmap):
+        return np.array(value)
+    return value
+
+
+def _file_hash(file_path):
+    """
+    sha1 of file content.
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _look_up_table_version(look_up_table):
+    """
+    Version of look up table source: size and mtime of the nist_lookup
+    files (without importing it), the name for online sources.
+    """
+    if look_up_table is None or look_up_table.lower() == 'x0h':
+        return look_up_table
+    try:
+        import imp
+        package_path = imp.find_module('nist_lookup')[1]
+    except ImportError:
+        return [look_up_table, None]
+    version = []
+    for file_ in sorted(os.listdir(package_path)):
+        stat = os.stat(os.path.join(package_path, file_))
+        version.append([file_, stat.st_size, stat.st_mtime])
+    return [look_up_table, version]
+
+
+def _folder_size(folder_path):
+    """
+    Total size of all files in folder [bytes].
+    """
+    return sum(os.path.getsize(os.path.join(root, file_))
+               for [root, _, files] in os.walk(folder_path)
+               for file_ in files)
+
+# %% Main
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect and prune the "
+                                     "cache of identical runs.")
+    parser.add_argument('command', choices=['list', 'prune'])
+    parser.add_argument('-s', dest='max_size', type=float,
+                        default=MAX_SIZE/1024.0**2,
+                        help="Maximum cache size [MB] for prune.")
+    parser.add_argument('-d', dest='cache_dir', default=DEFAULT_CACHE_DIR,
+                        help="Cache folder.")
+    arguments = parser.parse_args()
+
+    if arguments.command == 'list':
+        cached = entries(arguments.cache_dir)
+        for [key, size, last_used] in cached:
+            print("{0}  {1:>10.3f} MB  {2}"
+                  .format(key, size/1024.0**2,
+                          time.strftime('%Y-%m-%d %H:%M:%S',
+                                        time.localtime(last_used))))
+        print("{0} entries, {1:.3f} MB in {2}"
+              .format(len(cached),
+                      sum(entry[1] for entry in cached)/1024.0**2,
+                      arguments.cache_dir))
+    else:
+        removed = prune(int(arguments.max_size*1024**2), arguments.cache_dir)
+        print("Removed {0} entries.".format(len(removed)))
@@ -0,0 +1,327 @@
+"""
+Module to simulate large fields of view within a memory budget: the field of
+view is tiled into overlapping strips (along x), which are simulated
+independently and stitched into the detector image.
+
+Functions
+=========
+
+strip_overlap:  Overlap [pixels] needed for propagation and PSF.
+                Parameters:
+                    distance [um]
+                    wavelength [um]
+                    sampling_rate [um]
+                    pixel_size [um]
+                    point_spread_function [um] (default None)
+
+plan_strips:    Tile field of view into strips fitting the memory budget.
+                Parameters:
+                    number_pixels [int]
+                    bytes_per_pixel [int]
+                    memory_budget [int]
+                    overlap [int]
+                    number_workers [int] (default 1)
+
+run:            Simulate all strips and stitch the results.
+                Parameters:
+                    simulate_strip (function(start, stop))
+                    strips [list]
+                    image_shape [tuple]
+                    output_path [str] (default None)
+                    dtype (default None)
+                    number_workers [int] (default 1)
+                    checkpoint [Checkpoint] (default None)
+
+Classes
+=======
+
+SchedulerError: Raised, if the budget is too small for a single strip.
+
+Usage
+=====
+
+overlap = strip_overlap(distance, wavelength, sampling_rate, pixel_size,
+                        point_spread_function)
+strips = plan_strips(field_of_view[0], bytes_per_pixel, memory_budget,
+                     overlap, number_workers)
+image = run(simulate_strip, strips, tuple(field_of_view), 'image.npy',
+            number_workers=number_workers)
+
+From gisimulation folder, demo with peak RSS:
+
+python -m simulation.scheduler -fov 4096 128 -m 64 [-np 2] [--check]
+    [--resume]
+
+Notes
+=====
+
+simulate_strip(start, stop) simulates detector pixels [start, stop) along x
+(including the overlap) and returns them as array [stop-start, ...]. Only
+the core of each strip (without overlap) is written to the image, thus
+edge effects of the strip (e.g. periodic FFT boundaries, PSF) are cut off.
+At the edges of the field of view, start < 0 and stop > number_pixels, i.e.
+the surroundings of the field of view are simulated as well.
+
+Overlap: the lateral spread of the propagated field is at most
+wavelength * distance / (2 * sampling_rate) (highest sampled frequency); the
+PSF is truncated at 4 sigma (as scipy.ndimage.gaussian_filter).
+
+With output_path, the image is a .npy memory map and every strip is flushed
+after writing, so the stitched image does not stay in memory. The budget is
+shared by all workers (strips run in threads, numpy releases the GIL), so
+peak memory is about memory_budget plus the baseline of the process.
+
+With a checkpoint (see simulation.checkpoint), the cores of finished strips
+are persisted (items are the strip indices), and strips of an interrupted
+run are read from the checkpoint instead of being simulated again. Cores
+are kept in memory until the checkpoint is flushed, so choose a short
+checkpoint interval for large images.
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import threading
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import simulation.utilities as utilities
+import simulation.timing as timing
+import logging
+logger = utilities.get_logger(__name__)
+
+# PSF (gaussian) is truncated at TRUNCATE sigma
+TRUNCATE = 4.0
+
+# %% Classes
+
+
+class SchedulerError(Exception):
+    """
+    Error is raised, if the memory budget is too small for a single strip.
+    """
+
+# %% Functions
+
+
+def strip_overlap(distance, wavelength, sampling_rate, pixel_size,
+                  point_spread_function=None):
+    """
+    Overlap between strips, so that the core of each strip is not affected
+    by its edges.
+
+    Parameters
+    ==========
+
+    distance [um]:                  propagation distance
+    wavelength [um]:                scalar or [energies] (largest is used)
+    sampling_rate [um]:             sampling of the wavefield
+    pixel_size [um]
+    point_spread_function [um]:     FWHM, default is None (no PSF)
+
+    Returns
+    =======
+
+    overlap [int]:                  [pixels], on each side of a strip
+
+    """
+    spread = np.max(wavelength) * distance / (2.0*sampling_rate)  # [um]
+    if point_spread_function:
+        sigma = point_spread_function / (2*np.sqrt(2*np.log(2)))
+        spread += TRUNCATE * sigma
+    overlap = int(np.ceil(spread / pixel_size))
+    logger.debug("Strip overlap: {0} pixels ({1} um).", overlap, spread)
+    return overlap
+
+
+def plan_strips(number_pixels, bytes_per_pixel, memory_budget, overlap,
+                number_workers=1):
+    """
+    Tile number_pixels (along x) into strips, so that number_workers strips
+    including their overlap fit into the memory budget.
+
+    Parameters
+    ==========
+
+    number_pixels [int]:        field of view along x [pixels]
+    bytes_per_pixel [int]:      working memory of one pixel along x (all
+                                samples along y and energies, all arrays of
+                                simulate_strip)
+    memory_budget [int]:        [bytes]
+    overlap [int]:              [pixels], see strip_overlap()
+    number_workers [int]:       strips simulated at the same time, default is
+                                1
+
+    Returns
+    =======
+
+    strips [list]:              [[start, stop, core_start, core_stop], ...],
+                                simulated pixels [start, stop), written
+                                pixels [core_start, core_stop). start and
+                                stop exceed the field of view at its edges
+                                (by overlap).
+
+    """
+    strip_pixels = int(memory_budget // number_workers // bytes_per_pixel)
+    core_pixels = strip_pixels - 2*overlap
+    if core_pixels < 1:
+        error_message = ("Memory budget of {0:.1f} MB is too small: a strip "
+                         "with {1} overlap pixels needs at least {2:.1f} MB "
+                         "per worker."
+                         .format(memory_budget/1024.0**2, overlap,
+                                 (2*overlap+1)*bytes_per_pixel/1024.0**2))
+        logger.error(error_message)
+        raise SchedulerError(error_message)
+    strips = []
+    for core_start in range(0, number_pixels, core_pixels):
+        core_stop = min(core_start + core_pixels, number_pixels)
+        strips.append([core_start - overlap, core_stop + overlap,
+                       core_start, core_stop])
+    logger.info("Field of view of {0} pixels tiled into {1} strips "
+                "({2} + 2x{3} pixels).", number_pixels, len(strips),
+                core_pixels, overlap)
+    return strips
+
+
+def run(simulate_strip, strips, image_shape, output_path=None,
+        dtype=None, number_workers=1, checkpoint=None):
+    """
+    Simulate all strips and stitch their cores into the image.
+
+    Parameters
+    ==========
+
+    simulate_strip:         function(start, stop), returns [stop-start, ...]
+    strips [list]:          see plan_strips()
+    image_shape [tuple]:    (number_pixels, ...)
+    output_path [str]:      .npy file of the image (memory mapped), default
+                            is None (image in memory)
+    dtype:                  default is None (real dtype of the configured
+                            precision, see utilities.configure_precision)
+    number_workers [int]:   default is 1
+    checkpoint:             Checkpoint of finished strips, default is None
+
+    Returns
+    =======
+
+    image:                  np.memmap if output_path is given
+
+    """
+    if dtype is None:
+        [dtype, _] = utilities.get_dtypes()
+    if output_path:
+        image = np.lib.format.open_memmap(output_path, mode='w+', dtype=dtype,
+                                          shape=tuple(image_shape))
+    else:
+        image = np.zeros(image_shape, dtype=dtype)
+    lock = threading.Lock()
+
+    def simulate(index):
+        [start, stop, core_start, core_stop] = strips[index]
+        if checkpoint is not None and index in checkpoint:
+            core = checkpoint.get(index)['core']
+        else:
+            with timing.stage('strip'):
+                result = simulate_strip(start, stop)
+            core = result[core_start-start:core_stop-start]
+            if checkpoint is not None:
+                checkpoint.add(index, {'core': core})
+        with lock:
+            image[core_start:core_stop] = core
+            if output_path:
+                image.flush()
+        logger.debug("Strip [{0}, {1}) done.", core_start, core_stop)
+
+    logger.info("Simulating {0} strips...", len(strips))
+    if number_workers > 1:
+        pool = ThreadPool(number_workers)
+        try:
+            pool.map(simulate, range(len(strips)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            if checkpoint is not None:
+                checkpoint.flush()
+    else:
+        try:
+            for index in range(len(strips)):
+                simulate(index)
+        finally:
+            if checkpoint is not None:
+                checkpoint.flush()
+    logger.info("... done.")
+    return image
+
+# %% Main
+
+
+if __name__ == '__main__':
+    import argparse
+    import interferometer.propagation as propagation
+    import interferometer.detector as detector
+    parser = argparse.ArgumentParser(description="Strip scheduler demo: "
+                                     "G1 with a phase object, propagated to "
+                                     "G2 and detected, within a memory "
+                                     "budget.")
+    parser.add_argument('-fov', dest='field_of_view', nargs=2, type=int,
+                        default=[1024, 128], help="[pixels]")
+    parser.add_argument('-m', dest='memory_budget', type=float, default=64,
+                        help="Memory budget [MB].")
+    parser.add_argument('-np', dest='number_workers', type=int, default=1)
+    parser.add_argument('-o', dest='output_path',
+                        help="Image .npy file (memory mapped).")
+    parser.add_argument('--check', action='store_true',
+                        help="Compare to full field (needs memory).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Checkpoint finished strips, resume an "
+                        "interrupted run.")
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    [pitch, pixel_size, sampling, distance, wavelength, psf] = \
+        [4.0, 8.0, 0.125, 4e4, 5e-5, 40.0]  # [um]
+    samples_per_pixel = int(pixel_size / sampling)
+    number_y = arguments.field_of_view[1]
+    detector_ = detector.Detector('conv', psf, pixel_size, None, None, None,
+                                  None, None, None, False, sampling)
+
+    def simulate_strip(start, stop):
+        x = np.arange(start*samples_per_pixel,
+                      stop*samples_per_pixel) * sampling
+        y = np.arange(number_y) * pixel_size
+        sample = np.exp(-1j*np.sin(x[:, np.newaxis]/500.0) *
+                        np.cos(y/300.0))
+        wavefield = propagation.grating_wavefield(x, pitch, 0.5, np.pi)
+        wavefield = propagation.propagate(wavefield[:, np.newaxis]*sample,
+                                          distance, wavelength, sampling)
+        intensity = propagation.intensity(wavefield)
+        intensity *= (np.mod(x, pitch/2) >= pitch/4)[:, np.newaxis]
+        pixels = intensity.reshape(stop-start, samples_per_pixel,
+                                   number_y).sum(axis=1)
+        return detector_.detect(pixels[..., np.newaxis])[..., 0]
+
+    # Peak: 6 complex128 (sample, wavefield, spectra) and 2 float64 arrays
+    bytes_per_pixel = samples_per_pixel * number_y * (6*16 + 2*8)
+    overlap = strip_overlap(distance, wavelength, sampling, pixel_size, psf)
+    strips = plan_strips(arguments.field_of_view[0], bytes_per_pixel,
+                         int(arguments.memory_budget*1024**2), overlap,
+                         arguments.number_workers)
+    checkpoint_ = None
+    if arguments.resume:
+        import simulation.run_cache as run_cache
+        import simulation.checkpoint as checkpoint
+        checkpoint_ = checkpoint.Checkpoint(
+            run_cache.run_hash({'-fov': arguments.field_of_view,
+                                '-m': arguments.memory_budget,
+                                '-np': arguments.number_workers},
+                               'scheduler demo'), interval=0)
+    timing.enable()
+    image = run(simulate_strip, strips, tuple(arguments.field_of_view),
+                arguments.output_path,
+                number_workers=arguments.number_workers,
+                checkpoint=checkpoint_)
+    print(timing.format_report())
+    if checkpoint_ is not None:
+        checkpoint_.remove()
+    if arguments.check:
+        full = simulate_strip(-overlap, arguments.field_of_view[0] +
+                              overlap)[overlap:-overlap]
+        print("Max. relative difference to full field: {0:.2e}"
+              .format(np.abs(image - full).max() / np.abs(full).max()))
@@ -0,0 +1,328 @@
+"""
+Module to resample x-ray spectra into fewer energy bins or into Monte-Carlo
+samples.
+
+Functions
+=========
+
+rebin:              Photon conserving rebinning into given bins.
+                    Parameters:
+                        spectrum [dict]
+                        bin_indices [int array]
+                        weights (default None)
+
+adaptive_bins:      Bin indices with equal effective weight per bin.
+                    Parameters:
+                        weights
+                        number_bins [int]
+
+optimal_rebin:      Smallest number of adaptive bins meeting a tolerance on a
+                    polychromatic metric.
+                    Parameters:
+                        spectrum [dict]
+                        efficiency (default None)
+                        tolerance (default 1e-3)
+                        metric (default mean_inverse_square_energy)
+                        max_bins [int] (default None)
+
+sample_energies:    Importance sampling of energies from the effective
+                    spectrum.
+                    Parameters:
+                        spectrum [dict]
+                        number_samples [int]
+                        efficiency (default None)
+                        seed [int] (default None)
+                        worker [int] (default 0)
+                        number_workers [int] (default 1)
+
+monte_carlo_estimate:   Polychromatic estimate and its variance from the
+                        contributions of the sampled energies.
+                        Parameters:
+                            contributions
+                            counts [int array]
+                            number_samples [int]
+
+Notes
+=====
+
+spectrum [dict] [keV]:      spectrum['energies']
+                            spectrum['photons']
+
+The effective weight of an energy is the number of detected photons:
+    weight = photons * efficiency
+with efficiency e.g. filter transmission * detector efficiency.
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+# %% Functions
+
+
+def mean_inverse_square_energy(energies, weights):
+    """
+    Default polychromatic metric: weighted mean of 1/E^2, to which the
+    refraction angle (delta) is proportional.
+
+    Parameters
+    ==========
+
+    energies [keV]
+    weights
+
+    Returns
+    =======
+
+    metric [1/keV^2]
+
+    """
+    return np.sum(weights / np.square(energies)) / np.sum(weights)
+
+
+def rebin(spectrum, bin_indices, weights=None):
+    """
+    Rebin spectrum, conserving the total number of photons.
+
+    Parameters
+    ==========
+
+    spectrum [dict]
+    bin_indices [int array]:    bin index for each energy of spectrum
+    weights:                    weights for bin energy (centroid), default is
+                                spectrum['photons']
+
+    Returns
+    =======
+
+    spectrum [dict]:            rebinned spectrum, empty bins are dropped
+
+    Notes
+    =====
+
+    photons_bin = sum(photons_i)
+    energy_bin = sum(weights_i * energies_i) / sum(weights_i)
+
+    """
+    energies = np.asarray(spectrum['energies'], dtype=float)
+    photons = np.asarray(spectrum['photons'], dtype=float)
+    if weights is None:
+        weights = photons
+    # Renumber bins, so that empty bins are dropped
+    bin_indices = np.unique(bin_indices, return_inverse=True)[1]
+
+    rebinned = dict()
+    rebinned['photons'] = np.bincount(bin_indices, weights=photons)
+    weight_sums = np.bincount(bin_indices, weights=weights)
+    energy_sums = np.bincount(bin_indices, weights=weights*energies)
+    # Fall back to arithmetic mean for bins without weight
+    mean_energies = (np.bincount(bin_indices, weights=energies) /
+                     np.bincount(bin_indices))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rebinned['energies'] = np.where(weight_sums > 0,
+                                        energy_sums / weight_sums,
+                                        mean_energies)
+    return rebinned
+
+
+def adaptive_bins(weights, number_bins):
+    """
+    Calculate bin indices, so that every bin holds (close to) the same
+    effective weight. Bins are thus narrow where the weight is large.
+
+    Parameters
+    ==========
+
+    weights:                effective weight per energy
+    number_bins [int]
+
+    Returns
+    =======
+
+    bin_indices [int array]
+
+    Notes
+    =====
+
+    Energies of the input spectrum are not split. Energy i goes into bin
+    floor(c_i * number_bins), with c_i the normalized cumulative weight at
+    the center of energy i. If single energies hold a lot of weight, fewer
+    than number_bins bins are occupied.
+
+    """
+    weights = np.asarray(weights, dtype=float)
+    cumulative = np.cumsum(weights) - weights / 2.0
+    cumulative = cumulative / np.sum(weights)
+    bin_indices = np.floor(cumulative * number_bins).astype(int)
+    return np.clip(bin_indices, 0, number_bins - 1)
+
+
+def optimal_rebin(spectrum, efficiency=None, tolerance=1e-3,
+                  metric=mean_inverse_square_energy, max_bins=None):
+    """
+    Find the smallest number of adaptive bins, for which the relative error
+    of a polychromatic metric stays within the tolerance.
+
+    Parameters
+    ==========
+
+    spectrum [dict]
+    efficiency:             detector efficiency for each energy, default is
+                            None (1)
+    tolerance:              maximum relative error of metric, default=1e-3
+    metric:                 function(energies, weights), default is
+                            mean_inverse_square_energy
+    max_bins [int]:         default is number of energies in spectrum
+
+    Returns
+    =======
+
+    spectrum [dict]:        rebinned spectrum
+
+    Notes
+    =====
+
+    The metric of the rebinned spectrum is evaluated with the summed
+    effective weights per bin at the bin energies, and compared to the metric
+    of the full spectrum.
+
+    """
+    energies = np.asarray(spectrum['energies'], dtype=float)
+    photons = np.asarray(spectrum['photons'], dtype=float)
+    if efficiency is None:
+        efficiency = 1.0
+    weights = photons * efficiency
+    if max_bins is None or max_bins > energies.size:
+        max_bins = energies.size
+
+    reference = metric(energies, weights)
+    logger.debug("Reference metric is {0}.".format(reference))
+    for number_bins in range(1, max_bins+1):
+        bin_indices = adaptive_bins(weights, number_bins)
+        rebinned = rebin(spectrum, bin_indices, weights)
+        rebinned_weights = np.bincount(np.unique(bin_indices,
+                                                 return_inverse=True)[1],
+                                       weights=weights)
+        error = np.abs(metric(rebinned['energies'], rebinned_weights) -
+                       reference) / np.abs(reference)
+        if error <= tolerance:
+            break
+    else:
+        logger.warning("Tolerance ({0}) not met with {1} bins."
+                       .format(tolerance, max_bins))
+    logger.info("Rebinned spectrum from {0} to {1} energies (relative metric "
+                "error: {2:.2e})."
+                .format(energies.size, rebinned['energies'].size, error))
+    return rebinned
+
+
+def sample_energies(spectrum, number_samples, efficiency=None, seed=None,
+                    worker=0, number_workers=1):
+    """
+    Draw energies from the normalized effective spectrum (importance
+    sampling) and weight them, so that the weighted sum over the sampled
+    energies is an unbiased estimate of the sum over the full spectrum.
+
+    Parameters
+    ==========
+
+    spectrum [dict]
+    number_samples [int]:   total number of draws (K) over all workers
+    efficiency:             efficiency for each energy, default is None (1)
+    seed [int]:             seed of random draws, default is None
+    worker [int]:           index of this worker, default is 0
+    number_workers [int]:   default is 1
+
+    Returns
+    =======
+
+    spectrum [dict] [keV]:  spectrum['energies']:   unique sampled energies
+                            spectrum['photons']:    estimator weights
+                            spectrum['counts']:     draws per energy
+
+    Notes
+    =====
+
+    With p_i = weight_i / sum(weight), each draw of energy i is weighted by
+        photons_i / (K * p_i)
+    Thus, the sampled spectrum replaces the full spectrum in the simulation,
+    runtime scales with the number of unique sampled energies (<= K).
+
+    All K draws are generated from the seed, worker w keeps draws
+    w, w+number_workers, w+2*number_workers, ... The union of all workers
+    is thus identical to a single run with the same seed.
+
+    """
+    if number_workers > 1 and seed is None:
+        error_message = "Seed must be set if draws are split over workers."
+        logger.error(error_message)
+        raise ValueError(error_message)
+    if not 0 <= worker < number_workers:
+        error_message = ("Worker index ({0}) must be in [0, {1})."
+                         .format(worker, number_workers))
+        logger.error(error_message)
+        raise ValueError(error_message)
+
+    energies = np.asarray(spectrum['energies'], dtype=float)
+    photons = np.asarray(spectrum['photons'], dtype=float)
+    if efficiency is None:
+        efficiency = 1.0
+    weights = photons * efficiency
+    probabilities = weights / np.sum(weights)
+
+    random_state = np.random.RandomState(seed)
+    draws = random_state.choice(energies.size, size=number_samples,
+                                p=probabilities)
+    draws = draws[worker::number_workers]
+    [indices, counts] = np.unique(draws, return_counts=True)
+
+    sampled = dict()
+    sampled['energies'] = energies[indices]
+    sampled['photons'] = (counts * photons[indices] /
+                          (number_samples * probabilities[indices]))
+    sampled['counts'] = counts
+    logger.info("Sampled {0} unique energies from {1} draws (worker {2} of "
+                "{3})."
+                .format(indices.size, draws.size, worker+1, number_workers))
+    return sampled
+
+
+def monte_carlo_estimate(contributions, counts, number_samples):
+    """
+    Calculate the polychromatic estimate and its variance from the weighted
+    contributions of the sampled energies.
+
+    Parameters
+    ==========
+
+    contributions:          results per sampled energy, weighted by
+                            spectrum['photons'] of sampled spectrum
+                            [..., energies]
+    counts [int array]:     spectrum['counts'] of sampled spectrum
+    number_samples [int]:   total number of draws (K)
+
+    Returns
+    =======
+
+    [estimate, variance]
+
+    Notes
+    =====
+
+    To combine workers, concatenate their contributions and counts along the
+    energy axis.
+
+    Per draw contribution: y_i = contributions_i * K / counts_i
+    estimate = sum(contributions_i)
+    variance = sum(counts_i * (y_i - estimate)^2) / (K * (K-1))
+
+    """
+    contributions = np.asarray(contributions, dtype=float)
+    counts = np.asarray(counts)
+    estimate = np.sum(contributions, axis=-1)
+    per_draw = contributions * number_samples / counts
+    deviations = per_draw - estimate[..., np.newaxis]
+    variance = (np.sum(counts * np.square(deviations), axis=-1) /
+                (number_samples * max(number_samples - 1, 1)))
+    return [estimate, variance]
@@ -0,0 +1,298 @@
+"""
+Module to time the calculation stages (input checks, material look up,
+geometry, propagation, detection, saving) and report wall time, call counts
+and peak memory per stage.
+
+Functions
+=========
+
+enable:         Enable or disable timing.
+                Parameters:
+                    enabled [bool] (default True)
+
+is_enabled:     Check if timing is enabled.
+
+stage:          Context manager, times the enclosed block as stage.
+                Parameters:
+                    name [str]
+
+timed:          Decorator, times every call of the function as stage.
+                Parameters:
+                    name [str]
+
+reset:          Remove all recorded stages.
+
+report:         Recorded stages as dict.
+
+format_report:  Recorded stages as table.
+
+write_report:   Write recorded stages to JSON file.
+                Parameters:
+                    file_path [str]
+
+Usage
+=====
+
+with timing.stage('geometry'):
+    gi_geometry = geometry.Geometry(parameters)
+
+@timing.timed('detection')
+def detect(self, image):
+    ...
+
+From gisimulation folder:
+
+python main.py ... --profile                (print table at the end)
+python main.py ... --profile report.json    (and write JSON)
+
+Notes
+=====
+
+Timing is disabled by default. Disabled, stage() returns a shared no-op
+context manager and timed functions only check a flag before calling the
+function, thus the overhead is negligible.
+
+Nested stages are recorded separately, the time of the inner stage is
+included in the outer one.
+
+Peak memory is the peak resident set size of the process (see
+resource.getrusage) at the end of the stage and its increase during the
+stage. It is None, where the resource module is not available (Windows).
+
+@author: buechner_m <maria.buechner@gmail.com>
+"""
+import sys
+import json
+import threading
+import timeit
+from functools import wraps
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+import logging
+logger = logging.getLogger(__name__)
+
+# Recorded stages: _STAGES[name] = dict(calls, total_s, max_s, peak_rss_mb,
+#                                       peak_increase_mb)
+_STAGES = dict()
+_LOCK = threading.Lock()
+_ENABLED = False
+
+# %% Classes
+
+
+class _Stage(object):
+    """
+    Context manager recording one call of a stage.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._rss = _peak_rss()
+        self._start = timeit.default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = timeit.default_timer() - self._start
+        rss = _peak_rss()
+        _record(self.name, duration, rss, self._rss)
+        return False
+
+
+class _NoStage(object):
+    """
+    No-op context manager, used when timing is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+# %% Functions
+
+
+def enable(enabled=True):
+    """
+    Enable or disable timing. Recorded stages are kept.
+
+    Parameters
+    ==========
+
+    enabled [bool]:     default is True
+
+    """
+    global _ENABLED
+    _ENABLED = bool(enabled)
+
+
+def is_enabled():
+    """
+    Check if timing is enabled.
+
+    Returns
+    =======
+
+    enabled [bool]
+
+    """
+    return _ENABLED
+
+
+def stage(name):
+    """
+    Context manager, times the enclosed block as stage name.
+
+    Parameters
+    ==========
+
+    name [str]:         e.g. 'geometry'
+
+    Returns
+    =======
+
+    context manager
+
+    """
+    if not _ENABLED:
+        return _NO_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """
+    Decorator, times every call of the decorated function as stage name.
+
+    Parameters
+    ==========
+
+    name [str]:         e.g. 'material look up'
+
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    """
+    Remove all recorded stages.
+    """
+    with _LOCK:
+        _STAGES.clear()
+
+
+def report():
+    """
+    Recorded stages.
+
+    Returns
+    =======
+
+    stages [dict]:      stages[name] = dict(calls, total_s, mean_s, max_s,
+                        peak_rss_mb, peak_increase_mb)
+
+    """
+    with _LOCK:
+        stages = {name: dict(values) for name, values in _STAGES.items()}
+    for values in stages.values():
+        values['mean_s'] = values['total_s'] / values['calls']
+    return stages
+
+
+def format_report():
+    """
+    Recorded stages as table, slowest stage first.
+
+    Returns
+    =======
+
+    table [str]
+
+    """
+    stages = report()
+    seperator = 86*'-'
+    lines = [seperator,
+             '{0:<30}{1:>8}{2:>12}{3:>12}{4:>12}{5:>12}'
+             .format('Stage', 'Calls', 'Total [s]', 'Mean [s]',
+                     'Peak [MB]', '+Peak [MB]'),
+             seperator]
+    for name in sorted(stages, key=lambda name: stages[name]['total_s'],
+                       reverse=True):
+        values = stages[name]
+        lines.append('{0:<30}{1:>8}{2:>12.4f}{3:>12.4f}{4:>12}{5:>12}'
+                     .format(name, values['calls'], values['total_s'],
+                             values['mean_s'],
+                             _format_memory(values['peak_rss_mb']),
+                             _format_memory(values['peak_increase_mb'])))
+    if not stages:
+        lines.append('No stages recorded.')
+    lines.append(seperator)
+    return '\n'.join(lines)
+
+
+def write_report(file_path):
+    """
+    Write recorded stages to JSON file.
+
+    Parameters
+    ==========
+
+    file_path [str]
+
+    """
+    logger.info("Writing timing report to {0}...".format(file_path))
+    with open(file_path, 'w') as f:
+        json.dump(dict(stages=report()), f, indent=1, sort_keys=True)
+    logger.info("... done.")
+
+# %% Private utilities
+
+
+def _record(name, duration, rss, start_rss):
+    """
+    Add call of stage.
+    """
+    with _LOCK:
+        values = _STAGES.setdefault(name, dict(calls=0, total_s=0.0,
+                                               max_s=0.0, peak_rss_mb=None,
+                                               peak_increase_mb=None))
+        values['calls'] += 1
+        values['total_s'] += duration
+        values['max_s'] = max(values['max_s'], duration)
+        if rss is not None:
+            values['peak_rss_mb'] = rss
+            values['peak_increase_mb'] = max(values['peak_increase_mb'] or 0,
+                                             rss - start_rss)
+
+
+def _peak_rss():
+    """
+    Peak resident set size of the process [MB], None if not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024.0**2  # [bytes]
+    return peak / 1024.0  # [kB]
+
+
+def _format_memory(value):
+    """
+    Memory [MB] as str, '-' if not available.
+    """
+    if value is None:
+        return '-'
+    return '{0:.1f}'.format(value)
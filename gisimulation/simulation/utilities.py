@@ -10,6 +10,10 @@ Classes
                     Returns:
                         struct
 
+    Logger:         Logger with lazy brace formatting and array summaries.
+                    Parameters:
+                        logger [logging.Logger]
+
 Functions
 =========
 
@@ -19,9 +23,139 @@ set_logger_level:   set level of logger.
                         verbose [int]
                         default_level (logging.INFO)
 
+is_equal:           compare values, including numpy arrays and dicts.
+                    Parameters:
+                        a
+                        b
+
+changed_keys:       keys with different values in two dicts.
+                    Parameters:
+                        a [dict]
+                        b [dict]
+
+get_logger:         logger with lazy brace formatting (see Logger).
+                    Parameters:
+                        name [str]
+
+summarize:          short text of value, large arrays are summarized.
+                    Parameters:
+                        value
+
+get_dtypes:         real and complex dtypes of precision.
+                    Parameters:
+                        precision [str] (default None)
+
+configure_precision:    set the default precision.
+                        Parameters:
+                            precision [str] (default 'double')
+
+get_precision:      precision, the default if None.
+                    Parameters:
+                        precision [str] (default None)
+
+Usage
+=====
+
+logger = utilities.get_logger(__name__)
+logger.debug("Spectrum is:\n{0}", spectrum)  # Only formatted if emitted
+
 @author: buechner_m <maria.buechner@gmail.com>
 """
+import os
+import sys
 import logging
+import numpy as np
+
+# Arrays with more elements are summarized in log messages
+SUMMARY_SIZE = 10
+# Real and complex dtypes of numerical precisions (see parser '-prec')
+PRECISIONS = {'single': [np.float32, np.complex64],
+              'double': [np.float64, np.complex128]}
+# Default of all precision arguments, see configure_precision()
+_PRECISION = 'double'
+
+# %% Classes
+
+
+class Logger(object):
+    """
+    Wraps logging.Logger, messages are brace formatted (str.format) with the
+    positional arguments, only if the level is enabled. Arrays with more than
+    SUMMARY_SIZE elements are summarized (see summarize()).
+
+    Parameters
+    ==========
+
+    logger [logging.Logger]
+
+    Notes
+    =====
+
+    Messages without arguments are logged as they are (e.g. error messages
+    containing braces). Keyword arguments (exc_info, extra) are passed on to
+    the logger. All other attributes (e.g. level) are read from and set on the
+    wrapped logger.
+
+    Records report the calling module, line and function (not this module),
+    see _find_caller().
+
+    """
+    def __init__(self, logger):
+        self._logger = logger
+
+    def __getattr__(self, name):
+        return getattr(self._logger, name)
+
+    def __setattr__(self, name, value):
+        if name == '_logger':
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._logger, name, value)  # e.g. logger.level
+
+    def log(self, level, message, *args, **kwargs):
+        if self._logger.isEnabledFor(level):
+            if args:
+                message = _BraceMessage(message, args)
+            exc_info = kwargs.get('exc_info')
+            if exc_info and not isinstance(exc_info, tuple):
+                exc_info = sys.exc_info()
+            filename, line_number, function = _find_caller()
+            record = self._logger.makeRecord(self._logger.name, level,
+                                             filename, line_number, message,
+                                             (), exc_info, function,
+                                             kwargs.get('extra'))
+            self._logger.handle(record)
+
+    def debug(self, message, *args, **kwargs):
+        self.log(logging.DEBUG, message, *args, **kwargs)
+
+    def info(self, message, *args, **kwargs):
+        self.log(logging.INFO, message, *args, **kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self.log(logging.WARNING, message, *args, **kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.log(logging.ERROR, message, *args, **kwargs)
+
+    def exception(self, message, *args, **kwargs):
+        kwargs.setdefault('exc_info', True)
+        self.log(logging.ERROR, message, *args, **kwargs)
+
+    def critical(self, message, *args, **kwargs):
+        self.log(logging.CRITICAL, message, *args, **kwargs)
+
+
+class _BraceMessage(object):
+    """
+    Message formatted on str(), i.e. when a handler emits the record.
+    """
+    def __init__(self, message, args):
+        self.message = message
+        self.args = args
+
+    def __str__(self):
+        return self.message.format(*[summarize(arg) for arg in self.args])
 
 
 # %% Functions
@@ -56,3 +190,172 @@ def get_logger_level(verbose, default_level=logging.INFO):
         4: logging.DEBUG
     }.get(verbose, default_level)  # Default: logging.INFO
     return logging_level
+
+
+def is_equal(a, b):
+    """
+    Compare values, including numpy arrays and (nested) dicts.
+
+    Parameters
+    ==========
+
+    a
+    b
+
+    Returns
+    =======
+
+    equal [bool]
+
+    """
+    if isinstance(a, dict) or isinstance(b, dict):
+        return (isinstance(a, dict) and isinstance(b, dict) and
+                not changed_keys(a, b))
+    try:
+        return bool(np.array_equal(a, b))
+    except (ValueError, TypeError):
+        return a == b
+
+
+def changed_keys(a, b):
+    """
+    Keys with different values (or missing) in two dicts.
+
+    Parameters
+    ==========
+
+    a [dict]
+    b [dict]
+
+    Returns
+    =======
+
+    keys [list]
+
+    """
+    return [key for key in set(a) | set(b)
+            if key not in a or key not in b or not is_equal(a[key], b[key])]
+
+
+def get_logger(name):
+    """
+    Logger with lazy brace formatting (see Logger).
+
+    Parameters
+    ==========
+
+    name [str]:     usually __name__
+
+    Returns
+    =======
+
+    logger [Logger]
+
+    """
+    return Logger(logging.getLogger(name))
+
+
+def summarize(value):
+    """
+    Short text of value: arrays with more than SUMMARY_SIZE elements are
+    summarized by shape, dtype and range, all other values are returned
+    unchanged.
+
+    Parameters
+    ==========
+
+    value
+
+    Returns
+    =======
+
+    value:          str for large arrays
+
+    """
+    if not isinstance(value, np.ndarray) or value.size <= SUMMARY_SIZE:
+        return value
+    if value.dtype.kind in 'iuf':
+        return ('array(shape={0}, dtype={1}, min={2:g}, max={3:g})'
+                .format(value.shape, value.dtype, np.nanmin(value),
+                        np.nanmax(value)))
+    return 'array(shape={0}, dtype={1})'.format(value.shape, value.dtype)
+
+
+def get_dtypes(precision=None):
+    """
+    Real and complex dtypes of precision.
+
+    Parameters
+    ==========
+
+    precision [str]:    'single' or 'double', default is None (configured
+                        precision, see configure_precision())
+
+    Returns
+    =======
+
+    [real_type, complex_type]
+
+    """
+    precision = get_precision(precision)
+    if precision not in PRECISIONS:
+        raise ValueError("Precision must be one of {0}, not '{1}'."
+                         .format(sorted(PRECISIONS), precision))
+    return PRECISIONS[precision]
+
+
+def configure_precision(precision='double'):
+    """
+    Set the default precision of propagation, detection and retrieval (e.g.
+    from input '-prec'), used where precision is None.
+
+    Parameters
+    ==========
+
+    precision [str]:    'single' or 'double', default is 'double'
+
+    """
+    global _PRECISION
+    get_dtypes(precision)  # Check
+    _PRECISION = precision
+
+
+def get_precision(precision=None):
+    """
+    Precision, the configured default if None (see configure_precision()).
+
+    Parameters
+    ==========
+
+    precision [str]:    default is None
+
+    Returns
+    =======
+
+    precision [str]
+
+    """
+    if precision is None:
+        return _PRECISION
+    return precision
+
+# %% Private utilities
+
+
+def _find_caller():
+    """
+    File name, line number and function name of the first frame outside of
+    this module (i.e. the caller of Logger), like logging.Logger.findCaller
+    (stacklevel is only available in python 3.8+).
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if os.path.normcase(code.co_filename) != _SOURCE_FILE:
+            return code.co_filename, frame.f_lineno, code.co_name
+        frame = frame.f_back
+    return '(unknown file)', 0, '(unknown function)'
+
+
+# Source file of this module, as in frames (not the .pyc)
+_SOURCE_FILE = os.path.normcase(_find_caller.__code__.co_filename)